@@ -137,10 +137,10 @@ class MedvittaAPI:
             self.metadata.add_processing_step("PDF upload completo")
             
             # 2. Extração de metadados
-            await self.metadata_extractor._extract_metadata(content)
+            result = await self.metadata_extractor.extract_metadata(content)
             self.metadata.update(
-                municipio=self.metadata_extractor.metadata["municipio"],
-                numero_itens=self.metadata_extractor.metadata["number_itens"]
+                municipio=result.municipio,
+                numero_itens=result.number_itens
             )
             self.metadata.add_processing_step("Extração de metadados concluída")
             
@@ -0,0 +1,25 @@
+from abc import ABC, abstractmethod
+from typing import List
+
+
+class IEmbeddingProvider(ABC):
+    """
+    Interface para provedores de embeddings.
+    Recebe uma lista de textos e produz um vetor para cada um.
+    """
+    
+    # Nome do modelo, gravado junto com os vetores gerados
+    model: str = ""
+    
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera embeddings para uma lista de textos.
+        
+        Args:
+            texts: Textos a serem convertidos
+            
+        Returns:
+            Lista de vetores, na mesma ordem de texts
+        """
+        pass
@@ -4,17 +4,28 @@ from fastapi.middleware.cors import CORSMiddleware
 import os
 import uuid
 from typing import Optional, Dict, Any, List
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import pandas as pd
 import json
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from utils.json_utils import convert_numpy_types
+from utils.text_utils import normalize_whitespace
 # Importar os serviços
 from services.PDFUploader import PDFUploader
 from services.Metadata_extractor import MetadataExtractor
-from services.extractor_services import  process_edital
+from services.extractor_services import  classify_layout, count_extracted_rows, process_edital
 from services.rag_service import RAGService
 from services.completion_service import EmbeddingManager, ProductSearchEngine
-from openai import AsyncAzureOpenAI, AzureOpenAI
+from services.embedding_cache import EmbeddingCache
+from services.catalog_store import is_catalog_dir
+from services.catalog_index import CatalogIndexConfig
+from services.dimension_reduction import DimensionReducer
+from services.artifact_cache import ArtifactCache, document_id, hash_bytes
+from services.corpus_index import CorpusIndex
+from openai import AsyncAzureOpenAI
 from mistralai import Mistral
 from pathlib import Path
 from dotenv import load_dotenv
@@ -34,9 +45,79 @@ DATA_DIR = os.environ.get("DATA_DIR", "data")
 EMBEDDINGS_DIR = os.environ.get("EMBEDDINGS_DIR", "embeddings")
 RESULTS_DIR = os.environ.get("RESULTS_DIR", "results")
 
-# Configurações de produto
+# Configurações de produto (EMBEDDINGS_PATH pode ser o pickle legado ou um diretório do CatalogStore)
 EMBEDDINGS_PATH = os.environ.get("EMBEDDINGS_PATH")
 PRODUCT_NAMES_PATH = os.environ.get("PRODUCT_NAMES_PATH")
+PRODUCT_INDEX_PATH = os.environ.get("PRODUCT_INDEX_PATH")  # Padrão: ao lado de EMBEDDINGS_PATH
+
+# Tipo do índice do catálogo (flat, ivf_flat, ivf_pq, hnsw) e parâmetros de busca
+CATALOG_INDEX_TYPE = os.environ.get("CATALOG_INDEX_TYPE", "flat")
+CATALOG_INDEX_NLIST = os.environ.get("CATALOG_INDEX_NLIST")
+CATALOG_INDEX_NPROBE = int(os.environ.get("CATALOG_INDEX_NPROBE", "16"))
+CATALOG_INDEX_EF_SEARCH = int(os.environ.get("CATALOG_INDEX_EF_SEARCH", "64"))
+
+# Redução de dimensão dos vetores do catálogo (pca ou truncate), aplicada também às
+# consultas; vazio mantém a largura total
+CATALOG_EMBEDDING_DIMENSIONS = os.environ.get("CATALOG_EMBEDDING_DIMENSIONS")
+CATALOG_DIMENSION_REDUCTION = os.environ.get("CATALOG_DIMENSION_REDUCTION", "pca")
+
+# Cache persistente de embeddings das descrições dos editais
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join(EMBEDDINGS_DIR, "embedding_cache.sqlite"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Cache global de embeddings de chunks, compartilhado entre editais (~12 KB por vetor de 3072 dimensões)
+CHUNK_CACHE_PATH = os.environ.get("CHUNK_CACHE_PATH", os.path.join(EMBEDDINGS_DIR, "chunk_cache.sqlite"))
+CHUNK_CACHE_MAX_ENTRIES = int(os.environ.get("CHUNK_CACHE_MAX_ENTRIES", "100000"))
+
+# Índices RAG por documento (persistidos em disco e mantidos num LRU em memória)
+RAG_STORAGE_DIR = os.environ.get("RAG_STORAGE_DIR", os.path.join(EMBEDDINGS_DIR, "documentos"))
+RAG_CACHE_MAX_BYTES = int(os.environ.get("RAG_CACHE_MAX_BYTES", str(1024 ** 3)))
+# Modelo e dimensão dos embeddings dos índices por documento (dimensão nativa dos
+# modelos text-embedding-3; vazio mantém a largura total)
+RAG_EMBEDDING_MODEL = os.environ.get("RAG_EMBEDDING_MODEL", "text-embedding-3-large")
+RAG_EMBEDDING_DIMENSIONS = os.environ.get("RAG_EMBEDDING_DIMENSIONS")
+# Formato dos vetores nos índices por documento: float32 (exato), float16 ou int8
+RAG_VECTOR_STORAGE = os.environ.get("RAG_VECTOR_STORAGE", "float32")
+
+# Chunks com Jaccard estimado acima do limiar são indexados uma única vez (vazio desativa)
+RAG_NEAR_DUPLICATE_THRESHOLD = os.environ.get("RAG_NEAR_DUPLICATE_THRESHOLD", "0.85")
+
+# Caches do chat: vetores de perguntas e respostas finais (entradas e validade em segundos)
+RAG_QUERY_CACHE_SIZE = int(os.environ.get("RAG_QUERY_CACHE_SIZE", "4096"))
+RAG_QUERY_CACHE_TTL = float(os.environ.get("RAG_QUERY_CACHE_TTL", str(24 * 3600)))
+RAG_ANSWER_CACHE_SIZE = int(os.environ.get("RAG_ANSWER_CACHE_SIZE", "2048"))
+RAG_ANSWER_CACHE_TTL = float(os.environ.get("RAG_ANSWER_CACHE_TTL", "3600"))
+
+# Recuperação híbrida (BM25 + vetores com RRF) e corte adaptativo de chunks no chat
+RAG_HYBRID_RETRIEVAL = os.environ.get("RAG_HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+RAG_FUSION_CANDIDATES = int(os.environ.get("RAG_FUSION_CANDIDATES", "20"))
+RAG_MIN_SCORE_RATIO = float(os.environ.get("RAG_MIN_SCORE_RATIO", "0.5"))
+
+# Pontuação mínima do layout para usar um extrator específico sem município reconhecido
+LAYOUT_MIN_CONFIDENCE = float(os.environ.get("LAYOUT_MIN_CONFIDENCE", "0.5"))
+
+# Orçamento aproximado de tokens do contexto enviado ao LLM
+RAG_CONTEXT_MAX_TOKENS = int(os.environ.get("RAG_CONTEXT_MAX_TOKENS", "1500"))
+
+# Uso de tokens no fim do streaming (stream_options; api_versions anteriores às previews de 2024 não aceitam)
+RAG_STREAM_USAGE = os.environ.get("RAG_STREAM_USAGE", "true").lower() in ("1", "true", "yes")
+
+# Lotes de embeddings dos chunks (itens e tokens estimados por requisição, lotes simultâneos)
+RAG_BATCH_MAX_ITEMS = int(os.environ.get("RAG_BATCH_MAX_ITEMS", "256"))
+RAG_BATCH_MAX_TOKENS = int(os.environ.get("RAG_BATCH_MAX_TOKENS", "64000"))
+RAG_MAX_CONCURRENT_BATCHES = int(os.environ.get("RAG_MAX_CONCURRENT_BATCHES", "4"))
+
+# Artefatos de cada etapa do processamento, endereçados pelo hash do documento
+ARTIFACTS_DIR = os.environ.get("ARTIFACTS_DIR", os.path.join(DATA_DIR, "artifacts"))
+
+# Índice global de chunks de todos os editais (flat até o limite, depois IVF)
+CORPUS_DIR = os.environ.get("CORPUS_DIR", os.path.join(EMBEDDINGS_DIR, "corpus"))
+CORPUS_IVF_THRESHOLD = int(os.environ.get("CORPUS_IVF_THRESHOLD", "200000"))
+CORPUS_INDEX_TYPE = os.environ.get("CORPUS_INDEX_TYPE", "ivf_flat")
+CORPUS_NPROBE = int(os.environ.get("CORPUS_NPROBE", "16"))
+
+# Threads para trabalho bloqueante (extração de tabelas, busca de produtos) fora do event loop
+BLOCKING_EXECUTOR_WORKERS = int(os.environ.get("BLOCKING_EXECUTOR_WORKERS", "4"))
 
 # Criar diretórios se não existirem
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -65,28 +146,69 @@ class ProcessingState:
         try:
             # Inicialização dos serviços principais
             self.pdf_uploader = PDFUploader()
+            self.artifact_cache = ArtifactCache(ARTIFACTS_DIR)
             
-            # Inicializar MetadataExtractor com argumentos vazios - corrigido
-            self.metadata_extractor = MetadataExtractor()
+            # Trabalho síncrono das rotas roda neste pool limitado
+            self.executor = ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_WORKERS, thread_name_prefix="blocking")
             
-            # Inicializar clientes para OpenAI
+            # Inicializar clientes para OpenAI (ambos assíncronos para não bloquear o event loop)
             self._embedding_client = AsyncAzureOpenAI(
                 api_key=AZURE_API_KEY,
                 api_version=AZURE_API_VERSION,
                 azure_endpoint=AZURE_ENDPOINT
             )
             
-            self._client = AzureOpenAI(
+            self._client = AsyncAzureOpenAI(
                 api_key=AZURE_API_KEY,
                 api_version=AZURE_API_VERSION,
                 azure_endpoint=AZURE_ENDPOINT
             )
             
+            # Chunks são comparados com normalização leve (caixa e acentos importam para o embedding)
+            self.chunk_cache = EmbeddingCache(
+                path=CHUNK_CACHE_PATH,
+                max_entries=CHUNK_CACHE_MAX_ENTRIES,
+                canonicalize=normalize_whitespace
+            )
+            
             # Inicializar RAGService com os clientes
             self.rag_service = RAGService(
                 embedding_client=self._embedding_client,
                 client=self._client,
-                llm_model=LLM_MODEL
+                llm_model=LLM_MODEL,
+                storage_dir=RAG_STORAGE_DIR,
+                max_cache_bytes=RAG_CACHE_MAX_BYTES,
+                batch_max_items=RAG_BATCH_MAX_ITEMS,
+                batch_max_tokens=RAG_BATCH_MAX_TOKENS,
+                max_concurrent_batches=RAG_MAX_CONCURRENT_BATCHES,
+                chunk_cache=self.chunk_cache,
+                near_duplicate_threshold=float(RAG_NEAR_DUPLICATE_THRESHOLD) if RAG_NEAR_DUPLICATE_THRESHOLD else None,
+                query_cache_size=RAG_QUERY_CACHE_SIZE,
+                query_cache_ttl=RAG_QUERY_CACHE_TTL,
+                answer_cache_size=RAG_ANSWER_CACHE_SIZE,
+                answer_cache_ttl=RAG_ANSWER_CACHE_TTL,
+                hybrid_retrieval=RAG_HYBRID_RETRIEVAL,
+                fusion_candidates=RAG_FUSION_CANDIDATES,
+                min_score_ratio=RAG_MIN_SCORE_RATIO,
+                context_max_tokens=RAG_CONTEXT_MAX_TOKENS,
+                stream_usage=RAG_STREAM_USAGE,
+                vector_storage=RAG_VECTOR_STORAGE,
+                embedding_model=RAG_EMBEDDING_MODEL,
+                embedding_dimensions=int(RAG_EMBEDDING_DIMENSIONS) if RAG_EMBEDDING_DIMENSIONS else None
+            )
+            
+            # MetadataExtractor compartilha o cliente de chat e responde os campos do edital pelo índice RAG
+            self.metadata_extractor = MetadataExtractor(
+                client=self._client,
+                rag_service=self.rag_service,
+                artifact_cache=self.artifact_cache
+            )
+            
+            self.corpus_index = CorpusIndex(
+                CORPUS_DIR,
+                ivf_threshold=CORPUS_IVF_THRESHOLD,
+                ivf_config=CatalogIndexConfig(index_type=CORPUS_INDEX_TYPE, nprobe=CORPUS_NPROBE),
+                embedding_key=self.rag_service.embedding_key
             )
             
             # Flag para rastrear o status de inicialização
@@ -95,14 +217,29 @@ class ProcessingState:
             # Inicializar o gerenciador de embeddings e motor de busca para produtos
             self.product_search_available = False
             try:
-                if os.path.exists(EMBEDDINGS_PATH) and os.path.exists(PRODUCT_NAMES_PATH):
+                if os.path.exists(EMBEDDINGS_PATH) and (is_catalog_dir(EMBEDDINGS_PATH) or os.path.exists(PRODUCT_NAMES_PATH)):
+                    self.embedding_cache = EmbeddingCache(
+                        path=EMBEDDING_CACHE_PATH,
+                        max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+                    )
                     self.embedding_manager = EmbeddingManager(
                         api_key=AZURE_API_KEY,
                         api_version=AZURE_API_VERSION,
                         azure_endpoint=AZURE_ENDPOINT,
                         model=EMBEDDING_MODEL,
                         embeddings_path=EMBEDDINGS_PATH,
-                        product_names_path=PRODUCT_NAMES_PATH
+                        product_names_path=PRODUCT_NAMES_PATH,
+                        index_path=PRODUCT_INDEX_PATH,
+                        cache=self.embedding_cache,
+                        index_config=CatalogIndexConfig(
+                            index_type=CATALOG_INDEX_TYPE,
+                            nlist=int(CATALOG_INDEX_NLIST) if CATALOG_INDEX_NLIST else None,
+                            nprobe=CATALOG_INDEX_NPROBE,
+                            ef_search=CATALOG_INDEX_EF_SEARCH
+                        ),
+                        reducer=DimensionReducer(
+                            int(CATALOG_EMBEDDING_DIMENSIONS), CATALOG_DIMENSION_REDUCTION
+                        ) if CATALOG_EMBEDDING_DIMENSIONS else None
                     )
                     self.search_engine = ProductSearchEngine(self.embedding_manager)
                     self.product_search_available = True
@@ -133,6 +270,22 @@ class ProcessingState:
             }
         return processing_cache[session_id]
 
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        Executa uma função síncrona no pool limitado, sem travar o event loop
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def catalog_version(self) -> Optional[str]:
+        """
+        Versão do catálogo de produtos usada no enriquecimento; resultados
+        em cache de um catálogo anterior não são reaproveitados
+        """
+        if not self.product_search_available:
+            return None
+        return str(os.path.getmtime(EMBEDDINGS_PATH))
+
 # Variável global para o singleton do estado
 _state_instance = None
 
@@ -149,6 +302,41 @@ def get_state():
             raise HTTPException(status_code=500, detail=f"Erro ao inicializar serviços: {str(e)}")
     return _state_instance
 
+def _artifact_files_exist(*paths: Optional[str]) -> bool:
+    """
+    Verifica se os arquivos referenciados por um artefato ainda existem
+    """
+    return all(path is None or os.path.exists(path) for path in paths)
+
+
+def _cached_response_valid(cached: Dict[str, Any], state: ProcessingState) -> bool:
+    """
+    Uma resposta em cache só vale se os arquivos ainda existem, o índice RAG
+    do documento está disponível (com o modelo de embeddings atual) e o
+    catálogo de produtos não mudou
+    """
+    return (cached.get("catalog_version") == state.catalog_version()
+            and state.rag_service.is_indexed(cached["content_id"])
+            and _artifact_files_exist(cached["output_path"], cached["enhanced_file_path"], cached["candidates_file_path"]))
+
+
+async def _ensure_in_corpus(state: ProcessingState, content_id: str, municipio: Optional[str]) -> None:
+    """
+    Inclui os chunks do documento no índice global do corpus se os vetores
+    dele não estiverem lá (erros são só registrados, não falham o processamento)
+    """
+    try:
+        if not state.corpus_index.has_vectors(content_id):
+            entry = state.rag_service.embeddings_cache[content_id]
+            await state.run_blocking(
+                state.corpus_index.add_document,
+                content_id, entry.texts, entry.embeddings,
+                municipio=municipio
+            )
+    except Exception as e:
+        print(f"Erro ao incluir o documento no índice do corpus: {e}")
+
+
 # Rotas da API
 @app.post("/api/extractor/process")
 async def process_document(
@@ -170,111 +358,208 @@ async def process_document(
         session_id = str(uuid.uuid4())
         session_state = await state.get_or_create_state(session_id)
         
-        # 1. Upload e extração de conteúdo
-        content = await state.pdf_uploader.upload_pdf(file)
+        artifacts = state.artifact_cache
+        
+        # 1. Upload e extração de conteúdo (reaproveitado quando o mesmo PDF já foi enviado)
+        pdf_bytes = await file.read()
+        await file.seek(0)
+        pdf_hash = hash_bytes(pdf_bytes)
+        cached_content = artifacts.get(pdf_hash, "content")
+        if cached_content is not None:
+            content = cached_content["content"]
+        else:
+            content = await state.pdf_uploader.upload_pdf_bytes(pdf_bytes)
+            artifacts.put(pdf_hash, "content", {"content": content})
         session_state["content"] = content
         session_state["completed_steps"].append("pdf_upload")
         
+        # Identidade do documento: hash dos bytes do PDF e do texto extraído
+        content_id = document_id(pdf_hash, content)
+        
+        # Documento já processado com o mesmo formato e catálogo: responde direto do cache
+        response_stage = f"response_{formato}"
+        cached_response = artifacts.get(content_id, response_stage)
+        if cached_response is not None and _cached_response_valid(cached_response, state):
+            session_state.update({
+                "content_id": content_id,
+                "municipio": cached_response["municipio"],
+                "number_itens": cached_response["item_count"],
+                "csv_path": cached_response["output_path"],
+                "enhanced_csv_path": cached_response["enhanced_file_path"],
+                "candidates_csv_path": cached_response["candidates_file_path"],
+                "embeddings_path": state.rag_service.embeddings_cache.document_path(content_id),
+                "completed_steps": list(cached_response["completed_steps"]),
+            })
+            # O documento pode ter perdido os vetores do corpus (worker encerrado antes do save)
+            await _ensure_in_corpus(state, content_id, cached_response["municipio"])
+            response = dict(cached_response, session_id=session_id, from_cache=True)
+            response.pop("catalog_version", None)
+            return convert_numpy_types(response)
+        
         # 2. Extração de metadados e geração de embeddings
-        await state.metadata_extractor._extract_metadata(content)
-        session_state["municipio"] = state.metadata_extractor.metadata["municipio"]
-        session_state["number_itens"] = state.metadata_extractor.metadata["number_itens"]
+        metadata = artifacts.get(content_id, "metadata")
+        if metadata is None:
+            # Resultado próprio desta requisição: uploads concorrentes não compartilham estado
+            result = await state.metadata_extractor.extract_metadata(content)
+            metadata = result.as_metadata()
+            artifacts.put(content_id, "metadata", convert_numpy_types(metadata))
+        session_state["municipio"] = metadata["municipio"]
+        session_state["number_itens"] = metadata["number_itens"]
         session_state["completed_steps"].append("metadata_extraction")
         
-        # Gerar embeddings para RAG
-        content_id = await state.rag_service.process_pdf(content, session_state["municipio"])
+        # Gerar embeddings para RAG (chunks e vetores ficam persistidos por content_id)
+        content_id = await state.rag_service.process_pdf(content, session_state["municipio"], content_id=content_id)
         session_state["content_id"] = content_id
-        session_state["embeddings_path"] = f"{EMBEDDINGS_DIR}/{content_id}.pkl"
+        session_state["embeddings_path"] = state.rag_service.embeddings_cache.document_path(content_id)
         session_state["completed_steps"].append("embeddings_generation")
         
+        # Incluir os chunks no índice global do corpus (não falha o processamento)
+        await _ensure_in_corpus(state, content_id, session_state["municipio"])
+        
         # 3. Processamento da tabela - salvar conteúdo como JSON temporário
         temp_json_path = f"{DATA_DIR}/{content_id}_content.json"
-        with open(temp_json_path, 'w', encoding='utf-8') as f:
-            json.dump({"data": {"content": content}}, f, ensure_ascii=False)
         
         # Definir município para o extrator adequado
         municipio = session_state["municipio"]
         
         # Processar o edital
         csv_path = f"{RESULTS_DIR}/{content_id}_extracted.csv"
+        extraction_stage = f"extraction_{formato}"
+        cached_extraction = artifacts.get(content_id, extraction_stage)
+        session_state["extractor"] = None
+        session_state["layout_scores"] = None
         
-        # Usar process_edital para extração e salvamento da tabela
-        try:
-            # Tentar usar o extrator específico para o município encontrado nos metadados
-            output_file = process_edital(municipio, temp_json_path, "csv", csv_path)
-            session_state["csv_path"] = output_file
-        except ValueError as e:
-            # Se o município não for reconhecido pela factory de extratores
-            print(f"Município '{municipio}' não reconhecido: {e}")
+        if cached_extraction is not None and os.path.exists(cached_extraction["csv_path"]):
+            session_state["csv_path"] = cached_extraction["csv_path"]
+            session_state["extractor"] = cached_extraction.get("extractor")
+            session_state["layout_scores"] = cached_extraction.get("layout_scores")
+        else:
+            with open(temp_json_path, 'w', encoding='utf-8') as f:
+                json.dump({"data": {"content": content}}, f, ensure_ascii=False)
             
-            # Verificar se o parâmetro formato foi passado como um formato válido
-            if formato and formato != "generico":
-                try:
-                    # Tentar usar o formato especificado pelo usuário
-                    output_file = process_edital(formato, temp_json_path, "csv", csv_path)
-                    session_state["csv_path"] = output_file
-                except Exception as formato_error:
-                    print(f"Erro ao usar o formato especificado '{formato}': {formato_error}")
-                    raise HTTPException(status_code=500, detail=f"Não foi possível extrair tabelas usando o formato '{formato}'.")
-            else:
-                # Tentar alguns extratores comuns como fallback
-                tried_extractors = []
-                for fallback_municipio in ["itumbiara", "padre bernardo", "morrinhos", "frutal"]:
-                    tried_extractors.append(fallback_municipio)
+            # Usar process_edital para extração e salvamento da tabela
+            try:
+                # Tentar usar o extrator específico para o município encontrado nos metadados
+                output_file = await state.run_blocking(process_edital, municipio or "", temp_json_path, "csv", csv_path)
+                session_state["csv_path"] = output_file
+                session_state["extractor"] = municipio
+            except ValueError as e:
+                # Se o município não for reconhecido pela factory de extratores
+                print(f"Município '{municipio}' não reconhecido: {e}")
+            
+                # Verificar se o parâmetro formato foi passado como um formato válido
+                if formato and formato != "generico":
                     try:
-                        output_file = process_edital(fallback_municipio, temp_json_path, "csv", csv_path)
+                        # Tentar usar o formato especificado pelo usuário
+                        output_file = await state.run_blocking(process_edital, formato, temp_json_path, "csv", csv_path)
                         session_state["csv_path"] = output_file
-                        print(f"Sucesso usando extrator de '{fallback_municipio}' como fallback.")
-                        break
-                    except Exception as fallback_error:
-                        print(f"Falha ao tentar extrator de '{fallback_municipio}': {fallback_error}")
-                        continue
-                
-                # Se nenhum dos extratores funcionou
-                if "csv_path" not in session_state or not session_state["csv_path"]:
-                    raise HTTPException(
-                        status_code=500, 
-                        detail=f"Não foi possível extrair tabelas. Município '{municipio}' não reconhecido e nenhum extrator alternativo funcionou. Tentados: {', '.join(tried_extractors)}"
-                    )
-        except Exception as e:
-            # Outro erro que não seja de município não reconhecido
-            print(f"Erro ao processar o edital: {e}")
-            raise HTTPException(status_code=500, detail=f"Erro ao processar o edital: {str(e)}")
+                        session_state["extractor"] = formato
+                    except Exception as formato_error:
+                        print(f"Erro ao usar o formato especificado '{formato}': {formato_error}")
+                        raise HTTPException(status_code=500, detail=f"Não foi possível extrair tabelas usando o formato '{formato}'.")
+                else:
+                    # Escolher o extrator pela impressão digital do layout (uma passada pelo texto, sem extrair)
+                    extractor_name, layout_scores = classify_layout(content, LAYOUT_MIN_CONFIDENCE)
+                    session_state["layout_scores"] = layout_scores
+                    print(f"Layout classificado como '{extractor_name}': {layout_scores}")
+                    
+                    # Não lançar exceção não basta: um extrator que não encontra nenhuma linha também cai no genérico
+                    layout_failure = None
+                    try:
+                        output_file = await state.run_blocking(process_edital, extractor_name, temp_json_path, "csv", csv_path)
+                        if extractor_name != "generico" and await state.run_blocking(count_extracted_rows, output_file) == 0:
+                            layout_failure = "nenhuma linha extraída"
+                    except Exception as layout_error:
+                        if extractor_name == "generico":
+                            raise HTTPException(
+                                status_code=500,
+                                detail=f"Não foi possível extrair tabelas. Município '{municipio}' não reconhecido e o extrator genérico falhou: {layout_error}"
+                            )
+                        layout_failure = layout_error
+                    if layout_failure is not None:
+                        print(f"Falha no extrator '{extractor_name}' ({layout_failure}), usando o genérico. Pontuações do layout: {layout_scores}")
+                        extractor_name = "generico"
+                        output_file = await state.run_blocking(process_edital, extractor_name, temp_json_path, "csv", csv_path)
+                    session_state["csv_path"] = output_file
+                    session_state["extractor"] = extractor_name
+            except Exception as e:
+                # Outro erro que não seja de município não reconhecido
+                print(f"Erro ao processar o edital: {e}")
+                raise HTTPException(status_code=500, detail=f"Erro ao processar o edital: {str(e)}")
+            
+            artifacts.put(content_id, extraction_stage, {
+                "csv_path": session_state["csv_path"],
+                "extractor": session_state.get("extractor"),
+                "layout_scores": session_state.get("layout_scores"),
+            })
         
         session_state["completed_steps"].append("table_extraction")
         
         # 4. Enriquecimento com busca de produtos (opcional - só se disponível)
         enhanced_csv_path = None
+        candidates_csv_path = None
         matched_count = 0
         total_descriptions = 0
+        catalog_version = state.catalog_version()
+        cached_enrichment = artifacts.get(content_id, "enrichment") if catalog_version else None
         
-        if state.product_search_available and session_state["csv_path"]:
+        if (cached_enrichment is not None
+                and cached_enrichment["catalog_version"] == catalog_version
+                and cached_enrichment["csv_path"] == session_state["csv_path"]
+                and _artifact_files_exist(cached_enrichment["enhanced_csv_path"], cached_enrichment["candidates_csv_path"])):
+            # Mesmo CSV extraído e mesmo catálogo: reaproveitar o enriquecimento anterior
+            enhanced_csv_path = cached_enrichment["enhanced_csv_path"]
+            candidates_csv_path = cached_enrichment["candidates_csv_path"]
+            matched_count = cached_enrichment["matched_count"]
+            total_descriptions = cached_enrichment["total_descriptions"]
+            session_state["enhanced_csv_path"] = enhanced_csv_path
+            session_state["candidates_csv_path"] = candidates_csv_path
+            session_state["completed_steps"].append("product_matching")
+        elif state.product_search_available and session_state["csv_path"]:
             try:
                 # Carregar o CSV extraído
-                df = pd.read_csv(session_state["csv_path"])
+                df = await state.run_blocking(pd.read_csv, session_state["csv_path"])
                 
                 # Identificar a coluna de descrição
                 description_column = next((col for col in df.columns if "DESCRI" in col.upper()), None)
                 
                 if description_column:
-                    # Processar o DataFrame com o motor de busca
-                    enhanced_df = state.search_engine.process_dataframe(
+                    # Processar o DataFrame com o motor de busca (os 3 melhores
+                    # candidatos de cada item vão para um CSV auxiliar de revisão)
+                    candidates_csv_path = f"{RESULTS_DIR}/{content_id}_candidates.csv"
+                    enhanced_df = await state.run_blocking(
+                        state.search_engine.process_dataframe,
                         df=df,
                         description_column=description_column,
                         threshold=0.5,
-                        output_column="Produto_base_db"
+                        output_column="Produto_base_db",
+                        batch_mode=True,
+                        dedup=True,
+                        top_k_candidates=3,
+                        candidates_path=candidates_csv_path
                     )
                     
                     # Salvar o resultado enriquecido
                     enhanced_csv_path = f"{RESULTS_DIR}/{content_id}_enhanced.csv"
-                    enhanced_df.to_csv(enhanced_csv_path, index=False)
+                    await state.run_blocking(enhanced_df.to_csv, enhanced_csv_path, index=False)
                     
                     # Calcular estatísticas
                     matched_count = (enhanced_df["Produto_base_db"] != "nao_encontrado").sum()
                     total_descriptions = len(enhanced_df)
                     
                     session_state["enhanced_csv_path"] = enhanced_csv_path
+                    session_state["candidates_csv_path"] = candidates_csv_path
                     session_state["completed_steps"].append("product_matching")
+                    print(f"Cache de embeddings: {state.embedding_cache.stats()}")
+                    
+                    artifacts.put(content_id, "enrichment", convert_numpy_types({
+                        "catalog_version": catalog_version,
+                        "csv_path": session_state["csv_path"],
+                        "enhanced_csv_path": enhanced_csv_path,
+                        "candidates_csv_path": candidates_csv_path,
+                        "matched_count": matched_count,
+                        "total_descriptions": total_descriptions,
+                    }))
             except Exception as e:
                 print(f"Erro no enriquecimento com busca de produtos: {e}")
                 # Não falhar o processamento se esta etapa falhar
@@ -291,15 +576,25 @@ async def process_document(
             "municipio": session_state["municipio"],
             "item_count": session_state["number_itens"],
             "output_path": session_state["csv_path"],
+            "extractor": session_state.get("extractor"),
+            "layout_scores": session_state.get("layout_scores"),
             "enhanced_file_path": enhanced_csv_path,
+            "candidates_file_path": candidates_csv_path,
             "matched_count": matched_count,
             "total_descriptions": total_descriptions,
             "completed_steps": session_state["completed_steps"]
         }
+        response = convert_numpy_types(response)
         
-        # Convert all numpy types before returning
-        return convert_numpy_types(response)
+        # Guardar a resposta para reenvios do mesmo documento (sem o id de sessão)
+        cached = dict(response, catalog_version=catalog_version)
+        cached.pop("session_id")
+        artifacts.put(content_id, response_stage, cached)
+        
+        return dict(response, from_cache=False)
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro no processamento: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -320,12 +615,125 @@ async def chat(
             "response": result["response"],
             "query": query,
             "context_count": len(result.get("context_used", [])),
-            "similarity_scores": result.get("similarity_scores", [])
+            "similarity_scores": result.get("similarity_scores", []),
+            "context_tokens": result.get("context_tokens"),
+            "cached": result.get("cached", False)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro no processamento da pergunta: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream(
+    content_id: str = Form(...),
+    query: str = Form(...),
+    state: ProcessingState = Depends(get_state)
+):
+    """
+    Versão em streaming do /api/chat (Server-Sent Events).
+    O primeiro evento ("retrieval") traz os chunks recuperados e suas
+    similaridades, seguem eventos "token" com o texto da resposta e o último
+    ("done") traz o uso de tokens e os tempos.
+    """
+    if content_id not in state.rag_service.embeddings_cache:
+        raise HTTPException(status_code=404, detail="No content available. Please upload a PDF first.")
+    
+    async def event_stream():
+        try:
+            async for event in state.rag_service.stream_answer(query, content_id):
+                payload = json.dumps(convert_numpy_types(event["data"]), ensure_ascii=False)
+                yield f"event: {event['event']}\ndata: {payload}\n\n"
+        except Exception as e:
+            print(f"Erro no streaming da pergunta: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/extractor/bidding-info")
+async def bidding_info(
+    content_id: str = Form(...),
+    state: ProcessingState = Depends(get_state)
+):
+    """
+    Extrai as informações da licitação (campos do PROMPT_BASE) de um edital já processado
+    """
+    try:
+        metadata = state.artifact_cache.get(content_id, "metadata") or {}
+        start = time.perf_counter()
+        info = await state.metadata_extractor.extract_bidding_info(content_id, metadata=metadata)
+        return convert_numpy_types({
+            "content_id": content_id,
+            "bidding_info": info,
+            "elapsed_ms": (time.perf_counter() - start) * 1000
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Erro na extração das informações da licitação: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/search")
+async def search_corpus(
+    query: str = Form(...),
+    top_k: int = Form(10),
+    municipio: Optional[str] = Form(None),
+    date_from: Optional[str] = Form(None),
+    date_to: Optional[str] = Form(None),
+    content_ids: Optional[str] = Form(None),
+    state: ProcessingState = Depends(get_state)
+):
+    """
+    Busca em todos os editais processados, com filtros opcionais por
+    município, intervalo de datas (AAAA-MM-DD) e lista de content_ids
+    separados por vírgula
+    """
+    try:
+        start = time.perf_counter()
+        query_embedding = await state.rag_service.prepare_query(query)
+        hits = await state.run_blocking(
+            state.corpus_index.search,
+            query_embedding,
+            top_k=top_k,
+            content_ids=[c.strip() for c in content_ids.split(",") if c.strip()] if content_ids else None,
+            municipio=municipio,
+            date_from=date_from,
+            date_to=date_to
+        )
+        return {
+            "query": query,
+            "hits": hits,
+            "search_ms": (time.perf_counter() - start) * 1000
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Índice do corpus gerado com outros embeddings
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        print(f"Erro na busca do corpus: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/rag/stats")
+async def rag_stats(state: ProcessingState = Depends(get_state)):
+    """
+    Uso de memória dos índices RAG carregados, no total e por documento
+    """
+    return state.rag_service.embeddings_cache.stats(per_entry=True)
+
+@app.on_event("shutdown")
+def save_corpus_index():
+    """
+    Grava o índice do corpus pendente ao encerrar o servidor
+    """
+    if _state_instance is not None:
+        _state_instance.corpus_index.save()
+
 @app.get("/api/file")
 async def get_file(path: str):
     """
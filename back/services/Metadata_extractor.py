@@ -1,8 +1,9 @@
 from interfaces.IMetadata import IMetadata 
 from services.rag_service import RAGService
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
 from typing import List, Dict, Any, Tuple, Optional
 from fastapi import HTTPException, UploadFile
+from pydantic import BaseModel, ConfigDict
 from services.PDFUploader import PDFUploader
 import os 
 import numpy as np
@@ -12,6 +13,10 @@ import re
 import unicodedata
 from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
+import asyncio
+import json
+from services.artifact_cache import ArtifactCache, hash_bytes
+from utils.cache import TTLCache
 
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -43,25 +48,114 @@ Penalidades e sanções em caso de descumprimento contratual
 Critérios adicionais para habilitação (regularidade fiscal, qualificação jurídica, comprovação de capacidade técnica, etc.)
 Critérios para desclassificação ou penalização de propostas"""
 
+# PROMPT_BASE fields grouped by the part of the edital that answers them;
+# each group is answered from its own retrieved chunks
+BIDDING_FIELD_GROUPS = {
+    "proposta": [
+        "Validade da proposta",
+        "Número de casas decimais para proposta",
+        "Critérios para desclassificação ou penalização de propostas",
+    ],
+    "entrega_pagamento": [
+        "Prazo de entrega",
+        "Condições de pagamento",
+    ],
+    "sessao": [
+        "Cidade",
+        "Estado",
+        "Horário de abertura da licitação",
+        "Cronograma do processo (prazos para submissão de propostas, impugnações, recursos e execução)",
+    ],
+    "objeto": [
+        "Objeto da licitação (qual é o escopo ou finalidade da contratação?)",
+        "Modalidade da licitação (concorrência, tomada de preços, convite etc.)",
+        "Valor estimado para a contratação",
+        "Critérios de julgamento (menor preço, técnica e preço, melhor técnica etc.)",
+    ],
+    "habilitacao": [
+        "Documentações necessárias para habilitação",
+        "Requisitos técnicos e de qualificação (experiência mínima, comprovação de capacidade, etc.)",
+        "Critérios adicionais para habilitação (regularidade fiscal, qualificação jurídica, comprovação de capacidade técnica, etc.)",
+    ],
+    "garantias_sancoes": [
+        "Garantias exigidas (garantia de proposta, garantia contratual, etc.)",
+        "Penalidades e sanções em caso de descumprimento contratual",
+    ],
+}
+
+# Padrões da extração de metadados por regex (compilados uma única vez)
+# Só o nome explícito no cabeçalho ("PREFEITURA MUNICIPAL DE X", "MUNICÍPIO DE X") conta como heurística
+MUNICIPIO_PATTERN = re.compile(r"(?:PREFEITURA(?:\s+MUNICIPAL)?|MUNIC[IÍ]PIO)\s+(?:DE|DO|DA)\s+([A-ZÀ-Ú\s]+?)(?:\/[A-Z]{2}|\s+CNPJ|\s+-|\n)", re.IGNORECASE)
+ITEM_PATTERN = re.compile(r"(?:Item|ITEM)\s+(\d+)[:\.\)-]")
+# Cabeçalho da coluna de itens de uma tabela markdown ("| ITEM | DESCRIÇÃO | ... |", "| It. | ...")
+TABLE_ITEM_HEADER_PATTERN = re.compile(r"^(?:it|item|itens)\.?$", re.IGNORECASE)
+TABLE_ITEM_NUMBER_PATTERN = re.compile(r"\d{1,4}")
+
+
+def _count_table_items(content: str) -> int:
+    """
+    Distinct item numbers in the item column of markdown tables. Tables whose
+    header has no item column (pages, lots, prices) are ignored.
+    """
+    items = set()
+    column = header = None
+    for line in content.splitlines():
+        line = line.strip()
+        if not line.startswith("|"):
+            column = header = None
+            continue
+        cells = [cell.strip() for cell in line.strip("|").split("|")]
+        if header is None:
+            header = cells
+            column = next((i for i, cell in enumerate(cells) if TABLE_ITEM_HEADER_PATTERN.match(cell)), None)
+        elif column is not None and column < len(cells) and TABLE_ITEM_NUMBER_PATTERN.fullmatch(cells[column]):
+            items.add(int(cells[column]))
+    return len(items)
+
 PROMPT_DESCRIPTION = """Comporte-se como um agente em uma empresa de licitações para medicamentos hospitalares e responda as seguintes perguntas com a maior precisão:"""
 
+class MetadataResult(BaseModel):
+    """
+    Metadados extraídos de um documento, criados a cada chamada e imutáveis:
+    o extrator é compartilhado entre requisições e não guarda estado por documento.
+    Os campos *_source indicam a origem de cada valor (heuristic ou llm).
+    """
+    model_config = ConfigDict(frozen=True)
+
+    municipio: Optional[str] = None
+    number_itens: int = 0
+    municipio_source: Optional[str] = None
+    number_itens_source: Optional[str] = None
+
+    def as_metadata(self) -> Dict[str, Any]:
+        """
+        Dicionário só com os metadados (sem a origem), no formato usado pelas rotas
+        """
+        return {"municipio": self.municipio, "number_itens": self.number_itens}
+
+
 class MetadataExtractor(IMetadata):
-    def __init__(self, json_data=None):
-        self.metadata = {
-            "municipio": "",
-            "number_itens": 0,
-            "embeddings_path": "",
-            "csv_path": "",
-        }
+    def __init__(self, json_data=None, client: Optional[AsyncAzureOpenAI] = None,
+                 rag_service: Optional[RAGService] = None,
+                 artifact_cache: Optional[ArtifactCache] = None,
+                 bidding_top_k: int = 3):
         self.json_data = json_data
         self.embeddings_cache = {}
         self.pdf_uploader = PDFUploader()
-        self.client = AzureOpenAI(
+        # Asynchronous client, so LLM calls never block the event loop
+        self.client = client or AsyncAzureOpenAI(
             api_key=AZURE_API_KEY,
             api_version=AZURE_API_VERSION,
             azure_endpoint=AZURE_ENDPOINT
         )
         self.llm_model = LLM_MODEL
+        # Bidding info is answered per field group from the document's RAG index
+        self.rag_service = rag_service
+        self.artifact_cache = artifact_cache
+        self.bidding_top_k = bidding_top_k
+        self.bidding_cache = TTLCache(max_entries=512, ttl_seconds=None)
+        # (hash do conteúdo, modelo, campos pedidos) -> campos devolvidos pelo LLM
+        self.metadata_llm_cache = TTLCache(max_entries=1024, ttl_seconds=None)
         self.accepted_municipalities = [
             "itumbiara", "padre_bernardo", "frutal", 
             "sao_roque", "cavalcante", "rondonia","rondonia"
@@ -78,26 +172,8 @@ class MetadataExtractor(IMetadata):
         Returns:
             Dicionário com os metadados extraídos
         """
-        # Extrair metadados de forma síncrona
-        # Extrair município usando regex
-        municipio_pattern = r"(?:PREFEITURA|MUNICÍPIO)\s+(?:DE|DO|DA)\s+([A-ZÀ-Ú\s]+?)(?:\/[A-Z]{2}|\s+CNPJ|\s+-|\n)"
-        municipio_match = re.search(municipio_pattern, content, re.IGNORECASE)
-        
-        if municipio_match:
-            extracted_municipio = municipio_match.group(1).strip()
-            normalized_municipio = self._normalize_municipality_name(extracted_municipio)
-            if normalized_municipio in self.accepted_municipalities:
-                self.metadata["municipio"] = normalized_municipio
-        
-        # Contar itens no documento
-        item_pattern = r"(?:Item|ITEM)\s+(\d+)[:\.\)-]"
-        item_matches = re.findall(item_pattern, content)
-        
-        if item_matches:
-            self.metadata["number_itens"] = len(set(item_matches))
-        
-        # Retornar os metadados extraídos
-        return self.metadata
+        # Extrair metadados de forma síncrona (regex e heurísticas, sem LLM)
+        return self._extract_metadata_heuristics(content)
 
     async def process_pdf(self, file: UploadFile) -> str:
         """
@@ -107,21 +183,21 @@ class MetadataExtractor(IMetadata):
         content = await self.pdf_uploader.upload_pdf(file)
         
         # Extract metadata from content
-        await self._extract_metadata(content)
+        result = await self.extract_metadata(content)
         
         # Save file information to metadata
         filename_base = os.path.splitext(file.filename)[0]
-        embeddings_path = f"embeddings/{filename_base}.pkl"
-        csv_path = f"csv/{filename_base}.csv"
-        
-        self.metadata["embeddings_path"] = embeddings_path
-        self.metadata["csv_path"] = csv_path
+        metadata = dict(
+            result.as_metadata(),
+            embeddings_path=f"embeddings/{filename_base}.pkl",
+            csv_path=f"csv/{filename_base}.csv"
+        )
         
         # Process content to create chunks
         chunks = self._split_content(content)
         
         # Generate embeddings for chunks
-        embeddings_array, index = self._generate_embeddings(chunks)
+        embeddings_array, index = await self._generate_embeddings(chunks)
         
         # Create a unique ID for this content
         content_id = filename_base
@@ -131,69 +207,103 @@ class MetadataExtractor(IMetadata):
             "embeddings": embeddings_array,
             "texts": chunks,
             "index": index,
-            "content": content
+            "content": content,
+            "metadata": metadata
         }
         
         # Save embeddings and other data to disk
-        self._save_embeddings(content_id, chunks, embeddings_array, index)
+        self._save_embeddings(content_id, chunks, embeddings_array, index, metadata)
         
         return content_id
     
-    async def _extract_metadata(self, content: str) -> None:
+    async def extract_metadata(self, content: str) -> MetadataResult:
         """
         Extract municipality and number of items from the document content
         Only accepts specific municipalities: itumbiara, padre_bernardo, frutal, sao_roque, cavalcante, rondonia
+        
+        Tiered: regex and layout heuristics first; the LLM is only asked for
+        the fields still missing, and its answers are cached by content hash.
         """
-        # First try to extract metadata using regex patterns
-        municipio_pattern = r"(?:PREFEITURA|MUNICÍPIO)\s+(?:DE|DO|DA)\s+([A-ZÀ-Ú\s]+?)(?:\/[A-Z]{2}|\s+CNPJ|\s+-|\n)"
-        municipio_match = re.search(municipio_pattern, content, re.IGNORECASE)
+        found = self._extract_metadata_heuristics(content)
+        sources = {field: "heuristic" for field, value in found.items() if value}
         
+        missing = [field for field in ("municipio", "number_itens") if not found[field]]
+        if missing:
+            metadata_llm = await self._extract_metadata_llm(content, missing)
+            
+            if "municipio" in missing and metadata_llm.get("municipio"):
+                # Normalize and validate the LLM-extracted municipality
+                normalized_llm_municipio = self._normalize_municipality_name(str(metadata_llm["municipio"]))
+                if normalized_llm_municipio in self.accepted_municipalities:
+                    found["municipio"] = normalized_llm_municipio
+                    sources["municipio"] = "llm"
+            
+            if "number_itens" in missing and metadata_llm.get("number_itens"):
+                try:
+                    found["number_itens"] = int(metadata_llm["number_itens"])
+                    sources["number_itens"] = "llm"
+                except (TypeError, ValueError):
+                    print(f"Número de itens inválido devolvido pelo LLM: {metadata_llm['number_itens']}")
+        
+        print(f"Metadados extraídos: {found} (origem: {sources or 'nenhuma'})")
+        return MetadataResult(
+            municipio=found["municipio"],
+            number_itens=found["number_itens"] or 0,
+            municipio_source=sources.get("municipio"),
+            number_itens_source=sources.get("number_itens")
+        )
+    
+    def _extract_metadata_heuristics(self, content: str) -> Dict[str, Any]:
+        """
+        Municipality and item count using only precompiled regexes and layout
+        heuristics (no network). Fields not found are None.
+        """
+        municipio = None
+        municipio_match = MUNICIPIO_PATTERN.search(content)
         if municipio_match:
-            extracted_municipio = municipio_match.group(1).strip()
             # Normalize the extracted municipality name for comparison
-            normalized_extracted = self._normalize_municipality_name(extracted_municipio)
-            
-            # Check if the normalized municipality is in the accepted list
+            normalized_extracted = self._normalize_municipality_name(municipio_match.group(1).strip())
             if normalized_extracted in self.accepted_municipalities:
-                self.metadata["municipio"] = normalized_extracted
-            else:
-                self.metadata["municipio"] = None  # Not an accepted municipality
-        
-        # Count items in the document (assuming they're numbered)
-        item_pattern = r"(?:Item|ITEM)\s+(\d+)[:\.\)-]"
-        item_matches = re.findall(item_pattern, content)
+                municipio = normalized_extracted
+        # Names mentioned elsewhere (other municipalities, the state) are left to the LLM tier
         
-        if item_matches:
-            self.metadata["number_itens"] = len(set(item_matches))
+        # Count items in the document (numbered "Item N" or the item column of the items table)
+        number_itens = len(set(ITEM_PATTERN.findall(content))) or _count_table_items(content) or None
         
-        # If regex extraction fails, use LLM to extract metadata
-        #if  not self.metadata.get("municipio") or  not self.metadata.get("number_itens"):
+        return {"municipio": municipio, "number_itens": number_itens}
+    
+    async def _extract_metadata_llm(self, content: str, fields: List[str]) -> Dict[str, Any]:
+        """
+        Ask the LLM only for the given fields; answers are cached by content hash
+        """
+        key = (hash_bytes(content.encode("utf-8")), self.llm_model, tuple(fields))
+        cached = self.metadata_llm_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        descriptions = {
+            "municipio": f"Nome do município (apenas aceite: {', '.join(self.accepted_municipalities)})",
+            "number_itens": "Número total de itens a serem licitados",
+        }
+        requested = " ".join(f"{n}) {descriptions[field]}," for n, field in enumerate(fields, start=1)).rstrip(",")
         chat_messages = [
-            {"role": "system", "content": f"Extraia as seguintes informações do documento de licitação fornecido: 1) Nome do município (apenas aceite: {', '.join(self.accepted_municipalities)}), 2) Número total de itens a serem licitados. Retorne apenas um JSON com as chaves 'municipio' e 'number_itens'."},
+            {"role": "system", "content": f"Extraia as seguintes informações do documento de licitação fornecido: {requested}. Retorne apenas um JSON com as chaves {', '.join(repr(field) for field in fields)}."},
             {"role": "user", "content": f"Documento: {content[:4000]}"}  # Using first 4000 chars for context
         ]
         
-        response = self.client.chat.completions.create(
-            model=self.llm_model,
-            messages=chat_messages,
-            response_format={"type": "json_object"}
-        )
-        
         try:
-            result = response.choices[0].message.content
-            import json
-            metadata_llm = json.loads(result)
-            
-            if not self.metadata.get("municipio") and "municipio" in metadata_llm:
-                # Normalize and validate the LLM-extracted municipality
-                normalized_llm_municipio = self._normalize_municipality_name(metadata_llm["municipio"])
-                if normalized_llm_municipio in self.accepted_municipalities:
-                    self.metadata["municipio"] = normalized_llm_municipio
-            
-            if not self.metadata.get("number_itens") and "number_itens" in metadata_llm:
-                self.metadata["number_itens"] = int(metadata_llm["number_itens"])
+            response = await self.client.chat.completions.create(
+                model=self.llm_model,
+                messages=chat_messages,
+                response_format={"type": "json_object"}
+            )
+            metadata_llm = json.loads(response.choices[0].message.content)
         except Exception as e:
             print(f"Error extracting metadata with LLM: {e}")
+            return {}
+        
+        self.metadata_llm_cache.put(key, metadata_llm)
+        return metadata_llm
 
     def _normalize_municipality_name(self, name: str) -> str:
         """
@@ -208,7 +318,7 @@ class MetadataExtractor(IMetadata):
         name = unicodedata.normalize('NFKD', name).encode('ASCII', 'ignore').decode('ASCII')
         
         # Remove common prefixes
-        name = re.sub(r'^(prefeitura|municipio|município)\s+(de|do|da)\s+', '', name)
+        name = re.sub(r'^(prefeitura(\s+municipal)?|municipio|município)\s+(de|do|da)\s+', '', name)
         
         # Replace spaces with underscores and remove special characters
         name = re.sub(r'[^a-z0-9]', '_', name)
@@ -255,13 +365,13 @@ class MetadataExtractor(IMetadata):
             )
             return text_splitter.split_text(content)
     
-    def _generate_embeddings(self, chunks: List[str]) -> Tuple[np.ndarray, faiss.Index]:
+    async def _generate_embeddings(self, chunks: List[str]) -> Tuple[np.ndarray, faiss.Index]:
         """
         Generate embeddings for text chunks and create FAISS index
         """
         embeddings = []
         for chunk in chunks:
-            embedding = self._get_embedding(chunk)
+            embedding = await self._get_embedding(chunk)
             embeddings.append(embedding)
         
         # Convert to numpy array
@@ -277,17 +387,18 @@ class MetadataExtractor(IMetadata):
         
         return embeddings_array, index
     
-    def _get_embedding(self, text: str) -> List[float]:
+    async def _get_embedding(self, text: str) -> List[float]:
         """
         Get embedding for a single text
         """
-        response = self.client.embeddings.create(
+        response = await self.client.embeddings.create(
             model=EMBEDDING_MODEL,
             input=[text]
         )
         return response.data[0].embedding
     
-    def _save_embeddings(self, content_id: str, chunks: List[str], embeddings_array: np.ndarray, index: faiss.Index) -> None:
+    def _save_embeddings(self, content_id: str, chunks: List[str], embeddings_array: np.ndarray, index: faiss.Index,
+                         metadata: Dict[str, Any]) -> None:
         """
         Save embeddings, chunks and index to disk
         """
@@ -298,7 +409,7 @@ class MetadataExtractor(IMetadata):
         data_to_save = {
             "embeddings": embeddings_array,
             "texts": chunks,
-            "metadata": self.metadata
+            "metadata": metadata
         }
         
         with open(f"embeddings/{content_id}.pkl", 'wb') as f:
@@ -328,11 +439,11 @@ class MetadataExtractor(IMetadata):
         
         return results, retrieved_texts
     
-    def prepare_query(self, query: str) -> np.ndarray:
+    async def prepare_query(self, query: str) -> np.ndarray:
         """
         Prepare query by converting to embedding and normalizing
         """
-        embedded_query = self._get_embedding(query)
+        embedded_query = await self._get_embedding(query)
         embedded_query = np.array(embedded_query, dtype=np.float32)
         
         # Reshape to ensure it's 2D (add batch dimension if needed)
@@ -351,7 +462,7 @@ class MetadataExtractor(IMetadata):
             raise HTTPException(status_code=404, detail="No content available. Please upload a PDF first.")
         
         # Prepare query embedding
-        query_embedding = self.prepare_query(query)
+        query_embedding = await self.prepare_query(query)
         
         # Search for relevant chunks
         results, retrieved_texts = self.search(query_embedding, content_id, top_k)
@@ -368,7 +479,7 @@ class MetadataExtractor(IMetadata):
         ]
         
         # Get response from LLM
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.llm_model,
             messages=chat_messages,
             max_tokens=max_tokens
@@ -383,18 +494,96 @@ class MetadataExtractor(IMetadata):
                 for (sim, _), text in zip(results, retrieved_texts)
             ],
             "similarity_scores": [float(sim) for sim, _ in results],
-            "metadata": self.metadata
+            "metadata": cache_entry["metadata"]
         }
     
-    async def extract_bidding_info(self, content_id: str) -> Dict[str, str]:
+    async def extract_bidding_info(self, content_id: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Extract key bidding information based on PROMPT_BASE.
+
+        With a RAG service, each group of fields is answered from its own
+        retrieved chunks and the groups are queried concurrently, so fields
+        from late annexes are found too. The result is cached per content_id
+        (a hash of the document). Without one, falls back to sending the
+        beginning of the document in a single call.
+        """
+        if self.rag_service is None:
+            return await self._extract_bidding_info_full(content_id, metadata)
+        
+        if not content_id or content_id not in self.rag_service.embeddings_cache:
+            raise HTTPException(status_code=404, detail="No content available. Please upload a PDF first.")
+        
+        cache_key = (content_id, self.llm_model)
+        bidding_info = self.bidding_cache.get(cache_key)
+        if bidding_info is None and self.artifact_cache is not None:
+            bidding_info = self.artifact_cache.get(content_id, f"bidding_info_{self.llm_model}")
+        
+        if bidding_info is None:
+            groups = await asyncio.gather(*(
+                self._extract_field_group(content_id, fields) for fields in BIDDING_FIELD_GROUPS.values()
+            ))
+            bidding_info = {}
+            for answers, _ in groups:
+                bidding_info.update(answers)
+            # A failed LLM call leaves its fields as "Não encontrado"; caching that
+            # result would keep the document's bidding info wrong for good
+            if all(ok for _, ok in groups):
+                if self.artifact_cache is not None:
+                    self.artifact_cache.put(content_id, f"bidding_info_{self.llm_model}", bidding_info)
+                self.bidding_cache.put(cache_key, bidding_info)
+            else:
+                print(f"Bidding info for {content_id} is incomplete; not caching it")
+        else:
+            self.bidding_cache.put(cache_key, bidding_info)
+        
+        # Add metadata to the response
+        metadata = metadata or {}
+        return dict(bidding_info, municipio=metadata.get("municipio"), number_itens=metadata.get("number_itens"))
+    
+    async def _extract_field_group(self, content_id: str, fields: List[str]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Answer one group of PROMPT_BASE fields from the chunks retrieved for it
+
+        Returns:
+            The answers for the group and whether the LLM call succeeded
+        """
+        query = "; ".join(fields)
+        query_embedding = await self.rag_service.prepare_query(query)
+        results, retrieved_texts = await self.rag_service.retrieve(query, query_embedding, content_id, self.bidding_top_k)
+        context = self.rag_service.context_packer.pack(query, results, retrieved_texts).text
+        field_list = "\n".join(fields)
+        
+        chat_messages = [
+            {"role": "system", "content": f"Você é um especialista em licitações. Extraia as seguintes informações dos trechos do documento fornecidos:\n{field_list}\n\nRetorne um JSON cujas chaves são exatamente os nomes acima, com a informação exata encontrada nos trechos ou \"Não encontrado\"."},
+            {"role": "user", "content": f"Trechos do documento de licitação:\n{context}"}
+        ]
+        
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.llm_model,
+                messages=chat_messages,
+                response_format={"type": "json_object"},
+                max_tokens=600
+            )
+            answers = json.loads(response.choices[0].message.content)
+            ok = True
+        except Exception as e:
+            print(f"Error extracting bidding fields {fields}: {e}")
+            answers = {}
+            ok = False
+        
+        return {field: answers.get(field, "Não encontrado") for field in fields}, ok
+    
+    async def _extract_bidding_info_full(self, content_id: str, metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        Extract key bidding information based on PROMPT_BASE
+        Extract all PROMPT_BASE fields in a single call over the beginning of the document
         """
         if not content_id or content_id not in self.embeddings_cache:
             raise HTTPException(status_code=404, detail="No content available. Please upload a PDF first.")
         
         cache_entry = self.embeddings_cache[content_id]
         content = cache_entry["content"]
+        metadata = metadata if metadata is not None else cache_entry["metadata"]
         
         # Use LLM to extract all the required information
         chat_messages = [
@@ -402,7 +591,7 @@ class MetadataExtractor(IMetadata):
             {"role": "user", "content": f"Documento de licitação:\n{content[:15000]}"}  # Using first 15000 chars for context
         ]
         
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.llm_model,
             messages=chat_messages,
             response_format={"type": "json_object"},
@@ -411,13 +600,12 @@ class MetadataExtractor(IMetadata):
         
         try:
             result = response.choices[0].message.content
-            import json
             bidding_info = json.loads(result)
             
             # Add metadata to the response
-            bidding_info["municipio"] = self.metadata["municipio"]
-            bidding_info["number_itens"] = self.metadata["number_itens"]
+            bidding_info["municipio"] = metadata.get("municipio")
+            bidding_info["number_itens"] = metadata.get("number_itens")
             
             return bidding_info
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error extracting bidding information: {e}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Error extracting bidding information: {e}")
@@ -2,7 +2,7 @@ import os
 import numpy as np
 import faiss
 import pickle
-import requests
+import httpx
 import json
 from typing import List, Dict, Any, Tuple, Optional
 from fastapi import HTTPException, UploadFile
@@ -12,27 +12,25 @@ from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharac
 
 
 class PDFUploader:
-    def __init__(self, url_base="http://localhost:8000/main/pdf/upload"):
+    def __init__(self, url_base="http://localhost:8000/main/pdf/upload", timeout: float = 300.0):
         self.url_base = url_base
+        self.timeout = timeout
 
     async def upload_pdf(self, file: UploadFile) -> str:
         """
         Upload PDF file to the service and return extracted content
         """
+        return await self.upload_pdf_bytes(await file.read())
+
+    async def upload_pdf_bytes(self, pdf_bytes: bytes) -> str:
+        """
+        Upload PDF bytes already read from the request and return extracted content
+        """
         try:
-            # Create temporary file to save the uploaded file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file_path = temp_file.name
-                # Write the uploaded file to the temporary file
-                content = await file.read()
-                temp_file.write(content)
-            
-            # Now upload the temporary file to the service
-            files = {'file': open(temp_file_path, 'rb')}
-            response = requests.post(self.url_base, files=files)
-            
-            # Clean up the temporary file
-            os.unlink(temp_file_path)
+            # Upload the bytes without blocking the event loop
+            files = {'file': ('document.pdf', pdf_bytes, 'application/pdf')}
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.post(self.url_base, files=files)
             
             # Parse the response
             if response.status_code != 200:
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from typing import Any, Dict, Optional
+
+
+def hash_bytes(data: bytes) -> str:
+    """
+    SHA-256 (hex) dos bytes do arquivo enviado
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def document_id(pdf_hash: str, content: str) -> str:
+    """
+    Identificador do documento derivado do hash do PDF e do texto extraído:
+    o mesmo edital reenviado sempre recebe o mesmo id, e editais diferentes
+    do mesmo município não se sobrescrevem
+    """
+    digest = hashlib.sha256(f"{pdf_hash}\x00{content}".encode("utf-8")).hexdigest()
+    return digest[:32]
+
+
+class ArtifactCache:
+    """
+    Artefatos de cada etapa do processamento de um edital (conteúdo,
+    metadados, tabelas extraídas, resposta final), endereçados pelo hash
+    do documento. Cada artefato é um JSON em base_dir/<chave>/<etapa>.json,
+    gravado de forma atômica.
+    """
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        os.makedirs(base_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str, stage: str) -> str:
+        safe_key = re.sub(r"[^\w.-]", "_", key).lstrip(".")
+        safe_stage = re.sub(r"[^\w.-]", "_", stage).lstrip(".")
+        return os.path.join(self.base_dir, safe_key, f"{safe_stage}.json")
+
+    def get(self, key: str, stage: str) -> Optional[Any]:
+        """
+        Retorna o artefato da etapa, ou None se ainda não foi gerado
+        """
+        path = self._path(key, stage)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"Artefato inválido ignorado ({path}): {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, stage: str, value: Any) -> None:
+        """
+        Grava o artefato da etapa
+        """
+        path = self._path(key, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def invalidate(self, key: str, stage: Optional[str] = None) -> None:
+        """
+        Remove um artefato ou, sem etapa, todos os artefatos da chave
+        """
+        if stage is not None:
+            path = self._path(key, stage)
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            shutil.rmtree(os.path.dirname(self._path(key, "_")), ignore_errors=True)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Contadores de acertos do cache de artefatos
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
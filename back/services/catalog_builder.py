@@ -0,0 +1,235 @@
+import argparse
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+from interfaces.IEmbeddingProvider import IEmbeddingProvider
+from services.catalog_index import INDEX_TYPES, CatalogIndexConfig, build_index, save_index
+from services.catalog_store import SUPPORTED_DTYPES, is_catalog_dir, load_catalog, save_catalog
+
+
+class CatalogBuilder:
+    """
+    Gera offline os embeddings do catálogo de produtos.
+
+    Os nomes são enviados ao provedor em lotes grandes, com um número
+    limitado de requisições simultâneas. Cada lote concluído é gravado como
+    checkpoint, então uma execução interrompida continua de onde parou.
+    Nomes que já existem no catálogo de destino (mesmo modelo) não são
+    reenviados ao provedor.
+    """
+    def __init__(self,
+                 provider: IEmbeddingProvider,
+                 output_dir: str,
+                 checkpoint_dir: Optional[str] = None,
+                 batch_size: int = 512,
+                 max_concurrency: int = 4,
+                 dtype: str = "float32",
+                 max_retries: int = 3,
+                 index_config: Optional[CatalogIndexConfig] = None):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Tipo de armazenamento não suportado: {dtype}")
+
+        self.provider = provider
+        self.output_dir = os.path.abspath(output_dir)
+        self.checkpoint_dir = checkpoint_dir or f"{self.output_dir}.checkpoint"
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.dtype = dtype
+        self.max_retries = max_retries
+        self.index_config = index_config or CatalogIndexConfig()
+        # Mesmo caminho padrão usado pelo EmbeddingManager
+        self.index_path = f"{os.path.splitext(self.output_dir)[0]}.faiss"
+
+    def build(self, names: List[str], pickle_path: Optional[str] = None) -> str:
+        """
+        Gera (ou atualiza) o catálogo para a lista de nomes.
+
+        Args:
+            names: Nomes dos produtos
+            pickle_path: Se informado, grava também a matriz no formato pickle legado
+
+        Returns:
+            Diretório do catálogo gerado
+        """
+        names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+
+        known = self._load_existing_vectors()
+        reused = sum(name in known for name in names)
+        known.update(self._load_checkpoints())
+
+        pending = [name for name in names if name not in known]
+        print(f"Catálogo: {len(names)} nomes, {reused} reaproveitados, "
+              f"{len(names) - reused - len(pending)} de checkpoints, {len(pending)} a gerar")
+
+        if pending:
+            known.update(self._embed_pending(pending))
+
+        vectors = np.array([known[name] for name in names], dtype=np.float32)
+        faiss.normalize_L2(vectors)
+
+        save_catalog(self.output_dir, vectors, names, dtype=self.dtype, model=self.provider.model)
+        self._write_index()
+        if pickle_path:
+            self._write_pickle(pickle_path, vectors)
+
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        print(f"Catálogo salvo em {self.output_dir} e índice em {self.index_path}")
+        return self.output_dir
+
+    def _load_existing_vectors(self) -> Dict[str, np.ndarray]:
+        """
+        Carrega os vetores do catálogo atual, se foi gerado pelo mesmo modelo
+        """
+        if not is_catalog_dir(self.output_dir):
+            return {}
+
+        store = load_catalog(self.output_dir)
+        if store.meta.get("model") != self.provider.model:
+            print(f"Catálogo existente gerado com outro modelo ({store.meta.get('model')}); gerando tudo novamente")
+            return {}
+
+        vectors = store.as_float32()
+        return {name: vectors[i] for i, name in enumerate(store.names)}
+
+    def _checkpoint_file(self, batch: List[str]) -> str:
+        """
+        Nome do checkpoint de um lote, derivado do modelo e dos nomes do lote
+        """
+        digest = hashlib.sha256("\n".join([self.provider.model] + batch).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.checkpoint_dir, f"batch_{digest}.npz")
+
+    def _load_checkpoints(self) -> Dict[str, np.ndarray]:
+        """
+        Carrega os lotes já concluídos de uma execução anterior
+        """
+        vectors: Dict[str, np.ndarray] = {}
+        for path in sorted(glob.glob(os.path.join(self.checkpoint_dir, "batch_*.npz"))):
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    if str(data["model"]) != self.provider.model:
+                        continue
+                    for name, vector in zip(data["names"], data["vectors"]):
+                        vectors[str(name)] = vector
+            except Exception as e:
+                print(f"Checkpoint inválido ignorado ({path}): {e}")
+        return vectors
+
+    def _embed_pending(self, pending: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Gera embeddings para os nomes pendentes com concorrência limitada
+        """
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        results: Dict[str, np.ndarray] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {executor.submit(self._embed_batch, batch): batch for batch in batches}
+            for done, future in enumerate(as_completed(futures), start=1):
+                batch = futures[future]
+                vectors = future.result()
+                results.update(zip(batch, vectors))
+                print(f"Lote {done}/{len(batches)} concluído ({len(batch)} nomes)")
+
+        return results
+
+    def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        """
+        Gera os embeddings de um lote, com novas tentativas, e grava o checkpoint
+        """
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                vectors = np.array(self.provider.embed(batch), dtype=np.float32)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = 2 ** attempt
+                print(f"Erro ao gerar lote (tentativa {attempt}): {e}; nova tentativa em {wait}s")
+                time.sleep(wait)
+
+        # Grava num arquivo temporário e renomeia, para nunca deixar checkpoint parcial
+        path = self._checkpoint_file(batch)
+        fd, temp_path = tempfile.mkstemp(suffix=".npz", dir=self.checkpoint_dir)
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, model=np.array(self.provider.model), names=np.array(batch), vectors=vectors)
+        os.replace(temp_path, path)
+
+        return vectors
+
+    def _write_index(self) -> None:
+        """
+        Constrói e grava o índice FAISS do catálogo e seus parâmetros de forma atômica
+        """
+        index, config = build_index(load_catalog(self.output_dir), self.index_config)
+        save_index(index, self.index_path, config)
+
+    def _write_pickle(self, pickle_path: str, vectors: np.ndarray) -> None:
+        """
+        Grava a matriz de embeddings no formato pickle usado por EMBEDDINGS_PATH
+        """
+        temp_path = f"{pickle_path}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(vectors, f)
+        os.replace(temp_path, pickle_path)
+
+
+def create_provider(name: str) -> IEmbeddingProvider:
+    """
+    Cria o provedor de embeddings escolhido na linha de comando
+    """
+    if name == "local":
+        from services.embedding_providers import LocalHashEmbeddingProvider
+        return LocalHashEmbeddingProvider()
+
+    from services.embedding_providers import AzureEmbeddingProvider
+    load_dotenv()
+    return AzureEmbeddingProvider(
+        api_key=os.environ.get("AZURE_API_KEY"),
+        api_version=os.environ.get("AZURE_API_VERSION"),
+        azure_endpoint=os.environ.get("AZURE_ENDPOINT"),
+        model=os.environ.get("EMBEDDING_MODEL")
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Gera os embeddings do catálogo de produtos")
+    parser.add_argument("--names", default="persistence/nomes_unicos_padrao.txt", help="Arquivo com um nome de produto por linha")
+    parser.add_argument("--output", default="embeddings/catalogo", help="Diretório do catálogo (usado como EMBEDDINGS_PATH)")
+    parser.add_argument("--provider", default="azure", choices=("azure", "local"))
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--dtype", default="float32", choices=SUPPORTED_DTYPES)
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF: número de células (padrão automático)")
+    parser.add_argument("--checkpoint-dir", default=None)
+    parser.add_argument("--pickle", default=None, help="Também grava a matriz no formato pickle legado")
+    args = parser.parse_args(argv)
+
+    with open(args.names, "r", encoding="utf-8") as f:
+        names = f.read().split("\n")
+
+    builder = CatalogBuilder(
+        provider=create_provider(args.provider),
+        output_dir=args.output,
+        checkpoint_dir=args.checkpoint_dir,
+        batch_size=args.batch_size,
+        max_concurrency=args.concurrency,
+        dtype=args.dtype,
+        index_config=CatalogIndexConfig(index_type=args.index_type, nlist=args.nlist)
+    )
+    builder.build(names, pickle_path=args.pickle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from pydantic import BaseModel
+
+from services.catalog_store import CatalogStore, build_catalog_index, load_catalog
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# O k-means do FAISS quer pelo menos 39 pontos de treino por centróide
+MIN_POINTS_PER_CENTROID = 39
+# Abaixo disso um índice IVF não compensa (e o PQ de 8 bits não tem treino suficiente): usa flat
+IVF_MIN_VECTORS = MIN_POINTS_PER_CENTROID * 256
+
+
+class CatalogIndexConfig(BaseModel):
+    """
+    Parâmetros do índice do catálogo. Campos None são calculados a partir
+    do tamanho e da dimensão do catálogo no momento da construção.
+    """
+    index_type: str = "flat"
+    nlist: Optional[int] = None       # IVF: número de células
+    pq_m: Optional[int] = None        # IVF-PQ: subquantizadores (divide a dimensão)
+    pq_nbits: int = 8                 # IVF-PQ: bits por subquantizador
+    hnsw_m: int = 32                  # HNSW: vizinhos por nó
+    ef_construction: int = 200        # HNSW: largura da busca na construção
+    nprobe: int = 16                  # IVF: células visitadas por busca
+    ef_search: int = 64               # HNSW: largura da busca na consulta
+
+
+def params_path(index_path: str) -> str:
+    """
+    Arquivo JSON com os parâmetros persistidos junto com o índice
+    """
+    return f"{index_path}.json"
+
+
+def _default_nlist(count: int) -> int:
+    # ~4·sqrt(n) células
+    return max(1, int(4 * math.sqrt(count)))
+
+
+def _default_pq_m(dimension: int) -> int:
+    # Maior divisor da dimensão que não passa de 64 subquantizadores
+    return max(m for m in range(1, min(64, dimension) + 1) if dimension % m == 0)
+
+
+def resolve_config(config: CatalogIndexConfig, count: int, dimension: int,
+                   train_size: Optional[int] = None) -> CatalogIndexConfig:
+    """
+    Preenche os parâmetros automáticos de acordo com o catálogo. Catálogos
+    com menos de IVF_MIN_VECTORS vetores usam flat; nos demais, nlist e
+    pq_nbits (mesmo os informados) são limitados para que cada centróide
+    tenha MIN_POINTS_PER_CENTROID pontos entre os count (ou train_size) de treino.
+    """
+    if config.index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice não suportado: {config.index_type}")
+
+    resolved = config.model_copy()
+    if resolved.index_type in ("ivf_flat", "ivf_pq"):
+        if count < IVF_MIN_VECTORS:
+            print(f"Catálogo com {count} vetores (< {IVF_MIN_VECTORS}): usando índice flat em vez de {resolved.index_type}")
+            return resolved.model_copy(update={"index_type": "flat"})
+        max_centroids = min(count, train_size or count) // MIN_POINTS_PER_CENTROID
+        resolved.nlist = min(resolved.nlist or _default_nlist(count), max_centroids)
+    if resolved.index_type == "ivf_pq":
+        resolved.pq_m = resolved.pq_m or _default_pq_m(dimension)
+        resolved.pq_nbits = min(resolved.pq_nbits, int(math.log2(max_centroids)))
+    return resolved
+
+
+def create_index(dimension: int, config: CatalogIndexConfig) -> faiss.Index:
+    """
+    Cria o índice (ainda vazio) descrito pela configuração, sempre por produto interno
+    """
+    if config.index_type == "flat":
+        return faiss.IndexFlatIP(dimension)
+    if config.index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = config.ef_construction
+        return index
+
+    quantizer = faiss.IndexFlatIP(dimension)
+    if config.index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dimension, config.nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dimension, config.nlist, config.pq_m, config.pq_nbits, faiss.METRIC_INNER_PRODUCT)
+    return index
+
+
+def apply_search_params(index: faiss.Index, config: CatalogIndexConfig) -> faiss.Index:
+    """
+    Ajusta nprobe (IVF) e efSearch (HNSW) em um índice já construído ou carregado
+    """
+    try:
+        faiss.extract_index_ivf(index).nprobe = config.nprobe
+    except Exception:
+        pass
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config.ef_search
+    return index
+
+
+def training_sample(source: Union[CatalogStore, np.ndarray], train_size: int) -> np.ndarray:
+    """
+    Amostra espaçada do catálogo, para não treinar só com os primeiros produtos
+    """
+    step = max(1, len(source) // train_size)
+    if isinstance(source, CatalogStore):
+        sample = np.asarray(source.vectors[::step][:train_size], dtype=np.float32)
+        if source.scales is not None:
+            sample = sample * np.asarray(source.scales[::step][:train_size], dtype=np.float32)[:, None]
+    else:
+        sample = np.asarray(source[::step][:train_size], dtype=np.float32)
+    return np.ascontiguousarray(sample)
+
+
+def build_index(source: Union[CatalogStore, np.ndarray],
+                config: Optional[CatalogIndexConfig] = None,
+                batch_size: int = 10_000,
+                train_size: int = 100_000) -> Tuple[faiss.Index, CatalogIndexConfig]:
+    """
+    Constrói o índice do catálogo, treinando-o quando necessário e
+    adicionando os vetores em blocos.
+
+    Args:
+        source: CatalogStore mapeado em memória ou matriz de embeddings
+        config: Configuração do índice (padrão: flat)
+
+    Returns:
+        O índice e a configuração efetivamente usada (resolve_config), que
+        é a que deve ser persistida com save_index
+    """
+    config = config or CatalogIndexConfig()
+
+    if isinstance(source, CatalogStore):
+        count, dimension = source.shape
+        read = source.as_float32
+    else:
+        vectors = np.asarray(source, dtype=np.float32)
+        count, dimension = vectors.shape
+        read = lambda start=0, end=None: vectors[start:end]
+
+    config = resolve_config(config, count, dimension, train_size)
+
+    # O índice flat respeita o tipo de armazenamento do catálogo (float16/int8)
+    if config.index_type == "flat" and isinstance(source, CatalogStore):
+        return build_catalog_index(source, train_size), config
+
+    index = create_index(dimension, config)
+
+    if not index.is_trained:
+        index.train(training_sample(source, train_size))
+
+    for start in range(0, count, batch_size):
+        index.add(np.ascontiguousarray(read(start, start + batch_size)))
+
+    return apply_search_params(index, config), config
+
+
+def save_index(index: faiss.Index, index_path: str, config: CatalogIndexConfig) -> None:
+    """
+    Grava o índice e seus parâmetros de forma atômica
+    """
+    temp_path = f"{index_path}.tmp"
+    faiss.write_index(index, temp_path)
+    os.replace(temp_path, index_path)
+
+    with open(f"{params_path(index_path)}.tmp", "w", encoding="utf-8") as f:
+        json.dump(config.model_dump(), f, indent=2)
+    os.replace(f"{params_path(index_path)}.tmp", params_path(index_path))
+
+
+def load_params(index_path: str) -> Optional[CatalogIndexConfig]:
+    """
+    Lê os parâmetros persistidos de um índice, se existirem
+    """
+    path = params_path(index_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return CatalogIndexConfig(**json.load(f))
+
+
+def recall(expected: np.ndarray, found: np.ndarray) -> float:
+    """
+    Fração dos vizinhos esperados que aparecem nos resultados encontrados
+    """
+    hits = sum(len(set(e[e >= 0]) & set(f[f >= 0])) for e, f in zip(expected, found))
+    return hits / float(expected.size)
+
+
+def benchmark_queries(vectors: np.ndarray, query_count: int = 1000, seed: int = 0) -> np.ndarray:
+    """
+    Consultas de benchmark: vetores do próprio conjunto com um pequeno ruído, normalizados
+    """
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=min(query_count, len(vectors)), replace=False)]
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def timed_search(index: faiss.Index, queries: np.ndarray, k: int) -> Tuple[np.ndarray, float]:
+    """
+    Resultados da busca em lote e latência média (ms) de uma consulta por vez
+    """
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query[None, :], k)
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    _, found = index.search(queries, k)
+    return found, latency_ms
+
+
+def benchmark(vectors: np.ndarray,
+              configs: List[CatalogIndexConfig],
+              k: int = 10,
+              query_count: int = 1000,
+              seed: int = 0) -> List[Dict[str, float]]:
+    """
+    Relatório de recall x latência de cada configuração contra o índice flat.
+    As consultas são vetores do próprio catálogo com um pequeno ruído.
+
+    Returns:
+        Uma linha por configuração com recall@k, latência média por consulta
+        (ms), tempo de construção (s) e tamanho serializado do índice (bytes)
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = benchmark_queries(vectors, query_count, seed)
+    k = min(k, len(vectors))
+
+    baseline = faiss.IndexFlatIP(vectors.shape[1])
+    baseline.add(vectors)
+    _, expected = baseline.search(queries, k)
+
+    report = []
+    built: Dict[str, Tuple[faiss.Index, CatalogIndexConfig]] = {}
+    for config in configs:
+        # Só os parâmetros de busca mudam entre configurações com a mesma estrutura
+        structure = config.model_copy(update={"nprobe": 0, "ef_search": 0}).model_dump_json()
+        build_time = 0.0
+        if structure not in built:
+            start = time.perf_counter()
+            built[structure] = build_index(vectors, config)
+            build_time = time.perf_counter() - start
+        index, resolved = built[structure]
+        index = apply_search_params(index, config)
+
+        found, latency_ms = timed_search(index, queries, k)
+        report.append({
+            "index_type": resolved.index_type,
+            "nprobe": config.nprobe,
+            "ef_search": config.ef_search,
+            f"recall_at_{k}": recall(expected, found),
+            "latency_ms": latency_ms,
+            "build_s": build_time,
+            "size_bytes": int(faiss.serialize_index(index).nbytes),
+        })
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Recall x latência dos tipos de índice do catálogo")
+    parser.add_argument("--catalog", required=True, help="Diretório do catálogo (CatalogStore)")
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 64, 256])
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    vectors = load_catalog(args.catalog).as_float32()
+
+    configs = []
+    for index_type in args.types:
+        if index_type in ("ivf_flat", "ivf_pq"):
+            configs += [CatalogIndexConfig(index_type=index_type, nlist=args.nlist, nprobe=n) for n in args.nprobe]
+        elif index_type == "hnsw":
+            configs += [CatalogIndexConfig(index_type=index_type, ef_search=ef) for ef in args.ef_search]
+        else:
+            configs.append(CatalogIndexConfig(index_type=index_type))
+
+    print(f"{'tipo':<10}{'nprobe':>8}{'efSearch':>10}{'recall@' + str(args.k):>11}{'ms/consulta':>13}{'build s':>9}{'MB':>9}")
+    for row in benchmark(vectors, configs, k=args.k, query_count=args.queries):
+        print(f"{row['index_type']:<10}{row['nprobe']:>8}{row['ef_search']:>10}"
+              f"{row[f'recall_at_{args.k}']:>11.4f}{row['latency_ms']:>13.3f}"
+              f"{row['build_s']:>9.2f}{row['size_bytes'] / 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
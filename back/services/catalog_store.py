@@ -0,0 +1,320 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from collections.abc import Sequence
+from typing import Iterator, List, Optional
+
+import faiss
+import numpy as np
+
+# Arquivos que compõem um catálogo em disco
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+NAMES_FILE = "names.bin"
+OFFSETS_FILE = "names_offsets.npy"
+META_FILE = "meta.json"
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+
+class MappedNames(Sequence):
+    """
+    Lista somente leitura de nomes de produtos armazenada em um arquivo
+    UTF-8 contínuo, com offsets alinhados (uint64) para acesso direto.
+    Os dois arquivos são mapeados em memória e compartilhados entre processos.
+    """
+    def __init__(self, names_path: str, offsets_path: str):
+        self._offsets = np.load(offsets_path, mmap_mode="r")
+        # np.memmap não aceita arquivos vazios
+        if os.path.getsize(names_path) > 0:
+            self._buffer = np.memmap(names_path, dtype=np.uint8, mode="r")
+        else:
+            self._buffer = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("índice de produto fora do intervalo")
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return self._buffer[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class Float32Vectors:
+    """
+    Visão somente leitura dos vetores de um CatalogStore em float32, com as
+    escalas por vetor já aplicadas (int8). Cada acesso converte só as linhas
+    pedidas; np.asarray materializa o catálogo inteiro.
+    """
+    dtype = np.dtype(np.float32)
+    ndim = 2
+
+    def __init__(self, store: "CatalogStore"):
+        self._store = store
+
+    @property
+    def shape(self):
+        return self._store.shape
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows = self[key[0]]
+            return rows[key[1:]] if rows.ndim == 1 else rows[(slice(None),) + key[1:]]
+        block = np.asarray(self._store.vectors[key], dtype=np.float32)
+        if self._store.scales is not None:
+            block = block * np.asarray(self._store.scales[key], dtype=np.float32)[..., None]
+        return block
+
+    def __array__(self, dtype=None, copy=None):
+        block = self._store.as_float32()
+        return block if dtype is None else block.astype(dtype, copy=False)
+
+
+class CatalogStore:
+    """
+    Catálogo de produtos em disco: vetores em .npy abertos com np.memmap
+    (float32, float16 ou int8 com escala por vetor) e nomes em arquivo
+    indexado por offsets. Vários workers compartilham as mesmas páginas
+    pelo cache do sistema operacional.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.dtype = self.meta["dtype"]
+        self.vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        self.scales = None
+        if self.dtype == "int8":
+            self.scales = np.load(os.path.join(directory, SCALES_FILE), mmap_mode="r")
+        self.names = MappedNames(
+            os.path.join(directory, NAMES_FILE),
+            os.path.join(directory, OFFSETS_FILE)
+        )
+
+    @property
+    def shape(self):
+        return self.vectors.shape
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def float32_vectors(self) -> Float32Vectors:
+        """
+        Vetores decodificados para float32 sob demanda (self.vectors guarda os
+        códigos no tipo de armazenamento, sem as escalas do int8)
+        """
+        return Float32Vectors(self)
+
+    def as_float32(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """
+        Retorna as linhas [start, end) convertidas para float32
+        """
+        block = np.asarray(self.vectors[start:end], dtype=np.float32)
+        if self.scales is not None:
+            block = block * np.asarray(self.scales[start:end], dtype=np.float32)[:, None]
+        return block
+
+    def iter_float32(self, batch_size: int = 10_000) -> Iterator[np.ndarray]:
+        """
+        Percorre o catálogo em blocos float32, sem materializar tudo em memória
+        """
+        for start in range(0, len(self), batch_size):
+            yield self.as_float32(start, start + batch_size)
+
+
+def new_catalog_index(dimension: int, dtype: str = "float32") -> faiss.Index:
+    """
+    Cria um índice de produto interno compatível com o tipo de armazenamento
+    do catálogo: vetores quantizados ficam quantizados também no índice
+    """
+    if dtype == "float16":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    if dtype == "int8":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    return faiss.IndexFlatIP(dimension)
+
+
+def build_catalog_index(store: CatalogStore, train_size: int = 100_000) -> faiss.Index:
+    """
+    Constrói o índice do catálogo adicionando os vetores em blocos, sem
+    materializar o catálogo inteiro em float32
+    """
+    index = new_catalog_index(store.shape[1], store.dtype)
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(store.as_float32(0, train_size)))
+    for block in store.iter_float32():
+        index.add(np.ascontiguousarray(block))
+    return index
+
+
+def is_catalog_dir(path: str) -> bool:
+    """
+    Indica se o caminho aponta para um catálogo no formato do CatalogStore
+    """
+    return bool(path) and os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def quantize(embeddings: np.ndarray, dtype: str):
+    """
+    Converte embeddings float32 para o tipo de armazenamento escolhido.
+
+    Returns:
+        Tupla (vetores, escalas); escalas só existem para int8
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Tipo de armazenamento não suportado: {dtype}")
+
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype == "float32":
+        return embeddings, None
+    if dtype == "float16":
+        return embeddings.astype(np.float16), None
+
+    # int8 simétrico com uma escala por vetor
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def save_catalog(directory: str, embeddings: np.ndarray, names: List[str], dtype: str = "float32", **extra_meta) -> str:
+    """
+    Grava o catálogo de forma atômica: os arquivos são escritos num diretório
+    temporário e só então substituem o diretório de destino.
+
+    Args:
+        directory: Diretório de destino
+        embeddings: Matriz (n, dimensão) de embeddings
+        names: Nomes dos produtos, alinhados com as linhas de embeddings
+        dtype: float32, float16 ou int8
+
+    Returns:
+        Caminho do diretório gravado
+    """
+    if len(names) != len(embeddings):
+        raise ValueError(f"Quantidade de nomes ({len(names)}) difere da de embeddings ({len(embeddings)})")
+
+    vectors, scales = quantize(embeddings, dtype)
+
+    directory = os.path.abspath(directory)
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix=".catalog_", dir=parent)
+
+    try:
+        np.save(os.path.join(temp_dir, VECTORS_FILE), vectors)
+        if scales is not None:
+            np.save(os.path.join(temp_dir, SCALES_FILE), scales)
+
+        encoded = [name.encode("utf-8") for name in names]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        offsets[1:] = np.cumsum([len(name) for name in encoded], dtype=np.uint64)
+        with open(os.path.join(temp_dir, NAMES_FILE), "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(os.path.join(temp_dir, OFFSETS_FILE), offsets)
+
+        meta = {
+            "dtype": dtype,
+            "count": int(vectors.shape[0]),
+            "dimension": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        }
+        meta.update(extra_meta)
+        with open(os.path.join(temp_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        # Troca o diretório antigo pelo novo; leitores com memmap aberto
+        # continuam vendo os arquivos antigos até fecharem
+        if os.path.exists(directory):
+            old_dir = tempfile.mkdtemp(prefix=".catalog_old_", dir=parent)
+            os.replace(directory, os.path.join(old_dir, "catalog"))
+            os.replace(temp_dir, directory)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(temp_dir, directory)
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    return directory
+
+
+def load_catalog(directory: str) -> CatalogStore:
+    """
+    Abre um catálogo gravado por save_catalog
+    """
+    return CatalogStore(directory)
+
+
+def recall_at_k(embeddings: np.ndarray, dtype: str, k: int = 10, sample_size: int = 1000, seed: int = 0) -> float:
+    """
+    Mede o recall@k da busca sobre vetores quantizados em relação à busca
+    float32 exata, usando uma amostra do próprio catálogo como consultas.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    k = min(k, len(embeddings))
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(embeddings), size=min(sample_size, len(embeddings)), replace=False)
+    queries = embeddings[sample]
+
+    baseline = faiss.IndexFlatIP(embeddings.shape[1])
+    baseline.add(embeddings)
+    _, expected = baseline.search(queries, k)
+
+    vectors, scales = quantize(embeddings, dtype)
+    restored = vectors.astype(np.float32)
+    if scales is not None:
+        restored = restored * scales[:, None]
+    candidate = faiss.IndexFlatIP(embeddings.shape[1])
+    candidate.add(np.ascontiguousarray(restored))
+    _, found = candidate.search(queries, k)
+
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return hits / float(expected.size)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Converte o pickle de embeddings + arquivo de nomes para o formato do CatalogStore
+    """
+    parser = argparse.ArgumentParser(description="Converte o catálogo de produtos para arquivos mapeados em memória")
+    parser.add_argument("--embeddings", required=True, help="Pickle com a matriz de embeddings do catálogo")
+    parser.add_argument("--names", required=True, help="Arquivo texto com um nome de produto por linha")
+    parser.add_argument("--output", required=True, help="Diretório de saída do catálogo")
+    parser.add_argument("--dtype", default="float32", choices=SUPPORTED_DTYPES)
+    parser.add_argument("--recall-k", type=int, default=10, help="k usado na verificação de recall")
+    args = parser.parse_args(argv)
+
+    with open(args.embeddings, "rb") as f:
+        embeddings = np.asarray(pickle.load(f), dtype=np.float32)
+    with open(args.names, "r", encoding="utf-8") as f:
+        names = [line for line in f.read().split("\n") if line.strip()]
+
+    extra_meta = {}
+    if args.dtype != "float32":
+        recall = recall_at_k(embeddings, args.dtype, k=args.recall_k)
+        extra_meta[f"recall_at_{args.recall_k}"] = recall
+        print(f"Recall@{args.recall_k} de {args.dtype} em relação a float32: {recall:.4f}")
+
+    save_catalog(args.output, embeddings, names, dtype=args.dtype, **extra_meta)
+    print(f"Catálogo com {len(names)} produtos salvo em {args.output} ({args.dtype})")
+
+
+if __name__ == "__main__":
+    main()
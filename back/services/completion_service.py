@@ -1,15 +1,39 @@
-from typing import List, Tuple, Optional
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
 from pydantic import BaseModel
 import faiss
 import numpy as np
 import pickle
 import os
+import threading
 from openai import AzureOpenAI
 import pandas as pd
+from services.embedding_cache import EmbeddingCache
+from utils.text_utils import canonicalize_text
+from services.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from services.catalog_store import CatalogStore, Float32Vectors, is_catalog_dir, load_catalog
+from services.catalog_index import (CatalogIndexConfig, apply_search_params, build_index, load_params, resolve_config,
+                                    save_index, training_sample)
+from services.dimension_reduction import DimensionReducer
 
 class ProductMatch(BaseModel):
     name: str
-    similarity: float
+    # Similaridade de cosseno (None quando só o caminho lexical avaliou o produto)
+    similarity: Optional[float] = None
+    lexical_confidence: Optional[float] = None
+
+class CatalogSnapshot(NamedTuple):
+    """
+    Versão do catálogo publicada de uma vez: nomes, vetores e índices com os mesmos ids
+    """
+    names: Sequence[str]
+    # Vetores em float32 (visão sob demanda quando vêm de um CatalogStore), já reduzidos se houver redução
+    embeddings: Union[np.ndarray, Float32Vectors]
+    index: faiss.Index
+    lexical_index: Optional[LexicalIndex]
+    catalog: Optional[CatalogStore]
+    # Redução ajustada para esta versão (None sem redução) e dimensão original dos embeddings
+    reducer: Optional[DimensionReducer]
+    source_dimension: int
 
 class EmbeddingManager:
     """
@@ -21,7 +45,12 @@ class EmbeddingManager:
                  azure_endpoint: str,
                  model: str,
                  embeddings_path: str,
-                 product_names_path: str):
+                 product_names_path: str,
+                 index_path: Optional[str] = None,
+                 cache: Optional[EmbeddingCache] = None,
+                 index_config: Optional[CatalogIndexConfig] = None,
+                 reducer: Optional[DimensionReducer] = None,
+                 lexical: bool = True):
         # Inicializa o cliente Azure OpenAI
         self.client = AzureOpenAI(
             api_key=api_key,
@@ -29,90 +58,509 @@ class EmbeddingManager:
             azure_endpoint=azure_endpoint
         )
         self.model = model
+        self.cache = cache  # Cache persistente opcional de embeddings de consulta
+        self.embeddings_path = embeddings_path
+        self.product_names_path = product_names_path
+        
+        # Índice serializado fica ao lado do arquivo de embeddings por padrão
+        self.index_path = index_path or f"{os.path.splitext(embeddings_path)[0]}.faiss"
+        self.index_config = index_config or CatalogIndexConfig()
+        self._index_lock = threading.Lock()
+        
+        # Redução opcional de dimensão, aplicada ao catálogo e às consultas (persistida ao lado do índice).
+        # self.reducer é só a configuração; a redução ajustada fica no snapshot
+        self.reducer = reducer
+        self.reducer_path = f"{os.path.splitext(self.index_path)[0]}.reducer.json"
         
-        # Carrega os dados
-        self.load_data(embeddings_path, product_names_path)
+        # Índice lexical (BM25) sobre os nomes, reconstruído sempre que os nomes são recarregados
+        self.lexical = lexical
         
-    def load_data(self, embeddings_path: str, product_names_path: str) -> None:
+        # Carrega os dados e o índice do catálogo (compartilhado por todas as buscas)
+        self.snapshot = self._load_snapshot(rebuild=False)
+    
+    @property
+    def product_names(self) -> Sequence[str]:
+        return self.snapshot.names
+    
+    @property
+    def product_embeddings(self) -> Union[np.ndarray, Float32Vectors]:
+        return self.snapshot.embeddings
+    
+    @property
+    def index(self) -> faiss.Index:
+        return self.snapshot.index
+    
+    @property
+    def lexical_index(self) -> Optional[LexicalIndex]:
+        return self.snapshot.lexical_index
+    
+    @property
+    def catalog(self) -> Optional[CatalogStore]:
+        return self.snapshot.catalog
+    
+    @property
+    def source_dimension(self) -> int:
+        return self.snapshot.source_dimension
+    
+    def _load_snapshot(self, rebuild: bool) -> CatalogSnapshot:
+        """
+        Carrega nomes, vetores, redução e índices do catálogo sem publicá-los;
+        com rebuild o índice vetorial é sempre reconstruído
         """
-        Carrega os embeddings e nomes dos produtos dos arquivos
+        catalog, names, embeddings = self.load_data(self.embeddings_path, self.product_names_path)
+        source_dimension = embeddings.shape[1]
+        reducer, refit = self._fit_reducer(catalog, embeddings)
+        if reducer is not None:
+            embeddings = self._reduce_catalog(reducer, catalog, embeddings)
+        # Uma redução de dimensão recém-ajustada invalida o índice salvo
+        if rebuild or refit:
+            index = self._build_index(catalog, embeddings)
+        else:
+            index = self.load_index(catalog, embeddings)
+        # Os ids do índice lexical são posições em names. MappedNames é percorrido
+        # nome a nome, sem copiar o catálogo para uma lista
+        lexical_index = LexicalIndex(names) if self.lexical else None
+        return CatalogSnapshot(names, embeddings, index, lexical_index, catalog, reducer, source_dimension)
+        
+    def load_data(self, embeddings_path: str, product_names_path: str) -> Tuple[Optional[CatalogStore], Sequence[str], np.ndarray]:
+        """
+        Carrega os embeddings e nomes dos produtos dos arquivos.
+        
+        embeddings_path pode ser um diretório do CatalogStore (vetores e nomes
+        mapeados em memória, compartilhados entre workers) ou o pickle legado.
+        
+        Returns:
+            O CatalogStore (ou None com o pickle), os nomes e os vetores
+            (ainda sem a redução de dimensão)
         """
         try:
-            # Carrega embeddings
-            with open(embeddings_path, 'rb') as file:
-                self.product_embeddings = pickle.load(file)
-            
-            # Carrega nomes dos produtos
-            with open(product_names_path, 'r') as file:
-                text = file.read()
-            self.product_names = [line for line in text.split('\n') if line.strip()]
+            catalog: Optional[CatalogStore] = None
             
-            print(f"Carregados {len(self.product_names)} produtos e embeddings com formato {self.product_embeddings.shape}")
+            if is_catalog_dir(embeddings_path):
+                catalog = load_catalog(embeddings_path)
+                # Decodificados sob demanda: catalog.vectors são os códigos (int8 sem escala)
+                embeddings = catalog.float32_vectors
+                names = catalog.names
+                print(f"Catálogo mapeado em memória: {len(names)} produtos, formato {embeddings.shape} ({catalog.dtype})")
+            else:
+                # Carrega embeddings
+                with open(embeddings_path, 'rb') as file:
+                    embeddings = pickle.load(file)
+                
+                # Carrega nomes dos produtos
+                with open(product_names_path, 'r') as file:
+                    text = file.read()
+                names = [line for line in text.split('\n') if line.strip()]
+                
+                print(f"Carregados {len(names)} produtos e embeddings com formato {embeddings.shape}")
+            return catalog, names, embeddings
         except Exception as e:
             print(f"Erro ao carregar dados: {e}")
             raise ValueError(f"Falha ao carregar os dados necessários: {str(e)}")
+    
+    def _fit_reducer(self, catalog: Optional[CatalogStore], embeddings: np.ndarray) -> Tuple[Optional[DimensionReducer], bool]:
+        """
+        Redução de dimensão para estes embeddings, sempre numa instância nova
+        (a do snapshot publicado continua valendo para as buscas em andamento).
+        A redução persistida é reaproveitada se for da mesma configuração e
+        mais nova que os embeddings; senão é ajustada de novo e o índice
+        precisa ser reconstruído.
+        
+        Returns:
+            A redução (None sem redução configurada) e se ela foi ajustada agora
+        """
+        if self.reducer is None:
+            return None, False
+        
+        persisted = DimensionReducer.load(self.reducer_path)
+        if persisted is not None and persisted.method == self.reducer.method \
+                and persisted.dimensions == self.reducer.dimensions \
+                and persisted.input_dimension == embeddings.shape[1] \
+                and os.path.getmtime(self.reducer_path) >= os.path.getmtime(self.embeddings_path):
+            return persisted, False
+        
+        source = catalog if catalog is not None else np.asarray(embeddings, dtype=np.float32)
+        reducer = DimensionReducer(self.reducer.dimensions, self.reducer.method).fit(training_sample(source, 100_000))
+        try:
+            reducer.save(self.reducer_path)
+        except Exception as e:
+            print(f"Aviso: não foi possível salvar a redução de dimensão em {self.reducer_path}: {e}")
+        return reducer, True
+    
+    def _reduce_catalog(self, reducer: DimensionReducer, catalog: Optional[CatalogStore], embeddings: np.ndarray) -> np.ndarray:
+        """
+        Vetores do catálogo com a dimensão reduzida
+        """
+        # Catálogos mapeados em memória são reduzidos em blocos, sem materializar tudo em float32
+        if catalog is not None:
+            reduced = np.concatenate([reducer.apply(block) for block in catalog.iter_float32()])
+        else:
+            reduced = reducer.apply(embeddings)
+        print(f"Catálogo reduzido para {reducer.dimensions} dimensões ({reducer.method})")
+        return reduced
+    
+    def load_index(self, catalog: Optional[CatalogStore], embeddings: np.ndarray) -> faiss.Index:
+        """
+        Carrega o índice FAISS serializado do catálogo, reconstruindo-o se
+        estiver ausente, desatualizado ou incompatível com os embeddings
+        """
+        try:
+            if self._is_index_file_valid():
+                # Com IO_FLAG_MMAP os workers compartilham os códigos do índice
+                try:
+                    index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP)
+                except Exception:
+                    index = faiss.read_index(self.index_path)
+                persisted = load_params(self.index_path)
+                if index.ntotal == len(embeddings) and index.d == embeddings.shape[1] \
+                        and self._same_index_structure(persisted, index.ntotal, index.d):
+                    # nprobe/efSearch da configuração atual prevalecem sobre os persistidos
+                    index = apply_search_params(index, self.index_config)
+                    print(f"Índice do catálogo ({persisted.index_type}) carregado de {self.index_path} ({index.ntotal} vetores)")
+                    return index
+                print("Índice do catálogo incompatível com os embeddings ou a configuração, reconstruindo...")
+        except Exception as e:
+            print(f"Erro ao carregar índice do catálogo, reconstruindo: {e}")
+        
+        return self._build_index(catalog, embeddings)
+    
+    def _build_index(self, catalog: Optional[CatalogStore], embeddings: np.ndarray, save: bool = True) -> faiss.Index:
+        """
+        Constrói (e persiste) o índice do catálogo, sem publicá-lo
+        """
+        # Com redução de dimensão o índice é construído a partir dos vetores reduzidos
+        source = catalog if catalog is not None and self.reducer is None else embeddings
+        index, config = build_index(source, self.index_config)
+        
+        if save:
+            try:
+                save_index(index, self.index_path, config)
+            except Exception as e:
+                print(f"Aviso: não foi possível salvar o índice do catálogo em {self.index_path}: {e}")
+        
+        print(f"Índice do catálogo ({config.index_type}) construído com {index.ntotal} vetores")
+        return index
+    
+    def rebuild_index(self, save: bool = True) -> faiss.Index:
+        """
+        Reconstrói o índice do catálogo a partir de product_embeddings.
+        Deve ser chamado sempre que o catálogo mudar; o índice novo só
+        substitui o atual depois de pronto, então buscas em andamento
+        continuam usando o índice anterior.
+        """
+        with self._index_lock:
+            current = self.snapshot
+            index = self._build_index(current.catalog, current.embeddings, save)
+            self.snapshot = current._replace(index=index)
+            return index
+    
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+        """
+        Ajusta os parâmetros de busca do índice (IVF: nprobe; HNSW: efSearch) sem reconstruí-lo
+        """
+        update = {key: value for key, value in (("nprobe", nprobe), ("ef_search", ef_search)) if value is not None}
+        self.index_config = self.index_config.model_copy(update=update)
+        apply_search_params(self.index, self.index_config)
+    
+    def _same_index_structure(self, persisted: Optional[CatalogIndexConfig], count: int, dimension: int) -> bool:
+        """
+        Compara a estrutura do índice persistido (configuração já resolvida)
+        com a que a configuração atual resolveria para este catálogo,
+        ignorando os parâmetros de busca
+        """
+        if persisted is None:
+            return False
+        search_fields = {"nprobe", "ef_search"}
+        # Mesmo train_size padrão de build_index, que limita nlist
+        expected = resolve_config(self.index_config, count, dimension, 100_000).model_dump(exclude=search_fields)
+        return persisted.model_dump(exclude=search_fields) == expected
+    
+    def reload(self, embeddings_path: Optional[str] = None, product_names_path: Optional[str] = None) -> None:
+        """
+        Recarrega o catálogo (embeddings e nomes) e reconstrói os índices.
+        Tudo é carregado antes de ser publicado numa única atribuição, então
+        buscas em andamento nunca misturam ids do índice antigo com os nomes novos.
+        """
+        with self._index_lock:
+            self.embeddings_path = embeddings_path or self.embeddings_path
+            self.product_names_path = product_names_path or self.product_names_path
+            self.snapshot = self._load_snapshot(rebuild=True)
+    
+    def _is_index_file_valid(self) -> bool:
+        """
+        Verifica se o índice serializado existe e é mais novo que os embeddings
+        """
+        if not os.path.exists(self.index_path):
+            return False
+        return os.path.getmtime(self.index_path) >= os.path.getmtime(self.embeddings_path)
             
     def get_query_embedding(self, query_text: str) -> Optional[List[float]]:
         """
         Gera embedding para um texto de consulta
         """
+        snapshot = self.snapshot
+        if self.cache is not None:
+            cached = self.cache.get(self.model, query_text)
+            if cached is not None:
+                return self._reduce_query(cached, snapshot)
+        
         try:
             response = self.client.embeddings.create(
                 input=[query_text],
                 model=self.model
             )
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
+            if self.cache is not None:
+                self.cache.put(self.model, query_text, embedding)
+            return self._reduce_query(embedding, snapshot)
         except Exception as e:
             print(f"Erro ao gerar embedding para consulta: {e}")
             return None
+    
+    def _reduce_query(self, embedding, snapshot: CatalogSnapshot) -> List[float]:
+        """
+        Aplica a redução de dimensão do catálogo a um embedding de consulta
+        """
+        if snapshot.reducer is None:
+            return embedding.tolist() if isinstance(embedding, np.ndarray) else embedding
+        return snapshot.reducer.apply(np.asarray(embedding, dtype=np.float32))[0].tolist()
+    
+    def get_query_embeddings(self, query_texts: List[str], batch_size: int = 256,
+                             snapshot: Optional[CatalogSnapshot] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gera embeddings para vários textos usando requisições com múltiplas entradas.
+        
+        Args:
+            query_texts: Textos de consulta
+            batch_size: Quantidade máxima de textos por requisição à API
+            snapshot: Versão do catálogo cuja redução é aplicada (padrão: a publicada)
+            
+        Returns:
+            Matriz (n, dimensão) de embeddings e máscara booleana indicando as
+            linhas válidas (textos vazios ou lotes com erro ficam zerados e inválidos).
+            Com redução de dimensão, a matriz já vem na dimensão do índice.
+        """
+        # O cache e a API trabalham na dimensão original; a redução é aplicada no final
+        snapshot = snapshot or self.snapshot
+        dimension = snapshot.source_dimension
+        embeddings = np.zeros((len(query_texts), dimension), dtype=np.float32)
+        valid = np.zeros(len(query_texts), dtype=bool)
+        
+        # A API rejeita entradas vazias, então elas nem são enviadas
+        positions = [i for i, text in enumerate(query_texts) if text and text.strip()]
+        
+        # Consulta o cache antes da API; só os textos ausentes são enviados
+        if self.cache is not None and positions:
+            cached = self.cache.get_many(self.model, [query_texts[i] for i in positions])
+            missing = []
+            for position, vector in zip(positions, cached):
+                if vector is not None and vector.shape[0] == dimension:
+                    embeddings[position] = vector
+                    valid[position] = True
+                else:
+                    missing.append(position)
+            positions = missing
+        
+        for start in range(0, len(positions), batch_size):
+            batch_positions = positions[start:start + batch_size]
+            try:
+                response = self.client.embeddings.create(
+                    input=[query_texts[i] for i in batch_positions],
+                    model=self.model
+                )
+                # A resposta traz o índice de cada entrada; não depender da ordem
+                for item in response.data:
+                    position = batch_positions[item.index]
+                    embeddings[position] = item.embedding
+                    valid[position] = True
+                
+                # Só entram no cache as entradas que a resposta trouxe; as omitidas continuam zeradas
+                returned = [i for i in batch_positions if valid[i]]
+                if self.cache is not None and returned:
+                    self.cache.put_many(
+                        self.model,
+                        [query_texts[i] for i in returned],
+                        embeddings[returned]
+                    )
+            except Exception as e:
+                print(f"Erro ao gerar embeddings para o lote iniciado em {start}: {e}")
+        
+        if snapshot.reducer is not None:
+            embeddings = snapshot.reducer.apply(embeddings)
+        return embeddings, valid
 
 
 class ProductSearchEngine:
     """
     Classe responsável por realizar buscas de produtos similares
     """
-    def __init__(self, embedding_manager: EmbeddingManager):
+    def __init__(self,
+                 embedding_manager: EmbeddingManager,
+                 lexical_index: Optional[LexicalIndex] = None,
+                 use_lexical: bool = True,
+                 lexical_threshold: float = 0.9,
+                 fusion_candidates: int = 10):
         self.embedding_manager = embedding_manager
         
+        # Índice lexical (BM25) sobre os nomes do catálogo: correspondências quase
+        # exatas são resolvidas sem chamar a API de embeddings. Por padrão é o do
+        # EmbeddingManager, que o reconstrói junto com os nomes a cada recarga
+        self._lexical_index = lexical_index
+        self.use_lexical = use_lexical
+        self.lexical_threshold = lexical_threshold
+        self.fusion_candidates = fusion_candidates
+    
+    def _lexical(self, snapshot: CatalogSnapshot) -> Optional[LexicalIndex]:
+        if not self.use_lexical:
+            return None
+        return self._lexical_index if self._lexical_index is not None else snapshot.lexical_index
+        
     def search_similar_products(self, query_text: str, top_k: int = 5) -> List[ProductMatch]:
         """
         Busca produtos similares à consulta
         """
-        # Obtém embedding para a consulta
-        query_embedding = self.embedding_manager.get_query_embedding(query_text)
+        snapshot = self.embedding_manager.snapshot
+        matches, valid = self.match_products_batch([query_text], top_k=top_k, batch_size=1, snapshot=snapshot)
         
-        if query_embedding is None:
+        if not valid[0]:
             raise ValueError("Falha ao gerar embedding para a consulta")
         
-        # Converte para array numpy e normaliza
-        query_embedding_array = np.array([query_embedding], dtype=np.float32)
-        faiss.normalize_L2(query_embedding_array)
+        return [
+            ProductMatch(
+                name=snapshot.names[idx],
+                similarity=None if np.isnan(similarity) else similarity,
+                lexical_confidence=None if np.isnan(confidence) else confidence
+            )
+            for idx, similarity, confidence in matches[0]
+        ]
+    
+    def _is_accepted(self, similarity, lexical_confidence, threshold: float):
+        """
+        Um candidato é aceito pela similaridade de cosseno acima de threshold
+        ou pela confiança lexical a partir de lexical_threshold (NaN nunca passa);
+        aceita escalares ou arrays
+        """
+        return (np.nan_to_num(similarity, nan=-np.inf) > threshold) | \
+            (np.nan_to_num(lexical_confidence, nan=-np.inf) >= self.lexical_threshold)
+    
+    def match_products_batch(self, query_texts: List[str], top_k: int = 1, batch_size: int = 256,
+                             snapshot: Optional[CatalogSnapshot] = None) -> Tuple[List[List[Tuple[int, float, float]]], np.ndarray]:
+        """
+        Busca híbrida para várias consultas: o caminho lexical resolve as
+        correspondências com confiança acima de lexical_threshold; as demais
+        consultas vão para a busca vetorial em lote e seus resultados são
+        combinados com os candidatos lexicais por Reciprocal Rank Fusion.
+        
+        Os ids devolvidos são posições em snapshot.names (por padrão, a versão
+        do catálogo publicada no início da chamada).
         
-        # Cria um índice FAISS para busca rápida por similaridade
-        dimension = self.embedding_manager.product_embeddings.shape[1]
-        index = faiss.IndexFlatIP(dimension)  # Similaridade por Produto Interno
+        Returns:
+            Lista, por consulta, de triplas (índice do produto, similaridade de
+            cosseno, confiança lexical), com NaN no valor que não foi calculado
+            (cosseno nas correspondências só lexicais, confiança sem índice
+            lexical), e máscara booleana das consultas que obtiveram resultado
+        """
+        snapshot = snapshot or self.embedding_manager.snapshot
+        lexical_index = self._lexical(snapshot)
+        matches: List[List[Tuple[int, float, float]]] = [[] for _ in query_texts]
+        valid = np.zeros(len(query_texts), dtype=bool)
+        lexical_hits: List[List[Tuple[int, float]]] = [[] for _ in query_texts]
+        pending = list(range(len(query_texts)))
         
-        # Adiciona os embeddings de produtos ao índice
-        index.add(self.embedding_manager.product_embeddings)
+        if lexical_index is not None:
+            pending = []
+            for i, text in enumerate(query_texts):
+                hits, best_id, confidence = lexical_index.best_match(text, self.fusion_candidates)
+                if best_id is not None and confidence >= self.lexical_threshold:
+                    matches[i] = self._lexical_matches(lexical_index, text, hits, best_id, confidence, top_k)
+                    valid[i] = True
+                else:
+                    lexical_hits[i] = hits
+                    pending.append(i)
+            
+            if len(query_texts) > 1:
+                print(f"Caminho lexical resolveu {len(query_texts) - len(pending)} de {len(query_texts)} descrições")
+        
+        if not pending:
+            return matches, valid
+        
+        k = max(top_k, self.fusion_candidates) if lexical_index is not None else top_k
+        distances, indices, embedded = self.search_similar_products_batch(
+            [query_texts[i] for i in pending], top_k=k, batch_size=batch_size, snapshot=snapshot
+        )
+        
+        for row, i in enumerate(pending):
+            if embedded[row]:
+                matches[i] = self._fuse(
+                    lexical_index, len(snapshot.names), query_texts[i], indices[row], distances[row], lexical_hits[i], top_k
+                )
+                valid[i] = True
+            elif lexical_hits[i]:
+                # Sem embedding (serviço lento ou indisponível), usa só o resultado lexical
+                best_id = lexical_hits[i][0][0]
+                matches[i] = self._lexical_matches(
+                    lexical_index, query_texts[i], lexical_hits[i], best_id,
+                    lexical_index.confidence(query_texts[i], best_id), top_k
+                )
+                valid[i] = True
+        
+        return matches, valid
+    
+    def _lexical_matches(self, lexical_index: LexicalIndex, query_text: str, hits: List[Tuple[int, float]], best_id: int, confidence: float, top_k: int) -> List[Tuple[int, float, float]]:
+        """
+        Monta o resultado apenas lexical: sem embedding da consulta não há similaridade de cosseno
+        """
+        matches = [(best_id, np.nan, confidence)]
+        for doc_id, _ in hits:
+            if len(matches) >= top_k:
+                break
+            if doc_id != best_id:
+                matches.append((doc_id, np.nan, lexical_index.confidence(query_text, doc_id)))
+        return matches[:top_k]
+    
+    def _fuse(self, lexical_index: Optional[LexicalIndex], product_count: int, query_text: str, vector_ids: np.ndarray, vector_similarities: np.ndarray, lexical_hits: List[Tuple[int, float]], top_k: int) -> List[Tuple[int, float, float]]:
+        """
+        Combina os resultados vetoriais e lexicais com Reciprocal Rank Fusion.
+        Candidatos só lexicais ficam sem similaridade de cosseno (NaN).
+        """
+        similarities = {
+            int(idx): float(similarity)
+            for idx, similarity in zip(vector_ids, vector_similarities)
+            if 0 <= idx < product_count
+        }
+        ranked = list(similarities)
+        if lexical_hits:
+            ranked = [doc_id for doc_id, _ in reciprocal_rank_fusion([ranked, [doc_id for doc_id, _ in lexical_hits]])]
+        return [
+            (
+                doc_id,
+                similarities.get(doc_id, np.nan),
+                lexical_index.confidence(query_text, doc_id) if lexical_index is not None else np.nan
+            )
+            for doc_id in ranked[:top_k]
+        ]
+    
+    def search_similar_products_batch(self, query_texts: List[str], top_k: int = 5, batch_size: int = 256,
+                                      snapshot: Optional[CatalogSnapshot] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Busca produtos similares para várias consultas com uma única busca no índice
         
-        # Busca por produtos similares
-        distances, indices = index.search(query_embedding_array, top_k)
+        Returns:
+            Similaridades (n, top_k), índices dos produtos (n, top_k) e máscara
+            booleana das consultas cujo embedding foi gerado com sucesso
+        """
+        snapshot = snapshot or self.embedding_manager.snapshot
+        query_embeddings, valid = self.embedding_manager.get_query_embeddings(query_texts, batch_size, snapshot)
+        faiss.normalize_L2(query_embeddings)
         
-        # Obtém resultados
-        results = []
-        for i in range(len(indices[0])):
-            idx = indices[0][i]
-            similarity = float(distances[0][i])
-            if idx < len(self.embedding_manager.product_names):
-                results.append(ProductMatch(name=self.embedding_manager.product_names[idx], 
-                                             similarity=similarity))
+        distances, indices = snapshot.index.search(query_embeddings, top_k)
         
-        return results
+        return distances, indices, valid
     
-    def search(self, query: str, top_k: int = 1) -> Tuple[str, float]:
+    def search(self, query: str, top_k: int = 1) -> Tuple[str, Optional[float]]:
         """
         Método simplificado para buscar o produto mais similar
-        e retornar o nome e a similaridade
+        e retornar o nome e a similaridade (None se encontrado só pelo caminho lexical)
         """
         matches = self.search_similar_products(query, top_k)
         if matches:
@@ -122,11 +570,29 @@ class ProductSearchEngine:
     def process_dataframe(self, df: pd.DataFrame, 
                          description_column: str, 
                          threshold: float = 0.5,
-                         output_column: str = "Produto_base_db") -> pd.DataFrame:
+                         output_column: str = "Produto_base_db",
+                         batch_mode: bool = False,
+                         batch_size: int = 256,
+                         dedup: bool = True,
+                         top_k_candidates: int = 0,
+                         candidates_path: Optional[str] = None) -> pd.DataFrame:
         """
         Processa um DataFrame, buscando produtos similares para cada descrição
-        e adicionando uma coluna com o nome do produto encontrado
+        e adicionando uma coluna com o nome do produto encontrado.
+        
+        Com batch_mode=True as descrições são enviadas em lotes à API de
+        embeddings e buscadas de uma só vez no índice (ver _process_dataframe_batch).
+        Só no modo em lote:
+            dedup: descrições idênticas após canonicalização são buscadas uma única vez
+            top_k_candidates: adiciona colunas com os k melhores candidatos e similaridades
+            candidates_path: grava os k melhores candidatos de cada linha em um CSV auxiliar
         """
+        if batch_mode:
+            return self._process_dataframe_batch(
+                df, description_column, threshold, output_column, batch_size,
+                dedup, top_k_candidates, candidates_path
+            )
+        
         # Cria uma cópia do DataFrame para não modificar o original
         result_df = df.copy()
         
@@ -134,9 +600,11 @@ class ProductSearchEngine:
         if output_column not in result_df.columns:
             result_df[output_column] = ""
         
-        # Adiciona coluna para armazenar valores de similaridade
+        # Adiciona colunas para armazenar a similaridade de cosseno e a confiança lexical
         similarity_column = f"{output_column}_similarity"
+        confidence_column = f"{output_column}_lexical_confidence"
         result_df[similarity_column] = 0.0
+        result_df[confidence_column] = np.nan
         
         # Processa cada linha
         for index, row in result_df.iterrows():
@@ -144,14 +612,21 @@ class ProductSearchEngine:
             print(f"Processando: {description}")
             
             try:
-                name, similarity = self.search(description)
+                matches = self.search_similar_products(description, top_k=1)
+                if not matches:
+                    result_df.loc[index, output_column] = "nao_encontrado"
+                    continue
+                best = matches[0]
+                similarity = np.nan if best.similarity is None else best.similarity
+                confidence = np.nan if best.lexical_confidence is None else best.lexical_confidence
                 
-                # Armazenar o valor de similaridade
+                # Armazenar os valores de similaridade
                 result_df.loc[index, similarity_column] = similarity
+                result_df.loc[index, confidence_column] = confidence
                 
-                if similarity > threshold:
-                    print(f"Produto encontrado: {name} (similaridade: {similarity:.4f})")
-                    result_df.loc[index, output_column] = name
+                if self._is_accepted(similarity, confidence, threshold):
+                    print(f"Produto encontrado: {best.name} (similaridade: {similarity:.4f}, confiança lexical: {confidence:.4f})")
+                    result_df.loc[index, output_column] = best.name
                 else:
                     print(f"Produto não encontrado para: {description} (similaridade: {similarity:.4f})")
                     result_df.loc[index, output_column] = "nao_encontrado"
@@ -160,6 +635,112 @@ class ProductSearchEngine:
                 result_df.loc[index, output_column] = "erro"
                 
         return result_df
+    
+    def _process_dataframe_batch(self, df: pd.DataFrame,
+                                 description_column: str,
+                                 threshold: float,
+                                 output_column: str,
+                                 batch_size: int,
+                                 dedup: bool = True,
+                                 top_k_candidates: int = 0,
+                                 candidates_path: Optional[str] = None) -> pd.DataFrame:
+        """
+        Versão vetorizada de process_dataframe: caminho lexical para as
+        correspondências quase exatas, embeddings em requisições com múltiplas
+        entradas para o restante, uma única busca no índice e atribuição das
+        colunas de saída de uma só vez.
+        
+        Com dedup, as descrições repetidas no edital (por exemplo, lotes de
+        ampla concorrência e cota reservada ME/EPP) são agrupadas pela forma
+        canonicalizada, buscadas uma vez e o resultado é replicado para as linhas.
+        """
+        result_df = df.copy()
+        similarity_column = f"{output_column}_similarity"
+        confidence_column = f"{output_column}_lexical_confidence"
+        
+        descriptions = result_df[description_column].fillna("").astype(str)
+        
+        if descriptions.empty:
+            result_df[output_column] = pd.Series(dtype=object)
+            result_df[similarity_column] = pd.Series(dtype=float)
+            result_df[confidence_column] = pd.Series(dtype=float)
+            return result_df
+        
+        # codes[i] aponta para a consulta única usada pela linha i
+        if dedup:
+            codes, _ = pd.factorize(descriptions.map(canonicalize_text))
+            queries = descriptions.groupby(codes).first().tolist()
+        else:
+            codes = np.arange(len(descriptions))
+            queries = descriptions.tolist()
+        print(f"Processando {len(descriptions)} descrições ({len(queries)} únicas) em lotes de {batch_size}")
+        
+        k = max(1, top_k_candidates)
+        snapshot = self.embedding_manager.snapshot
+        matches, valid = self.match_products_batch(queries, top_k=k, batch_size=batch_size, snapshot=snapshot)
+        valid &= np.array([bool(match) for match in matches])
+        
+        # Matrizes (consultas únicas x k) de índices, similaridades e confianças lexicais;
+        # -1/0.0/NaN onde não há candidato, NaN onde o valor não foi calculado
+        candidate_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        candidate_similarities = np.zeros((len(queries), k), dtype=float)
+        candidate_confidences = np.full((len(queries), k), np.nan)
+        for row, match in enumerate(matches):
+            for rank, (idx, similarity, confidence) in enumerate(match[:k]):
+                candidate_ids[row, rank] = idx
+                candidate_similarities[row, rank] = similarity
+                candidate_confidences[row, rank] = confidence
+        
+        product_names = snapshot.names
+        candidate_names = np.array(
+            [[product_names[idx] if idx >= 0 else "" for idx in row] for row in candidate_ids],
+            dtype=object
+        ).reshape(len(queries), k)
+        
+        # Replica os resultados das consultas únicas para todas as linhas
+        row_valid = valid[codes]
+        best_similarity = candidate_similarities[codes, 0]
+        best_confidence = candidate_confidences[codes, 0]
+        matched = row_valid & self._is_accepted(best_similarity, best_confidence, threshold)
+        result_df[output_column] = np.where(matched, candidate_names[codes, 0], np.where(row_valid, "nao_encontrado", "erro"))
+        result_df[similarity_column] = np.where(row_valid, best_similarity, 0.0)
+        result_df[confidence_column] = np.where(row_valid, best_confidence, np.nan)
+        
+        if top_k_candidates > 0:
+            for rank in range(k):
+                result_df[f"{output_column}_candidato_{rank + 1}"] = candidate_names[codes, rank]
+                result_df[f"{output_column}_candidato_{rank + 1}_similarity"] = candidate_similarities[codes, rank]
+                result_df[f"{output_column}_candidato_{rank + 1}_lexical_confidence"] = candidate_confidences[codes, rank]
+        
+        if candidates_path:
+            self._save_candidates(candidates_path, descriptions, codes, candidate_names, candidate_similarities,
+                                  candidate_confidences, candidate_ids)
+        
+        print(f"Produtos encontrados: {int(matched.sum())} de {len(descriptions)} ({int((~row_valid).sum())} com erro)")
+        return result_df
+    
+    def _save_candidates(self, candidates_path: str, descriptions: pd.Series, codes: np.ndarray,
+                         candidate_names: np.ndarray, candidate_similarities: np.ndarray,
+                         candidate_confidences: np.ndarray, candidate_ids: np.ndarray) -> str:
+        """
+        Grava o arquivo auxiliar de candidatos: uma linha por (linha do edital, posição)
+        """
+        k = candidate_names.shape[1]
+        rows = np.repeat(np.arange(len(descriptions)), k)
+        ranks = np.tile(np.arange(1, k + 1), len(descriptions))
+        present = candidate_ids[codes].ravel() >= 0
+        
+        candidates_df = pd.DataFrame({
+            "linha": rows,
+            "descricao": np.repeat(descriptions.to_numpy(), k),
+            "posicao": ranks,
+            "produto": candidate_names[codes].ravel(),
+            "similaridade": candidate_similarities[codes].ravel(),
+            "confianca_lexical": candidate_confidences[codes].ravel(),
+        })[present]
+        candidates_df.to_csv(candidates_path, index=False)
+        print(f"Candidatos salvos em '{candidates_path}'")
+        return candidates_path
 
     def process_csv_file(self, 
                          csv_path: str, 
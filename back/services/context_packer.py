@@ -0,0 +1,150 @@
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from services.lexical_index import tokenize_pt
+from utils.text_utils import estimate_tokens
+
+# Fim de frase: pontuação seguida de espaço ou quebra de linha
+_SENTENCE_END = re.compile(r"(?<=[.;:!?])\s+|\n+")
+
+
+class PackedChunk(BaseModel):
+    chunk_id: int
+    similarity: float
+    text: str
+    tokens: int
+    trimmed: bool = False
+
+
+class PackedContext(BaseModel):
+    text: str
+    chunks: List[PackedChunk]
+    tokens_used: int
+    token_budget: int
+    dropped: int = 0
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Divide o texto em frases (ou linhas, em tabelas e listas)
+    """
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def overlap_size(previous: str, text: str, min_overlap: int = 20, max_overlap: int = 400) -> int:
+    """
+    Tamanho do trecho no início de text que repete o final de previous
+    (sobreposição do splitter entre chunks vizinhos); 0 se não houver
+    """
+    for size in range(min(len(previous), len(text), max_overlap), min_overlap - 1, -1):
+        if previous.endswith(text[:size]):
+            return size
+    return 0
+
+
+class ContextPacker:
+    """
+    Monta o contexto do prompt dentro de um orçamento de tokens (contagem
+    aproximada local). Chunks são incluídos na ordem de relevância; a
+    sobreposição com chunks vizinhos já incluídos é removida e chunks que
+    não cabem são reduzidos às frases em torno do trecho mais parecido com
+    a pergunta.
+    """
+    def __init__(self,
+                 max_tokens: int = 1500,
+                 max_chunk_tokens: Optional[int] = None,
+                 min_chunk_tokens: int = 32,
+                 chars_per_token: float = 3.5):
+        self.max_tokens = max_tokens
+        self.max_chunk_tokens = max_chunk_tokens
+        self.min_chunk_tokens = min_chunk_tokens
+        self.chars_per_token = chars_per_token
+
+    def _tokens(self, text: str) -> int:
+        return estimate_tokens(text, self.chars_per_token)
+
+    @staticmethod
+    def _header(similarity: float) -> str:
+        return f"[Similarity: {similarity:.4f}]\n"
+
+    def trim(self, query: str, text: str, max_tokens: int) -> str:
+        """
+        Reduz o texto às frases ao redor da frase que mais compartilha
+        termos com a pergunta, sem passar de max_tokens
+        """
+        sentences = split_sentences(text)
+        if not sentences:
+            return ""
+
+        query_terms = set(tokenize_pt(query))
+        scores = [len(query_terms & set(tokenize_pt(sentence))) for sentence in sentences]
+        best = max(range(len(sentences)), key=lambda i: scores[i])
+
+        first = last = best
+        used = self._tokens(sentences[best])
+        if used > max_tokens:
+            return sentences[best][:int(max_tokens * self.chars_per_token)].rstrip()
+
+        # Expande a janela alternando entre a frase seguinte e a anterior
+        grew = True
+        while grew:
+            grew = False
+            for candidate in (last + 1, first - 1):
+                if 0 <= candidate < len(sentences):
+                    cost = self._tokens(sentences[candidate]) + 1
+                    if used + cost <= max_tokens:
+                        used += cost
+                        first, last = min(first, candidate), max(last, candidate)
+                        grew = True
+        return " ".join(sentences[first:last + 1])
+
+    def pack(self, query: str, results: Sequence[Tuple[float, int]], texts: Sequence[str]) -> PackedContext:
+        """
+        Monta o contexto com os chunks recuperados
+
+        Args:
+            query: Pergunta do usuário
+            results: Pares (similaridade, id do chunk), do mais para o menos relevante
+            texts: Textos dos chunks, alinhados com results
+
+        Returns:
+            Contexto montado, chunks incluídos e tokens usados
+        """
+        packed: List[PackedChunk] = []
+        # chunk_id -> texto incluído, para detectar sobreposição entre vizinhos
+        originals = {}
+        used = 0
+        dropped = 0
+
+        for (similarity, chunk_id), text in zip(results, texts):
+            chunk_id = int(chunk_id)
+
+            # Sobreposição com o chunk anterior ou posterior já incluído
+            if chunk_id - 1 in originals:
+                text = text[overlap_size(originals[chunk_id - 1], text):].lstrip()
+            if chunk_id + 1 in originals:
+                text = text[:len(text) - overlap_size(text, originals[chunk_id + 1])].rstrip()
+            if not text.strip() or any(text in chunk.text for chunk in packed):
+                dropped += 1
+                continue
+
+            remaining = self.max_tokens - used - self._tokens(self._header(similarity))
+            allowed = min(remaining, self.max_chunk_tokens or remaining)
+            if allowed < self.min_chunk_tokens:
+                dropped += 1
+                continue
+
+            trimmed = False
+            if self._tokens(text) > allowed:
+                text = self.trim(query, text, allowed)
+                trimmed = True
+
+            tokens = self._tokens(self._header(similarity) + text)
+            used += tokens
+            originals[chunk_id] = text
+            packed.append(PackedChunk(chunk_id=chunk_id, similarity=float(similarity), text=text, tokens=tokens, trimmed=trimmed))
+
+        context = "".join(f"{self._header(chunk.similarity)}{chunk.text}\n\n" for chunk in packed)
+        return PackedContext(text=context, chunks=packed, tokens_used=used, token_budget=self.max_tokens, dropped=dropped)
@@ -0,0 +1,484 @@
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import faiss
+import numpy as np
+
+from services.catalog_index import (IVF_MIN_VECTORS, CatalogIndexConfig, apply_search_params, create_index,
+                                    resolve_config, training_sample)
+
+INDEX_FILE = "corpus.faiss"
+DB_FILE = "corpus.sqlite"
+META_FILE = "corpus.json"
+LOCK_FILE = "corpus.lock"
+
+
+def _index_ids(index: faiss.Index) -> np.ndarray:
+    """
+    Ids de todos os vetores de um índice com ids (IndexIDMap2 ou IVF)
+    """
+    if hasattr(index, "id_map"):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    ids = [
+        faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+        for list_no in range(ivf.nlist) if invlists.list_size(list_no)
+    ]
+    return np.concatenate(ids).astype(np.int64) if ids else np.empty(0, dtype=np.int64)
+
+
+def _reconstruct_ids(index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+    """
+    Vetores dos ids indicados (aproximados com ivf_pq)
+    """
+    if not hasattr(index, "id_map"):
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+    return np.vstack([index.reconstruct(int(chunk_id)) for chunk_id in ids]).astype(np.float32)
+
+
+class CorpusIndex:
+    """
+    Índice vetorial de todos os chunks de todos os editais processados,
+    com metadados por chunk (content_id, município, data) em SQLite.
+
+    Começa como um índice flat com ids (IndexIDMap2) e, ao passar de
+    ivf_threshold vetores, é migrado para IVF (ivf_flat ou ivf_pq). Os ids
+    FAISS são as chaves da tabela de chunks, então filtros por metadados
+    viram um IDSelectorBatch na busca.
+
+    Cada worker mantém o índice em memória; o save mescla com o arquivo
+    gravado pelos outros workers sob um lock exclusivo, então nenhum
+    sobrescreve os vetores que os outros adicionaram.
+
+    embedding_key identifica o modelo e a largura dos vetores; um índice
+    gravado com outra chave é descartado e os documentos são adicionados
+    de novo conforme forem reprocessados.
+    """
+    def __init__(self,
+                 directory: str,
+                 ivf_threshold: int = 200_000,
+                 ivf_config: Optional[CatalogIndexConfig] = None,
+                 save_interval: float = 60.0,
+                 embedding_key: Optional[str] = None):
+        self.directory = directory
+        self.embedding_key = embedding_key
+        self.ivf_threshold = ivf_threshold
+        self.ivf_config = ivf_config or CatalogIndexConfig(index_type="ivf_flat")
+        self.save_interval = save_interval
+        self._lock = threading.RLock()
+        self._last_save = time.monotonic()
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(directory, DB_FILE), check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " content_id TEXT PRIMARY KEY,"
+            " municipio TEXT,"
+            " date TEXT,"
+            " chunk_count INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " content_id TEXT NOT NULL,"
+            " chunk_index INTEGER NOT NULL,"
+            " text TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_content ON chunks(content_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_municipio ON documents(municipio)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_date ON documents(date)")
+
+        self.index: Optional[faiss.Index] = None
+        self.config: Optional[CatalogIndexConfig] = None
+        # Documentos cujos vetores estão no índice em memória deste worker
+        self._vector_docs: Set[str] = set()
+        self._load()
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    def __contains__(self, content_id: object) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM documents WHERE content_id = ?", (content_id,)).fetchone()
+        return row is not None
+
+    def has_vectors(self, content_id: str) -> bool:
+        """
+        Se os vetores do documento estão no índice. Um documento pode ter
+        linhas no SQLite sem vetores (worker encerrado antes do save); nesse
+        caso deve ser adicionado de novo.
+        """
+        with self._lock:
+            return content_id in self._vector_docs
+
+    def _lock_file(self):
+        """
+        Lock exclusivo entre processos para ler e gravar os arquivos do índice
+        """
+        handle = open(os.path.join(self.directory, LOCK_FILE), "a")
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        meta_path = os.path.join(self.directory, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, meta: Dict[str, Any]) -> None:
+        meta_path = os.path.join(self.directory, META_FILE)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def _read_saved_index(self):
+        """
+        Índice e configuração gravados em disco (None se ainda não existem)
+        """
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        meta = self._read_meta()
+        if meta is None or not os.path.exists(index_path):
+            return None, None
+        config = CatalogIndexConfig(**meta["config"]) if meta.get("config") else None
+        return faiss.read_index(index_path), config
+
+    def _other_embedding_key(self, meta: Optional[Dict[str, Any]]) -> Optional[str]:
+        """
+        Chave de embeddings gravada, se for diferente da configurada (índices
+        gravados antes de a chave ser registrada são aceitos)
+        """
+        saved_key = meta.get("embedding_key") if meta else None
+        if saved_key is not None and self.embedding_key is not None and saved_key != self.embedding_key:
+            return saved_key
+        return None
+
+    def _reset_saved(self, saved_key: str) -> None:
+        """
+        Descarta o índice e os metadados gravados com outra chave de embeddings
+        e grava a chave atual, para que os outros workers não os reaproveitem
+        """
+        print(f"Índice do corpus gravado com embeddings {saved_key}, atuais {self.embedding_key}: "
+              f"descartado, os documentos serão adicionados de novo quando reprocessados")
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        self._write_meta({"ntotal": 0, "config": None, "embedding_key": self.embedding_key})
+
+    def _documents_with_vectors(self, ids: np.ndarray) -> Set[str]:
+        """
+        Documentos que têm todos os seus chunks entre os ids indicados
+        """
+        present = set(ids.tolist())
+        missing = set()
+        documents = set()
+        for chunk_id, content_id in self._conn.execute("SELECT id, content_id FROM chunks"):
+            if chunk_id in present:
+                documents.add(content_id)
+            else:
+                missing.add(content_id)
+        return documents - missing
+
+    def _load(self) -> None:
+        """
+        Carrega o índice salvo. Documentos com linhas no SQLite mas sem
+        vetores no arquivo (adicionados depois do último save de algum
+        worker) ficam fora de has_vectors e são adicionados de novo quando
+        reprocessados; as linhas não são apagadas porque outro worker ainda
+        pode ter os vetores deles em memória.
+        """
+        with self._lock_file():
+            saved_key = self._other_embedding_key(self._read_meta())
+            if saved_key is not None:
+                self._reset_saved(saved_key)
+            self.index, self.config = self._read_saved_index()
+        if self.config is not None:
+            apply_search_params(self.index, self.config)
+        self._vector_docs = self._documents_with_vectors(_index_ids(self.index)) if self.index is not None else set()
+
+        documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        if documents > len(self._vector_docs):
+            print(f"Índice do corpus: {documents - len(self._vector_docs)} documentos sem vetores salvos "
+                  f"serão reindexados quando reprocessados")
+
+    def add_document(self,
+                     content_id: str,
+                     texts: Sequence[str],
+                     embeddings: np.ndarray,
+                     municipio: Optional[str] = None,
+                     date: Optional[str] = None) -> int:
+        """
+        Insere (ou substitui) os chunks de um documento no índice do corpus
+
+        Args:
+            content_id: Identificador do documento
+            texts: Chunks indexados do documento
+            embeddings: Vetores normalizados, alinhados com texts
+            municipio: Município do edital
+            date: Data do edital (ISO, padrão: hoje)
+
+        Returns:
+            Número de chunks inseridos
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(texts) != len(embeddings):
+            raise ValueError(f"Quantidade de chunks ({len(texts)}) difere da de vetores ({len(embeddings)})")
+        if self.index is not None and self.index.d != embeddings.shape[1]:
+            raise ValueError(f"Vetores com dimensão {embeddings.shape[1]}, o índice do corpus usa {self.index.d}")
+        date = date or time.strftime("%Y-%m-%d")
+
+        with self._lock:
+            if content_id in self:
+                self.remove_document(content_id)
+
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT INTO documents (content_id, municipio, date, chunk_count) VALUES (?, ?, ?, ?)",
+                    (content_id, municipio, date, len(texts))
+                )
+                ids = []
+                for chunk_index, text in enumerate(texts):
+                    cursor = self._conn.execute(
+                        "INSERT INTO chunks (content_id, chunk_index, text) VALUES (?, ?, ?)",
+                        (content_id, chunk_index, text)
+                    )
+                    ids.append(cursor.lastrowid)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(embeddings.shape[1]))
+            self.index.add_with_ids(embeddings, np.array(ids, dtype=np.int64))
+            self._vector_docs.add(content_id)
+
+            if self.config is None and self.index.ntotal >= self.ivf_threshold:
+                self._migrate_to_ivf()
+
+            self._dirty = True
+            self._maybe_save()
+        return len(texts)
+
+    def remove_document(self, content_id: str) -> int:
+        """
+        Remove os chunks de um documento do índice e dos metadados
+        """
+        with self._lock:
+            ids = self._delete_rows(content_id)
+            self._vector_docs.discard(content_id)
+            if ids and self.index is not None:
+                self.index.remove_ids(faiss.IDSelectorBatch(np.array(ids, dtype=np.int64)))
+                self._dirty = True
+            return len(ids)
+
+    def _delete_rows(self, content_id: str) -> List[int]:
+        ids = [row[0] for row in self._conn.execute("SELECT id FROM chunks WHERE content_id = ?", (content_id,))]
+        self._conn.execute("DELETE FROM chunks WHERE content_id = ?", (content_id,))
+        self._conn.execute("DELETE FROM documents WHERE content_id = ?", (content_id,))
+        return ids
+
+    def _migrate_to_ivf(self) -> None:
+        """
+        Reconstrói o índice flat como IVF, mantendo os mesmos ids
+        """
+        if self.index.ntotal < IVF_MIN_VECTORS:
+            # Poucos vetores para treinar o IVF: continua flat e tenta de novo ao crescer
+            return
+        start = time.perf_counter()
+        ids = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+
+        config = resolve_config(self.ivf_config, len(vectors), vectors.shape[1], 100_000)
+        index = create_index(vectors.shape[1], config)
+        index.train(training_sample(vectors, 100_000))
+        for offset in range(0, len(vectors), 10_000):
+            index.add_with_ids(vectors[offset:offset + 10_000], ids[offset:offset + 10_000])
+
+        self.index = apply_search_params(index, config)
+        self.config = config
+        print(f"Índice do corpus migrado para {config.index_type} (nlist={config.nlist}) "
+              f"com {len(ids)} vetores em {time.perf_counter() - start:.1f}s")
+
+    def _allowed_ids(self,
+                     content_ids: Optional[Sequence[str]],
+                     municipio: Optional[str],
+                     date_from: Optional[str],
+                     date_to: Optional[str]) -> Optional[np.ndarray]:
+        """
+        Ids dos chunks que passam pelos filtros (None quando não há filtro)
+        """
+        conditions, params = [], []
+        if content_ids:
+            conditions.append(f"d.content_id IN ({','.join('?' * len(content_ids))})")
+            params.extend(content_ids)
+        if municipio:
+            conditions.append("d.municipio = ?")
+            params.append(municipio)
+        if date_from:
+            conditions.append("d.date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("d.date <= ?")
+            params.append(date_to)
+        if not conditions:
+            return None
+
+        rows = self._conn.execute(
+            "SELECT c.id FROM chunks c JOIN documents d ON d.content_id = c.content_id WHERE " + " AND ".join(conditions),
+            params
+        ).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def search(self,
+               query_embedding: np.ndarray,
+               top_k: int = 10,
+               content_ids: Optional[Sequence[str]] = None,
+               municipio: Optional[str] = None,
+               date_from: Optional[str] = None,
+               date_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Busca os chunks mais similares em todo o corpus, opcionalmente
+        restrita a documentos, município ou intervalo de datas
+
+        Returns:
+            Hits ordenados por similaridade, com texto e metadados do chunk
+        """
+        query = np.ascontiguousarray(np.atleast_2d(query_embedding), dtype=np.float32)
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return []
+            if query.shape[1] != self.index.d:
+                raise ValueError(f"Consulta com dimensão {query.shape[1]}, o índice do corpus usa {self.index.d}; "
+                                 f"reprocesse os documentos")
+
+            allowed = self._allowed_ids(content_ids, municipio, date_from, date_to)
+            if allowed is not None and len(allowed) == 0:
+                return []
+
+            params = None
+            if allowed is not None:
+                selector = faiss.IDSelectorBatch(allowed)
+                if self.config is not None:
+                    params = faiss.SearchParametersIVF(sel=selector, nprobe=self.config.nprobe)
+                else:
+                    params = faiss.SearchParameters(sel=selector)
+            scores, ids = self.index.search(query, min(top_k, self.index.ntotal), params=params)
+
+            found = [(float(score), int(chunk_id)) for score, chunk_id in zip(scores[0], ids[0]) if chunk_id >= 0]
+            if not found:
+                return []
+            rows = self._conn.execute(
+                "SELECT c.id, c.content_id, c.chunk_index, c.text, d.municipio, d.date "
+                "FROM chunks c JOIN documents d ON d.content_id = c.content_id "
+                f"WHERE c.id IN ({','.join('?' * len(found))})",
+                [chunk_id for _, chunk_id in found]
+            ).fetchall()
+
+        by_id = {row[0]: row for row in rows}
+        hits = []
+        for score, chunk_id in found:
+            row = by_id.get(chunk_id)
+            if row is None:
+                # Vetor de um documento removido depois do último save
+                continue
+            hits.append({
+                "content_id": row[1],
+                "chunk_index": row[2],
+                "text": row[3],
+                "municipio": row[4],
+                "date": row[5],
+                "score": score,
+            })
+        return hits
+
+    def _maybe_save(self) -> None:
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def _merge_saved(self, saved: faiss.Index) -> None:
+        """
+        Incorpora ao índice em memória os vetores que outros workers
+        gravaram e descarta os de documentos removidos ou substituídos
+        (sem linhas no SQLite). Os ids vêm do AUTOINCREMENT do SQLite,
+        então são únicos entre workers.
+        """
+        valid = np.array([row[0] for row in self._conn.execute("SELECT id FROM chunks")], dtype=np.int64)
+        ours = _index_ids(self.index)
+
+        stale = np.setdiff1d(ours, valid)
+        if len(stale):
+            self.index.remove_ids(faiss.IDSelectorBatch(stale))
+
+        theirs = np.setdiff1d(np.intersect1d(_index_ids(saved), valid), ours)
+        if len(theirs):
+            self.index.add_with_ids(_reconstruct_ids(saved, theirs), theirs)
+            # Um índice flat que passou do limite com os vetores dos outros workers vira IVF
+            if self.config is None and self.index.ntotal >= self.ivf_threshold:
+                self._migrate_to_ivf()
+            print(f"Índice do corpus: {len(theirs)} vetores de outros workers incorporados")
+        self._vector_docs = self._documents_with_vectors(_index_ids(self.index))
+
+    def save(self) -> None:
+        """
+        Mescla com o índice gravado pelos outros workers e grava o resultado
+        de forma atômica, tudo sob o lock de arquivo
+        """
+        with self._lock:
+            if not self._dirty or self.index is None:
+                return
+            index_path = os.path.join(self.directory, INDEX_FILE)
+
+            with self._lock_file():
+                saved_key = self._other_embedding_key(self._read_meta())
+                if saved_key is not None:
+                    # Outro worker já passou para outros embeddings: este não sobrescreve o índice dele
+                    print(f"Índice do corpus em disco usa embeddings {saved_key}; vetores {self.embedding_key} não salvos")
+                    self._dirty = False
+                    return
+                saved, _ = self._read_saved_index()
+                if saved is not None:
+                    self._merge_saved(saved)
+
+                faiss.write_index(self.index, f"{index_path}.tmp")
+                os.replace(f"{index_path}.tmp", index_path)
+                self._write_meta({
+                    "ntotal": self.index.ntotal,
+                    "config": self.config.model_dump() if self.config else None,
+                    "embedding_key": self.embedding_key,
+                })
+
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {
+            "documents": documents,
+            "vectors": self.ntotal,
+            "index_type": self.config.index_type if self.config else "flat",
+        }
+
+    def close(self) -> None:
+        self.save()
+        with self._lock:
+            self._conn.close()
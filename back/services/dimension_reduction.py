@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from services.catalog_index import benchmark_queries, recall, timed_search, training_sample
+from services.catalog_store import load_catalog
+
+REDUCTION_METHODS = ("truncate", "pca")
+
+
+class DimensionReducer:
+    """
+    Reduz vetores de embedding para `dimensions` dimensões, aplicado da
+    mesma forma aos vetores indexados e às consultas.
+
+    - truncate: mantém as primeiras dimensões e renormaliza. É o mesmo
+      encurtamento do parâmetro `dimensions` dos modelos text-embedding-3,
+      feito localmente (serve para vetores já calculados em largura total).
+    - pca: projeção PCA ajustada sobre os próprios vetores do índice e
+      persistida junto com ele; funciona com qualquer modelo.
+    """
+    def __init__(self, dimensions: int, method: str = "pca"):
+        if method not in REDUCTION_METHODS:
+            raise ValueError(f"Método de redução deve ser um de {REDUCTION_METHODS}, recebido: {method}")
+        self.dimensions = dimensions
+        self.method = method
+        self.input_dimension: Optional[int] = None
+        self.pca: Optional[faiss.PCAMatrix] = None
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.input_dimension is not None
+
+    def fit(self, sample: np.ndarray) -> "DimensionReducer":
+        """
+        Ajusta a redução a uma amostra dos vetores do índice
+        """
+        sample = np.ascontiguousarray(sample, dtype=np.float32)
+        self.input_dimension = sample.shape[1]
+        if self.dimensions >= self.input_dimension:
+            raise ValueError(f"Dimensão reduzida ({self.dimensions}) deve ser menor que a original ({self.input_dimension})")
+        if self.method == "pca":
+            self.pca = faiss.PCAMatrix(self.input_dimension, self.dimensions)
+            self.pca.train(sample)
+        return self
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Vetores reduzidos e normalizados (float32); linhas zeradas continuam zeradas
+        """
+        vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype=np.float32)
+        if vectors.shape[1] != self.input_dimension:
+            raise ValueError(f"Vetores com dimensão {vectors.shape[1]}, esperado {self.input_dimension}")
+        if self.method == "truncate":
+            reduced = np.ascontiguousarray(vectors[:, :self.dimensions])
+        else:
+            reduced = self.pca.apply(vectors)
+            # A PCA centraliza os dados: vetores nulos (consultas inválidas) não devem virar a média
+            reduced[~vectors.any(axis=1)] = 0
+        faiss.normalize_L2(reduced)
+        return reduced
+
+    def save(self, path: str) -> None:
+        """
+        Grava a redução (parâmetros em JSON e, para PCA, a matriz) de forma atômica
+        """
+        if self.pca is not None:
+            faiss.write_VectorTransform(self.pca, f"{path}.pca.tmp")
+            os.replace(f"{path}.pca.tmp", f"{path}.pca")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"method": self.method, "dimensions": self.dimensions, "input_dimension": self.input_dimension}, f)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["DimensionReducer"]:
+        """
+        Carrega uma redução persistida, se existir
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        reducer = cls(meta["dimensions"], meta["method"])
+        reducer.input_dimension = meta["input_dimension"]
+        if reducer.method == "pca":
+            reducer.pca = faiss.read_VectorTransform(f"{path}.pca")
+        return reducer
+
+
+def benchmark_dimensions(vectors: np.ndarray,
+                         dimensions: Sequence[int],
+                         methods: Sequence[str] = REDUCTION_METHODS,
+                         k: int = 10,
+                         query_count: int = 1000,
+                         train_size: int = 100_000,
+                         seed: int = 0) -> List[Dict[str, float]]:
+    """
+    Recall@k da busca flat com vetores reduzidos contra a busca com os
+    vetores em largura total, junto com memória e latência. As consultas são
+    vetores do próprio conjunto com um pequeno ruído.
+
+    Returns:
+        Uma linha por (método, dimensão), mais a linha de referência
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = benchmark_queries(vectors, query_count, seed)
+    k = min(k, len(vectors))
+
+    baseline = faiss.IndexFlatIP(vectors.shape[1])
+    baseline.add(vectors)
+    expected, latency_ms = timed_search(baseline, queries, k)
+    report = [{
+        "method": "full",
+        "dimensions": vectors.shape[1],
+        f"recall_at_{k}": 1.0,
+        "latency_ms": latency_ms,
+        "fit_s": 0.0,
+        "memory_bytes": int(vectors.nbytes),
+    }]
+
+    for method in methods:
+        for dims in dimensions:
+            if dims >= vectors.shape[1]:
+                continue
+            start = time.perf_counter()
+            reducer = DimensionReducer(dims, method).fit(training_sample(vectors, train_size))
+            reduced = reducer.apply(vectors)
+            fit_s = time.perf_counter() - start
+
+            index = faiss.IndexFlatIP(dims)
+            index.add(reduced)
+            found, latency_ms = timed_search(index, reducer.apply(queries), k)
+            report.append({
+                "method": method,
+                "dimensions": dims,
+                f"recall_at_{k}": recall(expected, found),
+                "latency_ms": latency_ms,
+                "fit_s": fit_s,
+                "memory_bytes": int(reduced.nbytes),
+            })
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Recall x memória x latência de embeddings com dimensão reduzida")
+    parser.add_argument("--catalog", required=True, help="Diretório do catálogo (CatalogStore)")
+    parser.add_argument("--dimensions", nargs="+", type=int, default=[256, 512, 1024, 1536])
+    parser.add_argument("--methods", nargs="+", default=list(REDUCTION_METHODS), choices=REDUCTION_METHODS)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    vectors = load_catalog(args.catalog).as_float32()
+
+    print(f"{'método':<10}{'dims':>7}{'recall@' + str(args.k):>11}{'ms/consulta':>13}{'ajuste s':>10}{'MB':>9}")
+    for row in benchmark_dimensions(vectors, args.dimensions, args.methods, k=args.k, query_count=args.queries):
+        print(f"{row['method']:<10}{row['dimensions']:>7}{row[f'recall_at_{args.k}']:>11.4f}"
+              f"{row['latency_ms']:>13.3f}{row['fit_s']:>10.2f}{row['memory_bytes'] / 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
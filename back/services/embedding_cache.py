@@ -0,0 +1,149 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.text_utils import canonicalize_text
+
+
+class EmbeddingCache:
+    """
+    Cache persistente de embeddings em SQLite, chaveado pelo modelo de
+    embedding e pelo texto canonicalizado (caixa, acentos e espaços).
+    Mantém no máximo max_entries vetores, removendo os acessados há mais
+    tempo (LRU), e contabiliza acertos e falhas.
+    """
+    # Limite de parâmetros por consulta do SQLite
+    _MAX_PARAMS = 900
+
+    def __init__(self,
+                 path: str,
+                 max_entries: int = 200_000,
+                 canonicalize: Callable[[str], str] = canonicalize_text):
+        self.path = path
+        self.max_entries = max_entries
+        self.canonicalize = canonicalize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+
+    def make_key(self, model: str, text: str) -> str:
+        """
+        Gera a chave do cache para um par (modelo, texto canonicalizado)
+        """
+        canonical = self.canonicalize(text)
+        return hashlib.sha256(f"{model}\x00{canonical}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """
+        Retorna o embedding em cache para o texto, ou None se não existir
+        """
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Busca vários embeddings de uma vez, na mesma ordem de texts
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), self._MAX_PARAMS):
+                batch = unique_keys[start:start + self._MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time()] + [key for key, _ in rows]
+                    )
+            
+            results = [found.get(key) for key in keys]
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        
+        return results
+
+    def put(self, model: str, text: str, vector) -> None:
+        """
+        Armazena o embedding de um texto
+        """
+        self.put_many(model, [text], [vector])
+
+    def put_many(self, model: str, texts: Sequence[str], vectors) -> None:
+        """
+        Armazena vários embeddings de uma vez e aplica a política de remoção
+        """
+        now = time.time()
+        rows = [
+            (self.make_key(model, text), model, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+        
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """
+        Remove as entradas acessadas há mais tempo quando o limite é excedido
+        """
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+            self.evictions += excess
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Retorna contadores de uso do cache
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        """
+        Fecha a conexão com o banco
+        """
+        with self._lock:
+            self._conn.close()
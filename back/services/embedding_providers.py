@@ -0,0 +1,50 @@
+import hashlib
+from typing import List
+
+import numpy as np
+from openai import AzureOpenAI
+
+from interfaces.IEmbeddingProvider import IEmbeddingProvider
+from utils.text_utils import canonicalize_text
+
+
+class AzureEmbeddingProvider(IEmbeddingProvider):
+    """
+    Provedor de embeddings do Azure OpenAI, com uma requisição por lote
+    """
+    def __init__(self, api_key: str, api_version: str, azure_endpoint: str, model: str):
+        self.client = AzureOpenAI(
+            api_key=api_key,
+            api_version=api_version,
+            azure_endpoint=azure_endpoint
+        )
+        self.model = model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        # A resposta traz o índice de cada entrada; não depender da ordem
+        ordered = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in ordered]
+
+
+class LocalHashEmbeddingProvider(IEmbeddingProvider):
+    """
+    Provedor local e determinístico baseado em hashing de trigramas de
+    caracteres. Não depende de rede; serve para testes e execuções offline.
+    """
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+        self.model = f"local-hash-{dimension}"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            padded = f"  {canonicalize_text(text)} "
+            for i in range(len(padded) - 2):
+                digest = hashlib.md5(padded[i:i + 3].encode("utf-8")).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimension
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
@@ -2,7 +2,8 @@ import pandas as pd
 import json
 import re
 import os
-from typing import Dict, List, Any, Optional
+import unicodedata
+from typing import Dict, List, Any, Optional, Tuple
 
 
 class Extractor:
@@ -611,6 +612,164 @@ class RondoniaExtractor(Extractor):
         return pd.DataFrame(items)
 
 
+class GenericExtractor(Extractor):
+    """
+    Extrator genérico, usado quando o layout não corresponde a nenhum
+    município conhecido. Lê as tabelas em markdown do documento e mapeia as
+    colunas pelo cabeçalho (item, descrição, quantidade, unidade, valores).
+    """
+    # Nome da coluna de saída -> prefixos aceitos no cabeçalho (sem acentos, minúsculo)
+    COLUMNS = {
+        'ITEM': ('item', 'lote', 'n'),
+        'DESCRIÇÃO': ('descri', 'especifica', 'produto', 'objeto'),
+        'QUANTIDADE': ('quant', 'qtd', 'qtde'),
+        'UNIDADE': ('unid', 'un', 'medida', 'apresenta'),
+        'VALOR_UNITARIO': ('valor unit', 'vlr unit', 'preco unit', 'valor medio unit', 'unitario'),
+        'VALOR_TOTAL': ('valor total', 'vlr total', 'preco total', 'valor medio total', 'total'),
+    }
+
+    @staticmethod
+    def _cells(line: str) -> List[str]:
+        return [cell.strip() for cell in line.strip().strip('|').split('|')]
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        text = unicodedata.normalize('NFKD', text.lower()).encode('ASCII', 'ignore').decode('ASCII')
+        return re.sub(r'[^a-z0-9 ]', ' ', re.sub(r'\s+', ' ', text)).strip()
+
+    @staticmethod
+    def _matches(name: str, prefix: str) -> bool:
+        # Prefixos curtos ("n", "un") só valem como palavra inteira
+        return name == prefix or name.startswith(prefix + ' ') or (len(prefix) > 3 and name.startswith(prefix))
+
+    def _map_header(self, cells: List[str]) -> Dict[int, str]:
+        mapping = {}
+        for position, cell in enumerate(cells):
+            name = self._normalize(cell)
+            for column, prefixes in self.COLUMNS.items():
+                if column not in mapping.values() and any(self._matches(name, prefix) for prefix in prefixes):
+                    mapping[position] = column
+                    break
+        return mapping
+
+    def extract(self) -> pd.DataFrame:
+        """
+        Extrai as linhas das tabelas markdown cujo cabeçalho tem descrição e
+        pelo menos uma coluna de item ou quantidade.
+
+        Returns:
+            DataFrame com os dados extraídos
+        """
+        items = []
+        mapping: Dict[int, str] = {}
+
+        for line in self.content.split('\n'):
+            if not line.strip().startswith('|'):
+                mapping = {}
+                continue
+            cells = self._cells(line)
+            # Linha separadora do markdown (| --- | --- |)
+            if all(re.fullmatch(r':?-{2,}:?', cell) for cell in cells if cell):
+                continue
+
+            header = self._map_header(cells)
+            if 'DESCRIÇÃO' in header.values() and ({'ITEM', 'QUANTIDADE'} & set(header.values())):
+                mapping = header
+                continue
+            if not mapping:
+                continue
+
+            row = {column: None for column in self.COLUMNS}
+            for position, column in mapping.items():
+                if position < len(cells):
+                    row[column] = cells[position].replace('R$', '').strip() if column.startswith('VALOR') else cells[position]
+            if row['DESCRIÇÃO']:
+                items.append(row)
+
+        return pd.DataFrame(items, columns=list(self.COLUMNS))
+
+
+# Padrões de forma de linha usados na impressão digital do layout (uma passada pelas linhas)
+LINE_SHAPES = {
+    'number_only': re.compile(r'^\d{1,4}$'),
+    'unit_only': re.compile(r'^[A-Z]{2,3}$'),
+    'currency_only': re.compile(r'^(?:R\$\s*)?\d{1,3}(?:\.\d{3})*,\d{2}$'),
+    'code5_row': re.compile(r'^\d{5}\s+[0-9.,]+\s+[A-Z]+\s+\S'),
+    'attached_currency_row': re.compile(r'^\d+\s+[0-9.]+\s+R\$[0-9]'),
+    'two_spaced_currency': re.compile(r'R\$\s+[\d.,]+.*R\$\s+[\d.,]+'),
+    'three_numbers_row': re.compile(r'^\d+\s+\d+\s+\d+\s+[A-Za-z]+\s'),
+    'plain_values_row': re.compile(r'^\d+\s+\d+\.?\d*\s+\w+\s+.+\s\d+,\d+\s+\d+\.\d+,\d+$'),
+    'description_qty_unit_row': re.compile(r'^\d+\s+[^R\n]+\s+\d+\s+[A-Z]+\s+R\$'),
+    'markdown_row': re.compile(r'^\|.*\|$'),
+}
+
+# Termos de cabeçalho característicos (sem acentos, minúsculo)
+HEADER_TOKENS = {
+    'processo_administrativo': 'processo administrativo',
+    'valor_medio': 'valor medio',
+    'pregao_eletronico': 'pregao eletronico',
+}
+
+# Quantidade de linhas de um formato a partir da qual o sinal é considerado pleno
+SHAPE_SATURATION = 5
+
+# Assinatura de cada extrator: peso de cada característica (negativo penaliza)
+LAYOUT_SIGNATURES: Dict[str, Dict[str, float]] = {
+    'itumbiara': {'number_only': 0.4, 'unit_only': 0.3, 'currency_only': 0.3},
+    'cavalcante': {'number_only': 0.35, 'unit_only': 0.35, 'processo_administrativo': 0.3, 'currency_only': -0.4},
+    'padre bernardo': {'code5_row': 1.0},
+    'frutal': {'attached_currency_row': 1.0},
+    'morrinhos': {'three_numbers_row': 0.6, 'two_spaced_currency': 0.4},
+    'sao roque': {'plain_values_row': 0.7, 'valor_medio': 0.2, 'pregao_eletronico': 0.1},
+    'rondonia': {'description_qty_unit_row': 0.7, 'two_spaced_currency': 0.3, 'three_numbers_row': -0.3},
+}
+
+
+def layout_features(content: str) -> Dict[str, float]:
+    """
+    Impressão digital do layout do documento: para cada forma de linha, a
+    fração (saturada em SHAPE_SATURATION linhas) de linhas com essa forma,
+    e a presença dos termos de cabeçalho característicos
+    """
+    counts = {name: 0 for name in LINE_SHAPES}
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        for name, pattern in LINE_SHAPES.items():
+            if pattern.search(line):
+                counts[name] += 1
+
+    features = {name: min(1.0, count / SHAPE_SATURATION) for name, count in counts.items()}
+    normalized = unicodedata.normalize('NFKD', content.lower()).encode('ASCII', 'ignore').decode('ASCII')
+    for name, token in HEADER_TOKENS.items():
+        features[name] = 1.0 if token in normalized else 0.0
+    return features
+
+
+def classify_layout(content: str, min_confidence: float = 0.5) -> Tuple[str, Dict[str, float]]:
+    """
+    Escolhe o extrator pelo layout do documento, sem executar nenhuma extração
+
+    Args:
+        content: Texto do edital
+        min_confidence: Pontuação mínima para usar um extrator específico
+
+    Returns:
+        Nome do extrator para a MunicipioFactory ('generico' quando nenhum
+        atinge min_confidence) e a pontuação de cada candidato (0 a 1)
+    """
+    features = layout_features(content)
+    scores = {
+        name: round(max(0.0, min(1.0, sum(weight * features.get(feature, 0.0) for feature, weight in signature.items()))), 4)
+        for name, signature in LAYOUT_SIGNATURES.items()
+    }
+    best = max(scores, key=scores.get)
+    if scores[best] < min_confidence:
+        return 'generico', scores
+    return best, scores
+
+
 class MunicipioFactory:
     """
     Factory para criar o extrator adequado com base no município.
@@ -641,8 +800,10 @@ class MunicipioFactory:
             return FrutalExtractor(input_file)
         elif 'rondonia' in municipio or 'presidente medici' in municipio:
             return RondoniaExtractor(input_file)
-        elif 'saoroque' in municipio or 'sao roque' in municipio:
+        elif 'saoroque' in municipio or 'sao roque' in municipio or 'sao_roque' in municipio:
             return SaoRoqueExtractor(input_file)
+        elif 'generico' in municipio or 'generic' in municipio:
+            return GenericExtractor(input_file)
         else:
             raise ValueError(f"Município '{municipio}' não suportado ou não reconhecido")
 
@@ -682,4 +843,13 @@ def process_edital(municipio: str, input_file: str, output_format: str = 'csv',
         return extractor.save_to_excel(df, output_file)
 
 
-        
\ No newline at end of file
+def count_extracted_rows(output_file: str) -> int:
+    """
+    Número de linhas de dados no arquivo gerado por process_edital (0 se vazio)
+    """
+    try:
+        if output_file.lower().endswith(('.xlsx', '.xls')):
+            return len(pd.read_excel(output_file))
+        return len(pd.read_csv(output_file, encoding='utf-8-sig'))
+    except pd.errors.EmptyDataError:
+        return 0
@@ -0,0 +1,171 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.text_utils import canonicalize_text
+
+# Palavras sem valor discriminativo em descrições de itens e cláusulas
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na",
+    "nos", "nas", "com", "c", "para", "por", "um", "uma", "ou", "ao", "aos", "que",
+}
+
+# Unidades de dose/apresentação que devem ficar coladas ao número ("500 MG" -> "500mg")
+UNITS = r"(?:mcg|mg|g|kg|ml|l|ui|meq|%|cm|mm|m|fr|g/l|mg/ml|mg/g|ui/ml|mcg/ml)"
+_DECIMAL_COMMA = re.compile(r"(?<=\d),(?=\d)")
+_NUMBER_UNIT = re.compile(rf"(\d+(?:\.\d+)?)\s*({UNITS})(?![a-z])")
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9.%/]*")
+
+
+def tokenize_pt(text: str) -> List[str]:
+    """
+    Tokenizador para descrições em português do domínio farmacêutico:
+    remove acentos e caixa, normaliza vírgula decimal, junta doses às
+    unidades ("500 MG/ML" -> "500mg/ml") e também emite as partes de
+    concentrações compostas ("500mg/ml" -> "500mg", "ml").
+    """
+    text = canonicalize_text(text)
+    text = _DECIMAL_COMMA.sub(".", text)
+    text = _NUMBER_UNIT.sub(r"\1\2", text)
+
+    tokens = []
+    for token in _TOKEN.findall(text):
+        token = token.rstrip("./")
+        if not token or token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "/" in token:
+            tokens.extend(part for part in token.split("/") if part and part not in STOPWORDS)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Índice invertido BM25 em memória sobre uma lista de documentos
+    (nomes do catálogo ou chunks de um edital).
+    """
+    def __init__(self,
+                 documents: Sequence[str],
+                 k1: float = 1.5,
+                 b: float = 0.75,
+                 tokenizer: Callable[[str], List[str]] = tokenize_pt):
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer
+        self.size = len(documents)
+
+        self._doc_tokens: List[Counter] = []
+        self._exact: Dict[str, int] = {}
+        postings = defaultdict(list)
+
+        for doc_id, document in enumerate(documents):
+            counts = Counter(tokenizer(document))
+            self._doc_tokens.append(counts)
+            self._exact.setdefault(canonicalize_text(document), doc_id)
+            for token, tf in counts.items():
+                postings[token].append((doc_id, tf))
+
+        self._doc_lengths = np.array([sum(c.values()) for c in self._doc_tokens], dtype=np.float32)
+        self._avg_length = float(self._doc_lengths.mean()) if self.size else 0.0
+
+        # Postings como arrays numpy para pontuar todos os documentos de uma vez
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._idf: Dict[str, float] = {}
+        for token, entries in postings.items():
+            ids = np.array([doc_id for doc_id, _ in entries], dtype=np.int64)
+            tfs = np.array([tf for _, tf in entries], dtype=np.float32)
+            self._postings[token] = (ids, tfs)
+            df = len(entries)
+            self._idf[token] = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+        # Termos desconhecidos são tratados como os mais raros do vocabulário
+        self._max_idf = max(self._idf.values()) if self._idf else 1.0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def idf(self, token: str) -> float:
+        return self._idf.get(token, self._max_idf)
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Pontuação BM25 da consulta contra todos os documentos
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        for token, query_tf in Counter(self.tokenizer(query)).items():
+            if token not in self._postings:
+                continue
+            ids, tfs = self._postings[token]
+            norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[ids] / self._avg_length)
+            scores[ids] += query_tf * self._idf[token] * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Retorna até top_k pares (id do documento, pontuação BM25), em ordem decrescente
+        """
+        if not self.size:
+            return []
+        scores = self.scores(query)
+        top_k = min(top_k, self.size)
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in ranked if scores[doc_id] > 0]
+
+    def exact_match(self, query: str) -> Optional[int]:
+        """
+        Documento idêntico à consulta após canonicalização, se existir
+        """
+        return self._exact.get(canonicalize_text(query))
+
+    def confidence(self, query: str, doc_id: int) -> float:
+        """
+        Confiança (0 a 1) de que o documento corresponde à consulta: Dice
+        ponderado por IDF entre os termos de ambos. Vale 1.0 quando os
+        conjuntos de termos coincidem.
+        """
+        query_tokens = set(self.tokenizer(query))
+        doc_tokens = set(self._doc_tokens[doc_id])
+        if not query_tokens or not doc_tokens:
+            return 0.0
+        shared = sum(self.idf(t) for t in query_tokens & doc_tokens)
+        total = sum(self.idf(t) for t in query_tokens) + sum(self.idf(t) for t in doc_tokens)
+        return 2 * shared / total if total else 0.0
+
+    def best_match(self, query: str, top_k: int = 10) -> Tuple[List[Tuple[int, float]], Optional[int], float]:
+        """
+        Busca lexical completa para o caminho rápido.
+
+        Returns:
+            Candidatos BM25, id do melhor candidato e sua confiança
+        """
+        exact = self.exact_match(query)
+        hits = self.search(query, top_k)
+        if exact is not None:
+            return hits, exact, 1.0
+        if not hits:
+            return hits, None, 0.0
+        best_id = max((doc_id for doc_id, _ in hits[:3]), key=lambda doc_id: self.confidence(query, doc_id))
+        return hits, best_id, self.confidence(query, best_id)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60, weights: Optional[Sequence[float]] = None) -> List[Tuple[int, float]]:
+    """
+    Combina listas ordenadas de ids com Reciprocal Rank Fusion.
+
+    Args:
+        rankings: Listas de ids, cada uma da mais para a menos relevante
+        k: Constante de suavização do RRF
+        weights: Peso opcional de cada lista
+
+    Returns:
+        Pares (id, pontuação RRF) em ordem decrescente
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] += weight / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
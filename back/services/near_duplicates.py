@@ -0,0 +1,107 @@
+import hashlib
+from collections import defaultdict
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from utils.text_utils import canonicalize_text
+
+# Primo de Mersenne usado nas permutações do MinHash (a·h + b mod P)
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+def _shingles(text: str, size: int = 3) -> List[str]:
+    """
+    Sequências de `size` palavras do texto canonicalizado
+    """
+    words = canonicalize_text(text).split()
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class MinHasher:
+    """
+    Assinaturas MinHash de num_perm permutações sobre shingles de palavras.
+    A fração de posições iguais entre duas assinaturas estima a similaridade
+    de Jaccard entre os conjuntos de shingles.
+    """
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # a < 2^29 e h < 2^32 mantêm a·h + b abaixo de 2^62, sem estouro em uint64
+        self._a = rng.integers(1, 1 << 29, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 29, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = _shingles(text, self.shingle_size)
+        if not shingles:
+            return np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.uint64)
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in set(shingles)],
+            dtype=np.uint64
+        )
+        permuted = (hashes[:, None] * self._a + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+
+def find_near_duplicates(texts: Sequence[str],
+                         threshold: float = 0.85,
+                         num_perm: int = 64,
+                         bands: int = 16,
+                         shingle_size: int = 3) -> Tuple[List[int], np.ndarray]:
+    """
+    Agrupa textos quase idênticos (mesma cláusula repetida por lote ou anexo).
+    Candidatos vêm de LSH por faixas sobre as assinaturas MinHash e só são
+    unidos se o Jaccard estimado for pelo menos threshold.
+
+    Returns:
+        Posições dos representantes (primeira ocorrência de cada grupo, em
+        ordem) e, para cada texto, a linha do seu representante nessa lista
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) deve ser múltiplo de bands ({bands})")
+
+    count = len(texts)
+    hasher = MinHasher(num_perm, shingle_size)
+    signatures = np.array([hasher.signature(text) for text in texts], dtype=np.uint64).reshape(count, num_perm)
+    parent = list(range(count))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows_per_band = num_perm // bands
+    for band in range(bands):
+        buckets = defaultdict(list)
+        band_values = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for i in range(count):
+            buckets[band_values[i].tobytes()].append(i)
+        for members in buckets.values():
+            # Cada membro é comparado só com um texto de cada grupo já visto no balde
+            heads: List[int] = []
+            for j in members:
+                for i in heads:
+                    root_i, root_j = find(i), find(j)
+                    if root_i == root_j:
+                        break
+                    if np.mean(signatures[i] == signatures[j]) >= threshold:
+                        # O menor índice vira a raiz, para o representante ser a primeira ocorrência
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+                        break
+                else:
+                    heads.append(j)
+
+    representatives: List[int] = []
+    rows = {}
+    chunk_map = np.empty(count, dtype=np.int32)
+    for i in range(count):
+        root = find(i)
+        if root not in rows:
+            rows[root] = len(representatives)
+            representatives.append(root)
+        chunk_map[i] = rows[root]
+    return representatives, chunk_map
@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from services.rag_service import RAGService
+from utils.text_utils import canonicalize_text
+
+# Perguntas fixas do benchmark e o padrão (sem acentos, minúsculo) que um
+# chunk precisa conter para responder à pergunta
+BENCHMARK_QUESTIONS: List[Tuple[str, str]] = [
+    ("Qual o prazo de entrega?", r"prazo\s+(?:de|para)\s+(?:a\s+)?entrega"),
+    ("Qual a validade da proposta?", r"validade\s+(?:da|das)\s+propostas?"),
+    ("Quais documentos são exigidos para habilitação?", r"documentos?\s+(?:de|para|necessarios).{0,40}habilitacao"),
+    ("Qual o critério de julgamento?", r"criterio\s+de\s+julgamento|menor\s+preco"),
+    ("Quais são as condições de pagamento?", r"pagamento\s+(?:sera|devera|em\s+ate)"),
+    ("Quais penalidades estão previstas?", r"sancoes|penalidades|multa\s+de"),
+    ("Qual a data e o horário de abertura da sessão?", r"abertura\s+(?:da\s+sessao|das\s+propostas)|sessao\s+publica"),
+    ("Qual é o objeto da licitação?", r"objeto\s+(?:da\s+licitacao|deste|do\s+presente)"),
+    ("Existe exigência de garantia?", r"garantia\s+(?:de\s+proposta|contratual|de\s+execucao)"),
+    ("Qual o valor estimado da contratação?", r"valor\s+(?:estimado|global|total|maximo)"),
+]
+
+
+def _is_hit(texts: Sequence[str], pattern: "re.Pattern") -> bool:
+    return any(pattern.search(canonicalize_text(text)) for text in texts)
+
+
+async def benchmark_retrieval(rag: RAGService,
+                              content_ids: Sequence[str],
+                              questions: Sequence[Tuple[str, str]] = BENCHMARK_QUESTIONS,
+                              baseline_top_k: int = 1,
+                              top_k: int = 5,
+                              repeats: int = 5) -> Dict[str, Dict[str, float]]:
+    """
+    Compara a busca vetorial atual (baseline_top_k chunks) com a busca
+    híbrida (BM25 + vetores, top_k adaptativo) sobre uma lista fixa de
+    perguntas. Só contam as perguntas cuja resposta existe no documento.
+    O embedding das perguntas é gerado antes e fica fora da medição.
+
+    Returns:
+        Para cada estratégia: taxa de acerto, média de chunks enviados ao
+        LLM e latência média de recuperação (ms)
+    """
+    strategies = {
+        "vector": lambda q, emb, cid: rag.search(emb, cid, baseline_top_k),
+        "hybrid": lambda q, emb, cid: rag.hybrid_search(q, emb, cid, top_k),
+    }
+    totals = {name: {"hits": 0, "chunks": 0, "seconds": 0.0} for name in strategies}
+    evaluated = 0
+
+    for content_id in content_ids:
+        entry = rag.embeddings_cache.get(content_id)
+        if entry is None:
+            print(f"Documento {content_id} não encontrado; ignorado")
+            continue
+        for question, expected in questions:
+            pattern = re.compile(expected)
+            if not _is_hit(entry.texts, pattern):
+                continue
+            evaluated += 1
+            query_embedding = await rag.prepare_query(question)
+            for name, retrieve in strategies.items():
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    _, texts = await retrieve(question, query_embedding, content_id)
+                totals[name]["seconds"] += (time.perf_counter() - start) / repeats
+                totals[name]["chunks"] += len(texts)
+                totals[name]["hits"] += _is_hit(texts, pattern)
+
+    return {
+        name: {
+            "questions": evaluated,
+            "hit_rate": values["hits"] / evaluated if evaluated else 0.0,
+            "avg_chunks": values["chunks"] / evaluated if evaluated else 0.0,
+            "latency_ms": values["seconds"] * 1000 / evaluated if evaluated else 0.0,
+        }
+        for name, values in totals.items()
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Taxa de acerto e latência da recuperação do chat (vetorial x híbrida)")
+    parser.add_argument("--storage-dir", default=None, help="Diretório dos índices RAG (padrão: RAG_STORAGE_DIR)")
+    parser.add_argument("--content-id", nargs="*", default=None, help="Documentos avaliados (padrão: todos)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--baseline-top-k", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    from openai import AsyncAzureOpenAI
+
+    storage_dir = args.storage_dir or os.environ.get(
+        "RAG_STORAGE_DIR", os.path.join(os.environ.get("EMBEDDINGS_DIR", "embeddings"), "documentos")
+    )
+    content_ids = args.content_id or sorted(
+        name for name in os.listdir(storage_dir) if not name.startswith(".")
+    )
+    client = AsyncAzureOpenAI(
+        api_key=os.environ.get("AZURE_API_KEY"),
+        api_version=os.environ.get("AZURE_API_VERSION"),
+        azure_endpoint=os.environ.get("AZURE_ENDPOINT")
+    )
+    rag = RAGService(embedding_client=client, client=client, llm_model=os.environ.get("LLM_MODEL"), storage_dir=storage_dir)
+
+    report = asyncio.run(benchmark_retrieval(rag, content_ids, top_k=args.top_k, baseline_top_k=args.baseline_top_k))
+    print(f"{'estratégia':<12}{'perguntas':>10}{'acerto':>9}{'chunks':>9}{'ms':>9}")
+    for name, row in report.items():
+        print(f"{name:<12}{row['questions']:>10}{row['hit_rate']:>9.3f}{row['avg_chunks']:>9.2f}{row['latency_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,50 +3,143 @@ import numpy as np
 import faiss
 import pickle
 import json
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, AsyncIterator, Tuple, Optional
 from fastapi import HTTPException, UploadFile
 import tempfile
 from openai import AsyncAzureOpenAI
 from openai import AzureOpenAI
+from openai import BadRequestError
 from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
 import asyncio
 import time
 import inspect
+from services.artifact_cache import document_id
+from services.context_packer import ContextPacker, PackedContext
+from services.embedding_cache import EmbeddingCache
+from services.lexical_index import reciprocal_rank_fusion
+from services.near_duplicates import find_near_duplicates
+from services.rag_store import VECTOR_STORAGE_TYPES, DocumentIndex, DocumentIndexStore, create_document_index
+from utils.cache import TTLCache
+from utils.text_utils import canonicalize_text, estimate_tokens
 
 # Configurações
 PROMPT_DESCRIPTION = """se comporte como um agente em uma empresa de licitacoes para medicamentos hospitalares e responda as seguintes perguntas com a maior precisao:"""
 
 class RAGService:
-    def __init__(self, embedding_client, client, llm_model):
-        self.embeddings_cache = {}  # Map of content_id to embeddings data
+    def __init__(self, embedding_client, client, llm_model,
+                 storage_dir: Optional[str] = None,
+                 max_cache_bytes: int = 1024 ** 3,
+                 batch_max_items: int = 256,
+                 batch_max_tokens: int = 64_000,
+                 max_concurrent_batches: int = 4,
+                 chunk_cache: Optional[EmbeddingCache] = None,
+                 embedding_model: str = "text-embedding-3-large",
+                 embedding_dimensions: Optional[int] = None,
+                 near_duplicate_threshold: Optional[float] = 0.85,
+                 query_cache_size: int = 4096,
+                 query_cache_ttl: Optional[float] = 24 * 3600,
+                 answer_cache_size: int = 2048,
+                 answer_cache_ttl: Optional[float] = 3600,
+                 hybrid_retrieval: bool = True,
+                 fusion_candidates: int = 20,
+                 min_score_ratio: float = 0.5,
+                 context_max_tokens: int = 1500,
+                 stream_usage: bool = True,
+                 vector_storage: str = "float32"):
+        # content_id -> DocumentIndex, persisted under storage_dir and lazily loaded into a bounded LRU
+        self.embeddings_cache = DocumentIndexStore(storage_dir, max_cache_bytes)
+        # Chunks are embedded in multi-input requests limited by item count and estimated tokens
+        self.batch_max_items = batch_max_items
+        self.batch_max_tokens = batch_max_tokens
+        self.max_concurrent_batches = max_concurrent_batches
+        self.last_embedding_timings: List[Dict[str, Any]] = []
+        # Global chunk embedding store shared by all documents (boilerplate clauses repeat across editais)
+        self.chunk_cache = chunk_cache
+        self.embedding_model = embedding_model
+        # Native output dimension of text-embedding-3 models (None keeps the full width);
+        # the same value is used for chunks and questions
+        self.embedding_dimensions = embedding_dimensions
+        # How chunk vectors are stored in each document index (float32, float16 or int8)
+        if vector_storage not in VECTOR_STORAGE_TYPES:
+            raise ValueError(f"vector_storage must be one of {VECTOR_STORAGE_TYPES}, got {vector_storage!r}")
+        self.vector_storage = vector_storage
+        # Estimated Jaccard above which chunks are indexed once (None disables the pass)
+        self.near_duplicate_threshold = near_duplicate_threshold
+        # (model, normalized query) -> normalized query vector
+        self.query_cache = TTLCache(query_cache_size, query_cache_ttl)
+        # (content_id, normalized query, retrieval params) -> final answer
+        self.answer_cache = TTLCache(answer_cache_size, answer_cache_ttl)
+        # Hybrid retrieval: BM25 + vector fused by RRF, with top_k cut when fused scores drop off
+        self.hybrid_retrieval = hybrid_retrieval
+        self.fusion_candidates = fusion_candidates
+        self.min_score_ratio = min_score_ratio
+        # Retrieved chunks are packed into a token budget before reaching the prompt
+        self.context_packer = ContextPacker(max_tokens=context_max_tokens)
+        # Ask for token usage at the end of streamed answers (stream_options); turned off
+        # automatically when the configured api_version rejects it
+        self.stream_usage = stream_usage
         self._llm_model = llm_model
         self._client = client
         self._embedding_client = embedding_client
 
-    async def process_pdf(self, content, municipio) -> str:
+    async def process_pdf(self, content, municipio, content_id: Optional[str] = None, force: bool = False) -> str:
         """
-        Process a PDF file and create embeddings for RAG
+        Process a PDF file and create embeddings for RAG.
+
+        content_id identifies the document by its content (see
+        artifact_cache.document_id); when omitted it is derived from the
+        extracted text. Documents already indexed are not embedded again
+        unless force is set.
         """
+        if content_id is None:
+            content_id = document_id("", content)
+
+        # Same document already indexed (in memory or on disk) with the configured model and width:
+        # nothing to do. Entries without a recorded key are reindexed once
+        if not force and content_id in self.embeddings_cache:
+            if self.is_indexed(content_id):
+                print(f"Document {content_id} ({municipio}) already indexed; skipping embeddings")
+                return content_id
+            print(f"Document {content_id} ({municipio}) indexed with other embeddings; reindexing")
         
         # Process content to create chunks
         chunks = self._split_content(content)
         
+        # Embed and index one representative per cluster of near-identical chunks
+        chunk_map = None
+        representatives = chunks
+        if self.near_duplicate_threshold is not None and len(chunks) > 1:
+            positions, chunk_map = find_near_duplicates(chunks, threshold=self.near_duplicate_threshold)
+            representatives = [chunks[p] for p in positions]
+            print(f"Quase duplicatas: {len(chunks)} chunks, {len(representatives)} representantes indexados")
+        
         # Generate embeddings for chunks
-        embeddings_array, index = await self._generate_embeddings(chunks)
+        _, index = await self._generate_embeddings(representatives)
         
-        # Create a unique ID for this content - use the filename base
-        content_id = os.path.splitext(municipio)[0]
-        
-        # Cache the embeddings and index
-        self.embeddings_cache[content_id] = {
-            "embeddings": embeddings_array,
-            "texts": chunks,
-            "index": index,
-            "content": content
-        }
+        # Cache the index (and persist it to disk); the vectors live only inside the index and the
+        # chunks are kept as spans of the content. The lexical index is built alongside
+        entry = DocumentIndex(content, representatives, index, chunk_map, self.embedding_key)
+        if self.hybrid_retrieval:
+            # Touching the property builds BM25 now, so the first question doesn't pay for it
+            entry.lexical
+        self.embeddings_cache.put(content_id, entry)
+        self.invalidate_answers(content_id)
         
         return content_id
     
+    def is_indexed(self, content_id: str) -> bool:
+        """
+        Whether the document is indexed with the embedding model and width currently configured
+        """
+        entry = self.embeddings_cache.get(content_id)
+        return entry is not None and entry.embedding_key == self.embedding_key
+    
+    def invalidate_answers(self, content_id: str) -> int:
+        """
+        Drop cached answers of a document whose index was (re)built
+        """
+        return self.answer_cache.discard_where(lambda key: key[0] == content_id)
+    
     def _split_content(self, content: str) -> List[str]:
         """
         Split content into chunks for embedding
@@ -85,25 +178,85 @@ class RAGService:
             )
             return text_splitter.split_text(content)
     
+    def _pack_batches(self, chunks: List[str]) -> List[List[int]]:
+        """
+        Group chunk positions into batches that respect the item and token budgets
+        """
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        
+        for position, chunk in enumerate(chunks):
+            tokens = estimate_tokens(chunk)
+            if current and (len(current) >= self.batch_max_items or current_tokens + tokens > self.batch_max_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(position)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        return batches
+    
     async def _generate_embeddings(self, chunks: List[str]) -> Tuple[np.ndarray, faiss.Index]:
         """
         Gera embeddings para os chunks de texto e cria o índice FAISS de forma assíncrona.
+        Chunks já presentes no cache global (mesmo texto normalizado e modelo)
+        não são reenviados; os demais são enviados em requisições com múltiplas
+        entradas, com até max_concurrent_batches lotes em paralelo, e remontados
+        na ordem original.
         """
         start_time = time.perf_counter()
-        # Cria um semáforo para limitar concorrência
-        sem = asyncio.Semaphore(10)
-
-        async def limited_get_embedding(chunk: str):
+        embeddings: List[Optional[List[float]]] = [None] * len(chunks)
+        
+        # Chunks already embedded for any document come from the global cache
+        if self.chunk_cache is not None:
+            cached = await asyncio.to_thread(self.chunk_cache.get_many, self.embedding_key, chunks)
+            for position, vector in enumerate(cached):
+                embeddings[position] = vector
+        
+        # Only one request per distinct pending text, even if it repeats inside the document
+        pending: Dict[str, List[int]] = {}
+        for position, chunk in enumerate(chunks):
+            if embeddings[position] is None:
+                key = self.chunk_cache.make_key(self.embedding_key, chunk) if self.chunk_cache is not None else chunk
+                pending.setdefault(key, []).append(position)
+        pending_positions = list(pending.values())
+        pending_texts = [chunks[positions[0]] for positions in pending_positions]
+        
+        batches = self._pack_batches(pending_texts)
+        timings: List[Dict[str, Any]] = []
+        sem = asyncio.Semaphore(self.max_concurrent_batches)
+        
+        async def embed_batch(batch_number: int, batch: List[int]):
             async with sem:
-                return await self._get_embedding(chunk)
-
-        # Dispara as tarefas com limite de concorrência
-        tasks = [limited_get_embedding(chunk) for chunk in chunks]
-        embeddings = await asyncio.gather(*tasks)
-    
-        end_time = time.perf_counter()
-        elapsed = end_time - start_time
-        print(f"Tempo total para gerar embeddings: {elapsed:.2f} segundos")
+                batch_start = time.perf_counter()
+                texts = [pending_texts[i] for i in batch]
+                vectors = await self._get_embeddings(texts)
+                elapsed = time.perf_counter() - batch_start
+            
+            for i, vector in zip(batch, vectors):
+                for position in pending_positions[i]:
+                    embeddings[position] = vector
+            if self.chunk_cache is not None:
+                await asyncio.to_thread(self.chunk_cache.put_many, self.embedding_key, texts, vectors)
+            timings.append({
+                "batch": batch_number,
+                "items": len(batch),
+                "estimated_tokens": sum(estimate_tokens(text) for text in texts),
+                "seconds": elapsed,
+            })
+            print(f"Lote {batch_number + 1}/{len(batches)} de embeddings: {len(batch)} chunks em {elapsed:.2f} segundos")
+        
+        await asyncio.gather(*(embed_batch(n, batch) for n, batch in enumerate(batches)))
+        
+        reused = len(chunks) - sum(len(positions) for positions in pending_positions)
+        if self.chunk_cache is not None:
+            print(f"Cache de chunks: {reused}/{len(chunks)} reaproveitados; global: {self.chunk_cache.stats()}")
+        
+        self.last_embedding_timings = sorted(timings, key=lambda timing: timing["batch"])
+        elapsed = time.perf_counter() - start_time
+        print(f"Tempo total para gerar embeddings: {elapsed:.2f} segundos ({len(chunks)} chunks, {len(batches)} lotes)")
         
         # Converte para array numpy
         embeddings_array = np.array(embeddings, dtype=np.float32)
@@ -111,21 +264,49 @@ class RAGService:
         # Normaliza para similaridade cosseno
         faiss.normalize_L2(embeddings_array)
         
-        # Cria o índice FAISS
-        dimension = embeddings_array.shape[1]
-        index = faiss.IndexFlatIP(dimension)  # Produto interno (similaridade cosseno)
-        index.add(embeddings_array)
+        # Cria o índice FAISS (produto interno = similaridade cosseno), no formato configurado
+        index = create_document_index(embeddings_array, self.vector_storage)
         
         return embeddings_array, index
     
+    @property
+    def embedding_key(self) -> str:
+        """
+        Model identifier used in cache keys: vectors of different widths never mix
+        """
+        if self.embedding_dimensions:
+            return f"{self.embedding_model}@{self.embedding_dimensions}"
+        return self.embedding_model
+    
+    def _embedding_params(self) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"model": self.embedding_model}
+        if self.embedding_dimensions:
+            params["dimensions"] = self.embedding_dimensions
+        return params
+    
+    async def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Get embeddings for several texts in a single request, in input order
+        """
+        try:
+            response = await self._embedding_client.embeddings.create(
+                input=texts,
+                **self._embedding_params()
+            )
+            # The response carries each input's index; don't rely on ordering
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            print(f"Erro ao gerar embeddings em lote: {e}")
+            raise HTTPException(status_code=500, detail=f"Falha ao gerar embedding: {str(e)}")
+    
     async def _get_embedding(self, text: str) -> List[float]:
         """
         Get embedding for a single text de forma assíncrona
         """
         try:
             response = await self._embedding_client.embeddings.create(
-                model="text-embedding-3-large", # ou o modelo que você estiver usando
-                input=[text]
+                input=[text],
+                **self._embedding_params()
             )
             return response.data[0].embedding
         except Exception as e:
@@ -134,83 +315,323 @@ class RAGService:
     
     async def prepare_query(self, query: str) -> np.ndarray:
         """
-        Prepare query by converting to embedding and normalizing
+        Prepare query by converting to embedding and normalizing.
+        Repeated questions reuse the cached vector without a network call.
         """
+        key = (self.embedding_key, canonicalize_text(query))
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return cached
+        
         embedded_query = await self._get_embedding(query)
         embedded_query = np.array([embedded_query], dtype=np.float32)
         
         # Normaliza para similaridade cosseno
         faiss.normalize_L2(embedded_query)
         
+        embedded_query.setflags(write=False)
+        self.query_cache.put(key, embedded_query)
         return embedded_query
     
+    def _get_entry(self, content_id: Optional[str], query_embedding: np.ndarray) -> DocumentIndex:
+        """
+        Document index to search, checked against the width of the query vector
+        """
+        cache_entry = self.embeddings_cache.get(content_id) if content_id else None
+        if cache_entry is None:
+            raise HTTPException(status_code=404, detail=f"Content ID {content_id} not found")
+        stale_key = cache_entry.embedding_key is not None and cache_entry.embedding_key != self.embedding_key
+        if stale_key or cache_entry.index.d != query_embedding.shape[1]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Content ID {content_id} was indexed with {cache_entry.embedding_key or 'older'} embeddings "
+                       f"({cache_entry.index.d} dimensions) but questions use {self.embedding_key} "
+                       f"({query_embedding.shape[1]}); process the document again"
+            )
+        return cache_entry
+    
     async def search(self, query_embedding: np.ndarray, content_id: Optional[str], top_k: int = 5) -> Tuple[List[Tuple[float, int]], List[str]]:
         """
         Search for relevant chunks using the query embedding
         """
-        if content_id not in self.embeddings_cache:
-            raise HTTPException(status_code=404, detail=f"Content ID {content_id} not found")
-        
-        cache_entry = self.embeddings_cache[content_id]
+        cache_entry = self._get_entry(content_id, query_embedding)
         
         # Search the index
-        D, I = cache_entry["index"].search(query_embedding, top_k)
+        D, I = cache_entry.index.search(query_embedding, top_k)
         
         results = []
         retrieved_texts = []
         
         for sim, idx in zip(D[0], I[0]):
+            if idx < 0:
+                continue
             results.append((sim, idx))
-            retrieved_texts.append(cache_entry["texts"][idx])
+            retrieved_texts.append(cache_entry.texts[idx])
         
         return results, retrieved_texts
     
-    async def answer_question(self, query: str, content_id: Optional[str], max_tokens: int = 500, top_k: int = 1) -> Dict[str, Any]:
+    async def hybrid_search(self, query: str, query_embedding: np.ndarray, content_id: Optional[str], top_k: int = 5) -> Tuple[List[Tuple[float, int]], List[str]]:
+        """
+        Hybrid search: BM25 over the document's chunks fused with the vector
+        results by reciprocal rank fusion. Chunks are taken in fused order
+        until top_k, stopping early when the fused score falls below
+        min_score_ratio of the best one. Returns the same shape as search,
+        with each chunk's cosine similarity to the query.
+        """
+        cache_entry = self._get_entry(content_id, query_embedding)
+        
+        candidates = min(max(self.fusion_candidates, top_k), len(cache_entry.texts))
+        _, I = cache_entry.index.search(query_embedding, candidates)
+        vector_ids = [int(idx) for idx in I[0] if idx >= 0]
+        lexical_ids = [doc_id for doc_id, _ in cache_entry.lexical.search(query, candidates)]
+        fused = reciprocal_rank_fusion([vector_ids, lexical_ids])
+        
+        selected: List[int] = []
+        for idx, score in fused:
+            if len(selected) >= top_k or (selected and score < fused[0][1] * self.min_score_ratio):
+                break
+            selected.append(idx)
+        
+        similarities = cache_entry.vectors(selected) @ query_embedding[0] if selected else []
+        results = [(float(sim), idx) for sim, idx in zip(similarities, selected)]
+        return results, [cache_entry.texts[idx] for idx in selected]
+    
+    async def retrieve(self, query: str, query_embedding: np.ndarray, content_id: Optional[str], top_k: int = 5) -> Tuple[List[Tuple[float, int]], List[str]]:
+        """
+        Retrieval used to answer questions: hybrid when enabled, pure vector otherwise
+        """
+        if self.hybrid_retrieval:
+            return await self.hybrid_search(query, query_embedding, content_id, top_k)
+        return await self.search(query_embedding, content_id, top_k)
+    
+    async def answer_question(self, query: str, content_id: Optional[str], max_tokens: int = 500, top_k: int = 5) -> Dict[str, Any]:
         """
         Answer a question using RAG
         """
         if not content_id or content_id not in self.embeddings_cache:
             raise HTTPException(status_code=404, detail="No content available. Please upload a PDF first.")
         
+        # Same question on the same document with the same parameters: cached answer
+        answer_key = (content_id, canonicalize_text(query), top_k, max_tokens, self._llm_model)
+        cached = self.answer_cache.get(answer_key)
+        if cached is not None:
+            return dict(cached, query=query, cached=True)
+        
         # Prepare query embedding - agora assíncrono
         query_embedding = await self.prepare_query(query)
         
         # Search for relevant chunks - agora assíncrono
-        results, retrieved_texts = await self.search(query_embedding, content_id, top_k)
+        results, retrieved_texts = await self.retrieve(query, query_embedding, content_id, top_k)
         
-        # Construct context from retrieved results
-        context = ""
-        for (sim, idx), text in zip(results, retrieved_texts):
-            context += f"[Similarity: {sim:.4f}]\n{text}\n\n"
+        # Pack the retrieved chunks into the token budget and prepare chat messages for LLM
+        packed = self.context_packer.pack(query, results, retrieved_texts)
+        chat_messages = self._build_messages(query, packed)
         
-        # Prepare chat messages for LLM
-        chat_messages = [
-            {"role": "system", "content": PROMPT_DESCRIPTION},
-            {"role": "user", "content": f"Context from knowledge base:\n{context}\n\nUser query: {query}"}
-        ]
-        
-        # Get response from LLM - verificando se é assíncrono
-        if hasattr(self._client.chat.completions.create, "__await__"):
+        # Get response from LLM - cliente síncrono roda numa thread para não travar o event loop
+        if self._client_is_async():
             response = await self._client.chat.completions.create(
                 model=self._llm_model,
                 messages=chat_messages,
                 max_tokens=max_tokens
             )
         else:
-            # Fallback para síncrono se necessário
-            response = self._client.chat.completions.create(
+            response = await asyncio.to_thread(
+                self._client.chat.completions.create,
                 model=self._llm_model,
                 messages=chat_messages,
                 max_tokens=max_tokens
             )
         
         # Prepare response
-        return {
+        result = {
             "query": query,
             "response": response.choices[0].message.content,
             "context_used": [
-                {"similarity": float(sim), "text": text} 
-                for (sim, _), text in zip(results, retrieved_texts)
+                {"similarity": chunk.similarity, "text": chunk.text} 
+                for chunk in packed.chunks
+            ],
+            "similarity_scores": [chunk.similarity for chunk in packed.chunks],
+            "chunk_ids": [chunk.chunk_id for chunk in packed.chunks],
+            "context_tokens": packed.tokens_used
+        }
+        self.answer_cache.put(answer_key, result)
+        return dict(result, cached=False)
+    
+    def _build_messages(self, query: str, packed: PackedContext) -> List[Dict[str, str]]:
+        """
+        Build the chat messages from the packed context
+        """
+        return [
+            {"role": "system", "content": PROMPT_DESCRIPTION},
+            {"role": "user", "content": f"Context from knowledge base:\n{packed.text}\n\nUser query: {query}"}
+        ]
+    
+    def _client_is_async(self) -> bool:
+        """
+        Whether the chat client is asynchronous. The SDK wraps its async
+        methods in a plain function, so the original function is inspected.
+        """
+        return inspect.iscoroutinefunction(inspect.unwrap(self._client.chat.completions.create))
+    
+    async def _stream_completion(self, **kwargs) -> AsyncIterator[Any]:
+        """
+        Yield the chunks of a streamed completion. With a synchronous client
+        the stream is consumed in a worker thread so the event loop stays free.
+        """
+        if self._client_is_async():
+            stream = await self._client.chat.completions.create(stream=True, **kwargs)
+            async for chunk in stream:
+                yield chunk
+            return
+        
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        
+        def consume():
+            try:
+                for chunk in self._client.chat.completions.create(stream=True, **kwargs):
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+        
+        worker = loop.run_in_executor(None, consume)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            await worker
+    
+    async def _stream_answer_chunks(self, **kwargs) -> AsyncIterator[Any]:
+        """
+        Stream a completion, requesting token usage when stream_usage is on.
+        Older Azure api_versions reject stream_options with a 400 before any
+        chunk is sent; the request is then repeated without it.
+        """
+        if self.stream_usage:
+            started = False
+            try:
+                async for chunk in self._stream_completion(stream_options={"include_usage": True}, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except BadRequestError as e:
+                if started:
+                    raise
+                print(f"stream_options rejected by the API, streaming without usage: {e}")
+                self.stream_usage = False
+        
+        async for chunk in self._stream_completion(**kwargs):
+            yield chunk
+    
+    async def stream_answer(self, query: str, content_id: Optional[str], max_tokens: int = 500, top_k: int = 5) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of answer_question. Yields events as dicts with
+        "event" and "data":
+
+        - retrieval: retrieved chunk ids and similarity scores, sent as soon
+          as the search finishes
+        - token: a piece of the answer text
+        - done: token usage (when the service reports it) and timings
+        - error: the completion failed after streaming started
+        """
+        if not content_id or content_id not in self.embeddings_cache:
+            raise HTTPException(status_code=404, detail="No content available. Please upload a PDF first.")
+        
+        start_time = time.perf_counter()
+        answer_key = (content_id, canonicalize_text(query), top_k, max_tokens, self._llm_model)
+        cached = self.answer_cache.get(answer_key)
+        
+        if cached is not None:
+            similarity_scores = cached["similarity_scores"]
+            chunk_ids = cached.get("chunk_ids", [])
+            context_tokens = cached.get("context_tokens")
+        else:
+            query_embedding = await self.prepare_query(query)
+            results, retrieved_texts = await self.retrieve(query, query_embedding, content_id, top_k)
+            packed = self.context_packer.pack(query, results, retrieved_texts)
+            similarity_scores = [chunk.similarity for chunk in packed.chunks]
+            chunk_ids = [chunk.chunk_id for chunk in packed.chunks]
+            context_tokens = packed.tokens_used
+        retrieval_ms = (time.perf_counter() - start_time) * 1000
+        
+        yield {
+            "event": "retrieval",
+            "data": {
+                "content_id": content_id,
+                "query": query,
+                "chunk_ids": chunk_ids,
+                "similarity_scores": similarity_scores,
+                "context_tokens": context_tokens,
+                "retrieval_ms": retrieval_ms,
+                "cached": cached is not None,
+            }
+        }
+        
+        if cached is not None:
+            yield {"event": "token", "data": {"text": cached["response"]}}
+            total_ms = (time.perf_counter() - start_time) * 1000
+            yield {
+                "event": "done",
+                "data": {
+                    "usage": None,
+                    "context_tokens": context_tokens,
+                    "timings": {"retrieval_ms": retrieval_ms, "time_to_first_token_ms": total_ms, "total_ms": total_ms},
+                    "cached": True,
+                }
+            }
+            return
+        
+        parts: List[str] = []
+        usage = None
+        first_token_ms = None
+        try:
+            async for chunk in self._stream_answer_chunks(
+                model=self._llm_model,
+                messages=self._build_messages(query, packed),
+                max_tokens=max_tokens
+            ):
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage.model_dump() if hasattr(chunk.usage, "model_dump") else dict(chunk.usage)
+                for choice in chunk.choices or []:
+                    text = getattr(choice.delta, "content", None)
+                    if not text:
+                        continue
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - start_time) * 1000
+                    parts.append(text)
+                    yield {"event": "token", "data": {"text": text}}
+        except Exception as e:
+            print(f"Erro durante o streaming da resposta: {e}")
+            yield {"event": "error", "data": {"detail": str(e)}}
+            return
+        
+        total_ms = (time.perf_counter() - start_time) * 1000
+        self.answer_cache.put(answer_key, {
+            "query": query,
+            "response": "".join(parts),
+            "context_used": [
+                {"similarity": chunk.similarity, "text": chunk.text}
+                for chunk in packed.chunks
             ],
-            "similarity_scores": [float(sim) for sim, _ in results]
-        }
\ No newline at end of file
+            "similarity_scores": similarity_scores,
+            "chunk_ids": chunk_ids,
+            "context_tokens": context_tokens,
+        })
+        
+        yield {
+            "event": "done",
+            "data": {
+                "usage": usage,
+                "context_tokens": context_tokens,
+                "timings": {"retrieval_ms": retrieval_ms, "time_to_first_token_ms": first_token_ms, "total_ms": total_ms},
+                "cached": False,
+            }
+        }
@@ -0,0 +1,366 @@
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import faiss
+import numpy as np
+
+from services.lexical_index import LexicalIndex
+
+# Arquivos persistidos para cada documento
+CONTENT_FILE = "content.txt"
+INDEX_FILE = "index.faiss"
+CHUNK_MAP_FILE = "chunk_map.npy"
+CHUNK_SPANS_FILE = "chunk_spans.npy"
+CHUNK_EXTRAS_FILE = "chunk_extras.txt"
+META_FILE = "meta.json"
+# Formato antigo: lista de chunks em JSON (os vetores também ficavam num .npy à parte)
+CHUNKS_FILE = "chunks.json"
+
+# Formatos de armazenamento dos vetores no índice do documento
+VECTOR_STORAGE_TYPES = ("float32", "float16", "int8")
+
+
+def create_document_index(embeddings: np.ndarray, vector_storage: str = "float32") -> faiss.Index:
+    """
+    Índice de produto interno com os vetores (normalizados) do documento.
+    O índice é a única cópia dos vetores: float32 exato (flat), float16 ou
+    int8 por dimensão (scalar quantizer, ~1/2 e ~1/4 da memória).
+    """
+    dimension = embeddings.shape[1]
+    if vector_storage == "float32":
+        index = faiss.IndexFlatIP(dimension)
+    elif vector_storage == "float16":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    elif vector_storage == "int8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    else:
+        raise ValueError(f"vector_storage deve ser um de {VECTOR_STORAGE_TYPES}, recebido: {vector_storage}")
+    index.add(embeddings)
+    return index
+
+
+class ChunkTexts(Sequence[str]):
+    """
+    Chunks do documento guardados como intervalos (início, fim) de um único
+    buffer: o conteúdo do documento seguido dos trechos que não aparecem
+    nele literalmente (ex.: cabeçalhos removidos pelo splitter). Evita manter
+    uma segunda cópia do texto em uma lista de strings.
+    """
+    def __init__(self, buffer: str, spans: np.ndarray):
+        self.buffer = buffer
+        self.spans = spans
+
+    @classmethod
+    def from_texts(cls, content: str, texts: Sequence[str]) -> "ChunkTexts":
+        """
+        Localiza cada chunk no conteúdo; os que não forem encontrados são
+        acrescentados ao buffer depois dele
+        """
+        spans = np.empty((len(texts), 2), dtype=np.int64)
+        extras: List[str] = []
+        extras_offset = len(content)
+        cursor = 0
+        for i, text in enumerate(texts):
+            # Os chunks vêm em ordem e se sobrepõem: procura a partir do anterior
+            start = content.find(text, cursor)
+            if start < 0:
+                start = content.find(text)
+            if start < 0:
+                start = extras_offset
+                extras.append(text)
+                extras_offset += len(text)
+            else:
+                cursor = start
+            spans[i] = (start, start + len(text))
+        return cls(content + "".join(extras), spans)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self.spans[i]
+        return self.buffer[start:end]
+
+    def __iter__(self) -> Iterator[str]:
+        for start, end in self.spans:
+            yield self.buffer[start:end]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.spans.nbytes)
+
+
+class DocumentIndex:
+    """
+    Índice RAG de um documento: conteúdo, chunks e índice FAISS com os
+    vetores normalizados (que são guardados só no índice).
+    texts contém só os representantes indexados; chunk_map leva cada chunk
+    original do documento à linha do seu representante (quase duplicatas
+    compartilham a mesma linha).
+    embedding_key identifica o modelo e a largura dos vetores (None em
+    documentos gravados antes de ele ser registrado).
+    """
+    def __init__(self, content: str, texts: Union[ChunkTexts, Sequence[str]], index: faiss.Index,
+                 chunk_map: Optional[np.ndarray] = None, embedding_key: Optional[str] = None):
+        self.texts = texts if isinstance(texts, ChunkTexts) else ChunkTexts.from_texts(content, texts)
+        self.content_length = len(content)
+        self.index = index
+        self.chunk_map = chunk_map if chunk_map is not None else np.arange(len(self.texts), dtype=np.int32)
+        self.embedding_key = embedding_key
+        self._lexical: Optional[LexicalIndex] = None
+
+    @property
+    def content(self) -> str:
+        """
+        Texto completo do documento (cópia do início do buffer dos chunks)
+        """
+        return self.texts.buffer[:self.content_length]
+
+    @property
+    def extras(self) -> str:
+        """
+        Trechos de chunks que não aparecem literalmente no conteúdo
+        """
+        return self.texts.buffer[self.content_length:]
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """
+        Vetores de todos os chunks, reconstruídos do índice (float32; com
+        float16/int8 são aproximações dos originais)
+        """
+        return self.index.reconstruct_n(0, self.index.ntotal)
+
+    def vectors(self, ids: Sequence[int]) -> np.ndarray:
+        """
+        Vetores dos chunks indicados, reconstruídos do índice
+        """
+        if len(ids) == 0:
+            return np.empty((0, self.index.d), dtype=np.float32)
+        return self.index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+
+    @property
+    def lexical(self) -> LexicalIndex:
+        """
+        Índice BM25 sobre os chunks indexados, construído na primeira consulta
+        (é barato e não precisa ser persistido)
+        """
+        if self._lexical is None:
+            self._lexical = LexicalIndex(self.texts)
+        return self._lexical
+
+    @property
+    def duplicate_count(self) -> int:
+        """
+        Número de chunks que não foram indexados por serem quase duplicatas
+        """
+        return len(self.chunk_map) - len(self.texts)
+
+    @property
+    def vector_storage(self) -> str:
+        if isinstance(self.index, faiss.IndexScalarQuantizer):
+            return "float16" if self.index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+        return "float32"
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """
+        Memória ocupada pela entrada, por componente (bytes). O índice BM25,
+        construído sob demanda, não entra na conta.
+        """
+        usage = {
+            "text_bytes": sys.getsizeof(self.texts.buffer),
+            "span_bytes": self.texts.nbytes,
+            "index_bytes": self.index.ntotal * getattr(self.index, "code_size", self.index.d * 4),
+            "chunk_map_bytes": int(self.chunk_map.nbytes),
+        }
+        usage["total_bytes"] = sum(usage.values())
+        usage.update({
+            "chunks": len(self.chunk_map),
+            "indexed_chunks": len(self.texts),
+            "extras_chars": len(self.texts.buffer) - self.content_length,
+            "vector_storage": self.vector_storage,
+        })
+        return usage
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimativa da memória ocupada pela entrada
+        """
+        return self.memory_usage()["total_bytes"]
+
+
+class DocumentIndexStore:
+    """
+    Armazena os índices RAG por content_id. Cada documento é persistido em
+    storage_dir/<content_id>/ e carregado sob demanda na primeira consulta;
+    em memória fica apenas um LRU limitado a max_bytes.
+    """
+    def __init__(self, storage_dir: Optional[str] = None, max_bytes: int = 1024 ** 3):
+        self.storage_dir = storage_dir
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+        # content_id -> nbytes contabilizado quando a entrada entrou no LRU
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+        if storage_dir:
+            os.makedirs(storage_dir, exist_ok=True)
+
+    def document_path(self, content_id: str) -> Optional[str]:
+        """
+        Diretório onde os artefatos do documento são persistidos
+        """
+        if not self.storage_dir:
+            return None
+        safe_id = re.sub(r"[^\w.-]", "_", content_id).lstrip(".")
+        return os.path.join(self.storage_dir, safe_id)
+
+    def __contains__(self, content_id: object) -> bool:
+        if not isinstance(content_id, str) or not content_id:
+            return False
+        with self._lock:
+            if content_id in self._entries:
+                return True
+        path = self.document_path(content_id)
+        return bool(path) and os.path.exists(os.path.join(path, INDEX_FILE))
+
+    def get(self, content_id: str) -> Optional[DocumentIndex]:
+        """
+        Retorna o índice do documento, carregando-o do disco se necessário
+        """
+        with self._lock:
+            entry = self._entries.get(content_id)
+            if entry is not None:
+                self._entries.move_to_end(content_id)
+                return entry
+
+        entry = self._load(content_id)
+        if entry is not None:
+            self._remember(content_id, entry)
+        return entry
+
+    def __getitem__(self, content_id: str) -> DocumentIndex:
+        entry = self.get(content_id)
+        if entry is None:
+            raise KeyError(content_id)
+        return entry
+
+    def put(self, content_id: str, entry: DocumentIndex, persist: bool = True) -> None:
+        """
+        Guarda o índice do documento em memória e, se configurado, em disco
+        """
+        if persist and self.storage_dir:
+            self._save(content_id, entry)
+        self._remember(content_id, entry)
+
+    def _remember(self, content_id: str, entry: DocumentIndex) -> None:
+        with self._lock:
+            if self._entries.pop(content_id, None) is not None:
+                self._bytes -= self._sizes.pop(content_id)
+            self._entries[content_id] = entry
+            self._sizes[content_id] = entry.nbytes
+            self._bytes += self._sizes[content_id]
+            self._evict()
+
+    def _evict(self) -> None:
+        """
+        Remove da memória os documentos usados há mais tempo até caber no limite.
+        Sem storage_dir não há como recarregar, então nada é removido.
+        """
+        if not self.storage_dir:
+            return
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            content_id, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(content_id)
+            self.evictions += 1
+
+    def _save(self, content_id: str, entry: DocumentIndex) -> None:
+        """
+        Persiste os artefatos do documento de forma atômica
+        """
+        path = self.document_path(content_id)
+        temp_dir = tempfile.mkdtemp(prefix=".doc_", dir=self.storage_dir)
+        try:
+            np.save(os.path.join(temp_dir, CHUNK_MAP_FILE), entry.chunk_map)
+            np.save(os.path.join(temp_dir, CHUNK_SPANS_FILE), entry.texts.spans)
+            # newline="" preserva \r\n, senão os intervalos dos chunks se deslocam
+            with open(os.path.join(temp_dir, CONTENT_FILE), "w", encoding="utf-8", newline="") as f:
+                f.write(entry.content)
+            with open(os.path.join(temp_dir, CHUNK_EXTRAS_FILE), "w", encoding="utf-8", newline="") as f:
+                f.write(entry.extras)
+            faiss.write_index(entry.index, os.path.join(temp_dir, INDEX_FILE))
+            with open(os.path.join(temp_dir, META_FILE), "w", encoding="utf-8") as f:
+                json.dump({"embedding_key": entry.embedding_key}, f)
+
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(temp_dir, path)
+        except Exception:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+    def _load(self, content_id: str) -> Optional[DocumentIndex]:
+        """
+        Carrega os artefatos persistidos do documento, se existirem
+        """
+        path = self.document_path(content_id)
+        if not path or not os.path.exists(os.path.join(path, INDEX_FILE)):
+            return None
+        try:
+            with open(os.path.join(path, CONTENT_FILE), "r", encoding="utf-8", newline="") as f:
+                content = f.read()
+            if os.path.exists(os.path.join(path, CHUNK_SPANS_FILE)):
+                with open(os.path.join(path, CHUNK_EXTRAS_FILE), "r", encoding="utf-8", newline="") as f:
+                    extras = f.read()
+                texts = ChunkTexts(content + extras, np.load(os.path.join(path, CHUNK_SPANS_FILE)))
+            else:
+                # Documentos gravados no formato antigo (lista de chunks em JSON)
+                with open(os.path.join(path, CHUNKS_FILE), "r", encoding="utf-8") as f:
+                    texts = json.load(f)
+            index = faiss.read_index(os.path.join(path, INDEX_FILE))
+            # Documentos gravados antes da remoção de quase duplicatas não têm o mapa
+            chunk_map = None
+            if os.path.exists(os.path.join(path, CHUNK_MAP_FILE)):
+                chunk_map = np.load(os.path.join(path, CHUNK_MAP_FILE))
+            embedding_key = None
+            if os.path.exists(os.path.join(path, META_FILE)):
+                with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+                    embedding_key = json.load(f).get("embedding_key")
+        except Exception as e:
+            print(f"Erro ao carregar índice do documento {content_id}: {e}")
+            return None
+
+        self.loads += 1
+        print(f"Índice do documento {content_id} carregado do disco ({len(texts)} chunks)")
+        return DocumentIndex(content, texts, index, chunk_map, embedding_key)
+
+    def stats(self, per_entry: bool = False) -> Dict[str, Any]:
+        """
+        Uso de memória e contadores do LRU; com per_entry, também o uso de
+        memória de cada documento carregado
+        """
+        with self._lock:
+            stats: Dict[str, Any] = {
+                "documents_in_memory": len(self._entries),
+                "bytes_in_memory": self._bytes,
+                "max_bytes": self.max_bytes,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+            if per_entry:
+                stats["entries"] = {content_id: entry.memory_usage() for content_id, entry in self._entries.items()}
+            return stats
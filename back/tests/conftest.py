@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+from openai import AsyncAzureOpenAI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _fake_embedding(text: str, dimensions: int) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).normal(size=dimensions).tolist()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    Rotas de embeddings e chat do Azure OpenAI, respondendo depois de server.delay segundos
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.server.delay)
+        if self.path.split("?")[0].endswith("/embeddings"):
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            dimensions = body.get("dimensions", self.server.dimensions)
+            payload = {
+                "object": "list",
+                "model": body.get("model", "stub"),
+                "data": [{"object": "embedding", "index": i, "embedding": _fake_embedding(text, dimensions)}
+                         for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }
+        else:
+            payload = {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.server.answer(body["messages"])},
+                    "finish_reason": "stop",
+                }],
+            }
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Fila de conexões grande o bastante para dezenas de chamadas simultâneas
+    request_queue_size = 256
+
+
+@pytest.fixture
+def stub_server():
+    """
+    Servidor local que imita o Azure OpenAI; delay, dimensions e answer podem ser trocados pelo teste
+    """
+    server = _StubServer(("127.0.0.1", 0), _StubHandler)
+    server.delay = 0.0
+    server.dimensions = 16
+    server.answer = lambda messages: "resposta"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_client(stub_server):
+    """
+    Cliente assíncrono do SDK apontando para o stub_server
+    """
+    return AsyncAzureOpenAI(
+        api_key="test",
+        api_version="2024-02-01",
+        azure_endpoint=f"http://127.0.0.1:{stub_server.server_address[1]}",
+        max_retries=0,
+    )
@@ -0,0 +1,52 @@
+import asyncio
+import json
+import time
+
+from services.Metadata_extractor import MetadataExtractor
+from services.rag_service import RAGService
+
+DELAY = 0.5
+CONCURRENT_CALLS = 8
+
+
+def _rag_service(client) -> RAGService:
+    return RAGService(client, client, "gpt-test")
+
+
+def test_answer_question_calls_run_concurrently(stub_server, stub_client):
+    rag = _rag_service(stub_client)
+    content = "\n\n".join(f"Cláusula {n}: fornecimento de medicamentos, lote {n}." for n in range(20))
+
+    async def ask_all():
+        # The SDK client is bound to the loop it first runs on, so indexing happens in the same one
+        content_id = await rag.process_pdf(content, "frutal", content_id="doc")
+        stub_server.delay = DELAY
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            rag.answer_question(f"Qual o prazo do lote {n}?", content_id) for n in range(CONCURRENT_CALLS)
+        ))
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(ask_all())
+
+    assert all(result["response"] == "resposta" for result in results)
+    # Each answer waits for one embedding and one chat call; a blocked loop would take 2 * N delays
+    assert elapsed < 3 * DELAY, f"{CONCURRENT_CALLS} questions took {elapsed:.2f}s"
+
+
+def test_extract_metadata_calls_run_concurrently(stub_server, stub_client):
+    stub_server.answer = lambda messages: json.dumps({"municipio": "frutal", "number_itens": 3})
+    extractor = MetadataExtractor(client=stub_client)
+
+    async def extract_all():
+        stub_server.delay = DELAY
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            extractor.extract_metadata(f"Edital de pregão número {n}") for n in range(CONCURRENT_CALLS)
+        ))
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(extract_all())
+
+    assert all(result.municipio == "frutal" and result.municipio_source == "llm" for result in results)
+    assert elapsed < 2 * DELAY, f"{CONCURRENT_CALLS} extractions took {elapsed:.2f}s"
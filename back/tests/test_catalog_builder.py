@@ -0,0 +1,84 @@
+import glob
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from services.catalog_builder import CatalogBuilder
+from services.catalog_index import load_params
+from services.catalog_store import load_catalog
+from services.embedding_providers import LocalHashEmbeddingProvider
+
+NAMES = [
+    "DIPIRONA SODICA 500MG COMPRIMIDO",
+    "PARACETAMOL 750MG COMPRIMIDO",
+    "AMOXICILINA 500MG CAPSULA",
+    "IBUPROFENO 600MG COMPRIMIDO",
+    "OMEPRAZOL 20MG CAPSULA",
+    "SORO FISIOLOGICO 0,9% 500ML",
+]
+
+
+class _CountingProvider(LocalHashEmbeddingProvider):
+    """
+    Provedor local que registra os nomes enviados e pode falhar a partir de um lote
+    """
+    def __init__(self, fail_from_batch=None):
+        super().__init__(dimension=32)
+        self.batches = []
+        self.fail_from_batch = fail_from_batch
+
+    def embed(self, texts):
+        self.batches.append(list(texts))
+        if self.fail_from_batch is not None and len(self.batches) > self.fail_from_batch:
+            raise RuntimeError("provedor indisponível")
+        return super().embed(texts)
+
+
+def _builder(provider, tmp_path):
+    return CatalogBuilder(provider, str(tmp_path / "catalogo"), batch_size=3, max_concurrency=1, max_retries=1)
+
+
+def test_build_catalog_with_local_provider(tmp_path):
+    provider = _CountingProvider()
+    builder = _builder(provider, tmp_path)
+
+    # Nomes repetidos e linhas vazias são descartados
+    output_dir = builder.build(NAMES + ["  ", NAMES[0]])
+
+    catalog = load_catalog(output_dir)
+    assert list(catalog.names) == NAMES
+    assert catalog.meta["model"] == provider.model
+    expected = np.array(LocalHashEmbeddingProvider(dimension=32).embed(NAMES), dtype=np.float32)
+    np.testing.assert_allclose(catalog.as_float32(), expected, atol=1e-6)
+
+    index = faiss.read_index(builder.index_path)
+    assert (index.ntotal, index.d) == (len(NAMES), 32)
+    assert load_params(builder.index_path).index_type == "flat"
+    _, ids = index.search(expected, 1)
+    assert ids[:, 0].tolist() == list(range(len(NAMES)))
+    assert not os.path.exists(builder.checkpoint_dir)
+
+    # Uma nova execução reaproveita o catálogo existente sem chamar o provedor
+    provider.batches.clear()
+    builder.build(NAMES)
+    assert provider.batches == []
+
+
+def test_build_resumes_from_checkpoint(tmp_path):
+    failing = _CountingProvider(fail_from_batch=1)
+    with pytest.raises(RuntimeError):
+        _builder(failing, tmp_path).build(NAMES)
+    assert len(glob.glob(str(tmp_path / "catalogo.checkpoint" / "batch_*.npz"))) == 1
+
+    provider = _CountingProvider()
+    output_dir = _builder(provider, tmp_path).build(NAMES)
+
+    # Só o lote que falhou é enviado de novo
+    assert provider.batches == [NAMES[3:]]
+    catalog = load_catalog(output_dir)
+    assert list(catalog.names) == NAMES
+    expected = np.array(LocalHashEmbeddingProvider(dimension=32).embed(NAMES), dtype=np.float32)
+    np.testing.assert_allclose(catalog.as_float32(), expected, atol=1e-6)
+    assert not os.path.exists(tmp_path / "catalogo.checkpoint")
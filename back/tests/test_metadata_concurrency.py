@@ -0,0 +1,44 @@
+import asyncio
+import json
+import random
+import re
+import time
+
+from services.Metadata_extractor import MetadataExtractor
+
+MUNICIPIOS = ["itumbiara", "padre_bernardo", "frutal", "sao_roque", "cavalcante", "rondonia"]
+UPLOADS = 48
+
+
+def _document(n: int) -> str:
+    return f"Edital de pregão eletrônico, processo administrativo {n:04d}. Objeto: medicamentos."
+
+
+def _expected(n: int):
+    return MUNICIPIOS[n % len(MUNICIPIOS)], n + 1
+
+
+def _answer_from_document(messages) -> str:
+    # Random latency so that responses come back in a different order than the requests
+    time.sleep(random.uniform(0, 0.2))
+    n = int(re.search(r"processo administrativo (\d{4})", messages[-1]["content"]).group(1))
+    municipio, number_itens = _expected(n)
+    return json.dumps({"municipio": municipio, "number_itens": number_itens})
+
+
+def test_concurrent_uploads_keep_their_own_metadata(stub_server, stub_client):
+    stub_server.answer = _answer_from_document
+    extractor = MetadataExtractor(client=stub_client)
+
+    async def upload_all():
+        return await asyncio.gather(*(extractor.extract_metadata(_document(n)) for n in range(UPLOADS)))
+
+    results = asyncio.run(upload_all())
+
+    for n, result in enumerate(results):
+        municipio, number_itens = _expected(n)
+        assert (result.municipio, result.number_itens) == (municipio, number_itens), f"upload {n}"
+        assert result.as_metadata() == {"municipio": municipio, "number_itens": number_itens}
+    # Each call returned its own result object, nothing shared through the extractor
+    assert len({id(result) for result in results}) == UPLOADS
+    assert not hasattr(extractor, "metadata")
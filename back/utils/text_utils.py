@@ -0,0 +1,52 @@
+# utils/text_utils.py
+import math
+import unicodedata
+
+
+def canonicalize_text(text: str) -> str:
+    """
+    Canonicalize a text so near-identical strings share the same key:
+    folds case, removes accents and collapses whitespace.
+    
+    Args:
+        text: The text to canonicalize
+        
+    Returns:
+        The canonical form of the text
+    """
+    text = unicodedata.normalize('NFKD', text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.casefold().split())
+
+
+def normalize_whitespace(text: str) -> str:
+    """
+    Light normalization for texts whose wording matters (e.g. chunks sent
+    to the embedding model): composes Unicode characters and collapses
+    whitespace, keeping case and accents.
+    
+    Args:
+        text: The text to normalize
+        
+    Returns:
+        The normalized text
+    """
+    return " ".join(unicodedata.normalize('NFC', text or "").split())
+
+
+def estimate_tokens(text: str, chars_per_token: float = 3.5) -> int:
+    """
+    Approximate the number of model tokens in a text without a tokenizer.
+    Portuguese text averages a little under 4 characters per token, so the
+    default errs on the side of overestimating.
+    
+    Args:
+        text: The text to measure
+        chars_per_token: Average number of characters per token
+        
+    Returns:
+        The estimated token count (at least 1 for non-empty text)
+    """
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / chars_per_token))